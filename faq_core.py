@@ -0,0 +1,1168 @@
+# Text preprocessing, indexing and term-weighting shared by the CLI chatbot
+# (python_version/faq_chatbot.py) and the web app (flask_web_app/app.py)
+import re
+import math
+import threading
+import time
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import List, Dict, Tuple, Optional, Hashable, Iterable, Iterator
+
+# Simple stop words removed during preprocessing
+STOP_WORDS = frozenset({'the', 'and', 'are', 'you', 'for', 'can', 'how', 'what', 'where', 'when', 'why', 'with', 'this', 'that'})
+
+class TextPreprocessor:
+    """
+    Reusable text preprocessing pipeline:
+    - Convert to lowercase
+    - Tokenize into runs of word characters (punctuation splits words)
+    - Remove stop words and short words
+    
+    Words are runs of word characters, exactly the tokens left after
+    replacing punctuation with spaces. A single compiled regex only matches
+    runs of at least min_length characters, so tokenizing and the length
+    filter happen in one pass. With memo_size > 0, cached() memoizes results
+    for strings that repeat a lot, such as the same keyword on many FAQs.
+    """
+    
+    def __init__(self, min_length: int = 3, stop_words: frozenset = STOP_WORDS, memo_size: int = 0):
+        self.min_length = min_length
+        self.stop_words = stop_words
+        self.pattern = re.compile(r'\w{%d,}' % max(min_length, 1))
+        self._memo = lru_cache(maxsize=memo_size)(lambda text: tuple(self._tokenize(text))) if memo_size > 0 else None
+    
+    def _tokenize(self, text: str) -> List[str]:
+        stop_words = self.stop_words
+        return [word for word in self.pattern.findall(text.lower()) if word not in stop_words]
+    
+    def __call__(self, text: str) -> List[str]:
+        """Return the processed tokens of text"""
+        return self._tokenize(text)
+    
+    def cached(self, text: str) -> List[str]:
+        """Like calling the preprocessor, but memoized when memo_size > 0"""
+        if self._memo is None:
+            return self._tokenize(text)
+        return list(self._memo(text))
+
+class FAQRecord:
+    """
+    Precomputed scoring data for one FAQ entry. Token sets are stored as
+    sorted tuples of interned token ids (frozen and much smaller than
+    frozensets) and their magnitudes are computed once, so the scoring loop
+    never rebuilds sets or square roots for the FAQ side.
+    """
+    __slots__ = ('keyword_ids', 'question_ids', 'keyword_norm', 'question_norm', 'keywords')
+    
+    def __init__(self, keyword_ids: Tuple[int, ...], question_ids: Tuple[int, ...], keywords: Tuple[str, ...]):
+        self.keyword_ids = keyword_ids
+        self.question_ids = question_ids
+        self.keyword_norm = math.sqrt(len(keyword_ids))
+        self.question_norm = math.sqrt(len(question_ids))
+        self.keywords = keywords
+
+class ResponseCache:
+    """
+    Thread-safe bounded LRU cache with a per-entry TTL, used in front of
+    get_response. Keys are preprocessed token tuples, so questions that only
+    differ in case, punctuation or stop words share an entry.
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key: Hashable) -> Optional[Dict]:
+        """Return the cached value for key, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+    
+    def put(self, key: Hashable, value: Dict):
+        """Store value under key, evicting the least recently used entries when full"""
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        """Return size, limits and hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over the raw FAQ keywords. A single pass over a
+    word reports every keyword contained in it, instead of testing each
+    keyword with the `in` operator.
+    """
+    
+    def __init__(self):
+        self.transitions: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.outputs: List[List[int]] = [[]]
+    
+    def add(self, keyword: str, keyword_id: int):
+        """Add a keyword; call build() before searching"""
+        state = 0
+        for char in keyword:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][char] = next_state
+                self.transitions.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append(keyword_id)
+    
+    def build(self):
+        """Compute failure links breadth first and merge outputs along them"""
+        queue = list(self.transitions[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        for state in queue:
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.transitions[fallback].get(char, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+    
+    def search(self, text: str) -> List[int]:
+        """Return the ids of all keywords occurring in text (may repeat)"""
+        found = list(self.outputs[0])
+        state = 0
+        for char in text:
+            while state and char not in self.transitions[state]:
+                state = self.fail[state]
+            state = self.transitions[state].get(char, 0)
+            found.extend(self.outputs[state])
+        return found
+
+class CorpusStatistics:
+    """
+    Corpus-wide statistics for the term-weighted scorers: FAQ count, total
+    document length and document frequency per token id. An FAQ document is
+    its keyword token set plus its question token set, so a token in both
+    counts twice towards the FAQ's term frequency and length. add() and
+    remove() update the statistics for one record in O(record size).
+    """
+    
+    def __init__(self, records: Iterable[FAQRecord] = ()):
+        self.document_count = 0
+        self.total_length = 0
+        self.document_frequency: Counter = Counter()
+        for record in records:
+            self.add(record)
+    
+    @classmethod
+    def from_counts(cls, document_count: int, total_length: int, document_frequency) -> 'CorpusStatistics':
+        """Statistics read back from a compiled index; document_frequency only needs get(token_id, 0)"""
+        statistics = cls()
+        statistics.document_count = document_count
+        statistics.total_length = total_length
+        statistics.document_frequency = document_frequency
+        return statistics
+    
+    @property
+    def average_length(self) -> float:
+        return self.total_length / self.document_count if self.document_count else 1.0
+    
+    def add(self, record: FAQRecord):
+        self.document_count += 1
+        self.total_length += len(record.keyword_ids) + len(record.question_ids)
+        self.document_frequency.update(set(record.keyword_ids).union(record.question_ids))
+    
+    def remove(self, record: FAQRecord):
+        self.document_count -= 1
+        self.total_length -= len(record.keyword_ids) + len(record.question_ids)
+        for token_id in set(record.keyword_ids).union(record.question_ids):
+            self.document_frequency[token_id] -= 1
+            if self.document_frequency[token_id] <= 0:
+                del self.document_frequency[token_id]
+
+def _term_frequencies(chatbot: 'FAQIndex', token_id: int) -> Counter:
+    """FAQ id -> term frequency (1 or 2) of a token, read from its keyword and question postings"""
+    frequencies = Counter(chatbot.keyword_index.get(token_id, ()))
+    frequencies.update(chatbot.question_index.get(token_id, ()))
+    return frequencies
+
+class BM25Scorer:
+    """
+    Okapi BM25 over the keyword and question postings of the question's
+    words, so rare tokens outweigh common ones such as "account". Only
+    the FAQs in those postings are touched. Scores are divided by the sum of
+    idf * (k1 + 1) over the question's distinct words (the limit for an FAQ
+    saturating every word; unknown words count with document frequency 0),
+    which keeps them in [0, 1) like the weighted score.
+    """
+    name = 'bm25'
+    
+    def __init__(self, statistics: CorpusStatistics, k1: float = 1.2, b: float = 0.75):
+        self.statistics = statistics
+        self.k1 = k1
+        self.b = b
+    
+    def idf(self, token_id: Optional[int]) -> float:
+        count = self.statistics.document_count
+        frequency = self.statistics.document_frequency.get(token_id, 0)
+        return math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+    
+    def score(self, chatbot: 'FAQIndex', user_words: List[str]) -> Dict[int, float]:
+        """Return FAQ id -> normalized BM25 score for the FAQs sharing a token with the question"""
+        totals = Counter()
+        bound = 0.0
+        average_length = self.statistics.average_length
+        for word in set(user_words):
+            token_id = chatbot.vocabulary.get(word)
+            idf = self.idf(token_id)
+            bound += idf * (self.k1 + 1)
+            if token_id is None:
+                continue
+            for faq_id, frequency in _term_frequencies(chatbot, token_id).items():
+                record = chatbot.records[faq_id]
+                length = len(record.keyword_ids) + len(record.question_ids)
+                totals[faq_id] += idf * frequency * (self.k1 + 1) / (
+                    frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+        return {faq_id: total / bound for faq_id, total in totals.items()}
+
+class TFIDFScorer:
+    """
+    Cosine similarity between TF-IDF vectors of the question (binary term
+    frequency) and of each FAQ sharing a token with it. FAQ vector norms
+    are computed from the current statistics when a candidate is scored, so
+    they never go stale as FAQs are added or removed.
+    """
+    name = 'tfidf'
+    
+    def __init__(self, statistics: CorpusStatistics):
+        self.statistics = statistics
+    
+    def idf(self, token_id: Optional[int]) -> float:
+        count = self.statistics.document_count
+        frequency = self.statistics.document_frequency.get(token_id, 0)
+        return math.log((1 + count) / (1 + frequency)) + 1
+    
+    def _document_norm(self, record: FAQRecord) -> float:
+        frequencies = Counter(record.keyword_ids)
+        frequencies.update(record.question_ids)
+        return math.sqrt(sum((frequency * self.idf(token_id)) ** 2 for token_id, frequency in frequencies.items()))
+    
+    def score(self, chatbot: 'FAQIndex', user_words: List[str]) -> Dict[int, float]:
+        """Return FAQ id -> TF-IDF cosine for the FAQs sharing a token with the question"""
+        dots = Counter()
+        query_norm = 0.0
+        for word in set(user_words):
+            token_id = chatbot.vocabulary.get(word)
+            idf = self.idf(token_id)
+            query_norm += idf * idf
+            if token_id is None:
+                continue
+            for faq_id, frequency in _term_frequencies(chatbot, token_id).items():
+                dots[faq_id] += idf * frequency * idf
+        query_norm = math.sqrt(query_norm)
+        return {faq_id: dot / (query_norm * self._document_norm(chatbot.records[faq_id]))
+                for faq_id, dot in dots.items()}
+
+# Term-weighted scorers selectable with FAQChatbot(scorer=...); 'weighted' is the default blend
+SCORERS = {'bm25': BM25Scorer, 'tfidf': TFIDFScorer}
+
+# With a term-weighted scorer, the final score blends its score with the word overlap signal
+TERM_WEIGHT = 0.7
+OVERLAP_WEIGHT = 0.3
+
+def load_faq_file(path: str) -> List[Dict]:
+    """
+    Load FAQ entries from a file:
+    - .json: an array of entries, or an object with a "faqs" array
+    - .jsonl: one entry per line
+    - .csv: question, answer and keywords columns, keywords separated by ';'
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8', newline='') as f:
+        if extension == '.json':
+            data = json.load(f)
+            return data['faqs'] if isinstance(data, dict) else data
+        if extension == '.jsonl':
+            return [json.loads(line) for line in f if line.strip()]
+        if extension == '.csv':
+            return [{
+                'question': row['question'],
+                'answer': row['answer'],
+                'keywords': [keyword.strip() for keyword in (row.get('keywords') or '').split(';') if keyword.strip()]
+            } for row in csv.DictReader(f)]
+    raise ValueError(f"Unsupported FAQ file format: {path}")
+
+# Index files start with this magic, then the uint64 offset of a JSON header
+# describing the typed array sections that follow
+INDEX_MAGIC = b'FAQIDX01'
+
+def _utf8(text: str) -> bytes:
+    return text.encode('utf-8')
+
+def _string_section(strings: Iterable[str]) -> Tuple[array, bytes]:
+    """Encode strings as (offsets, blob) for a MappedStrings table"""
+    offsets, chunks, position = array('Q', [0]), [], 0
+    for text in strings:
+        chunk = _utf8(text)
+        chunks.append(chunk)
+        position += len(chunk)
+        offsets.append(position)
+    return offsets, b''.join(chunks)
+
+def _hash_section(strings: List[str]) -> array:
+    """
+    Open-addressing hash table (crc32, linear probing, at most half full)
+    mapping strings to their position + 1, 0 marking an empty slot
+    """
+    size = 1
+    while size < 2 * len(strings):
+        size *= 2
+    slots = array('I', bytes(4 * size))
+    for position, text in enumerate(strings):
+        slot = zlib.crc32(_utf8(text)) & (size - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (size - 1)
+        slots[slot] = position + 1
+    return slots
+
+def _lists_section(lists: Iterable[Iterable[int]]) -> Tuple[array, array]:
+    """Encode integer lists as (offsets, values) for a MappedLists table"""
+    offsets, values = array('Q', [0]), array('I')
+    for items in lists:
+        values.extend(items)
+        offsets.append(len(values))
+    return offsets, values
+
+class MappedStrings:
+    """String table inside a mapped index file; tables with hash slots support get()"""
+    
+    def __init__(self, offsets: memoryview, blob: memoryview, slots: Optional[memoryview] = None):
+        self.offsets = offsets
+        self.blob = blob
+        self.slots = slots
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def _bytes(self, position: int) -> bytes:
+        return self.blob[self.offsets[position]:self.offsets[position + 1]].tobytes()
+    
+    def __getitem__(self, position: int) -> str:
+        return self._bytes(position).decode('utf-8')
+    
+    def get(self, text: str, default: Optional[int] = None) -> Optional[int]:
+        """Look text up in the hash slots and return its position (its id)"""
+        target = _utf8(text)
+        slots = self.slots
+        mask = len(slots) - 1
+        slot = zlib.crc32(target) & mask
+        while slots[slot]:
+            if self._bytes(slots[slot] - 1) == target:
+                return slots[slot] - 1
+            slot = (slot + 1) & mask
+        return default
+
+class MappedLists:
+    """Integer lists (CSR offsets + values) inside a mapped index file, e.g. postings"""
+    
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, position: int) -> memoryview:
+        return self.data[self.offsets[position]:self.offsets[position + 1]]
+    
+    def get(self, position: int, default=()):
+        return self[position] if 0 <= position < len(self) else default
+    
+    def items(self):
+        return ((position, self[position]) for position in range(len(self))
+                if self.offsets[position] != self.offsets[position + 1])
+    
+    def values(self):
+        return (items for _, items in self.items())
+
+class MappedCounts:
+    """One integer per position (e.g. per token id) inside a mapped index file"""
+    
+    def __init__(self, counts: memoryview):
+        self.counts = counts
+    
+    def get(self, position: Optional[int], default: int = 0) -> int:
+        return self.counts[position] if position is not None and 0 <= position < len(self.counts) else default
+
+class MappedStringLists:
+    """Maps the strings of a sorted MappedStrings table to MappedLists entries"""
+    
+    def __init__(self, strings: MappedStrings, lists: MappedLists):
+        self.strings = strings
+        self.lists = lists
+    
+    def get(self, text: str, default=()):
+        position = self.strings.get(text)
+        return self.lists[position] if position is not None else default
+    
+    def items(self) -> Iterator[Tuple[str, Sequence[int]]]:
+        for position in range(len(self.strings)):
+            yield self.strings[position], self.lists[position]
+
+class MappedKeywordSearch:
+    """
+    Stand-in for KeywordAutomaton over a mapped index: finds the raw
+    keywords contained in a word by looking up each of its substrings.
+    """
+    
+    def __init__(self, raw_keywords: MappedStrings, max_length: int):
+        self.raw_keywords = raw_keywords
+        self.max_length = max_length
+    
+    def search(self, text: str) -> List[int]:
+        found = []
+        for start in range(len(text) + 1):
+            for end in range(start, min(len(text), start + self.max_length) + 1):
+                keyword_id = self.raw_keywords.get(text[start:end])
+                if keyword_id is not None:
+                    found.append(keyword_id)
+        return found
+
+class MappedRecords(Sequence):
+    """FAQRecords decoded on access from the token lists of a mapped index"""
+    
+    def __init__(self, index: 'MappedIndex'):
+        self.index = index
+    
+    def __len__(self) -> int:
+        return len(self.index.keyword_tokens)
+    
+    def __getitem__(self, faq_id: int) -> FAQRecord:
+        if not 0 <= faq_id < len(self):
+            raise IndexError(faq_id)
+        index = self.index
+        return FAQRecord(
+            tuple(sorted(set(index.keyword_tokens[faq_id]))),
+            tuple(sorted(set(index.question_tokens[faq_id]))),
+            tuple(index.raw_keywords[keyword_id] for keyword_id in index.faq_keywords[faq_id])
+        )
+
+class MappedFAQs(Sequence):
+    """FAQ entry dicts (including processed fields) decoded on access from a mapped index"""
+    
+    def __init__(self, index: 'MappedIndex'):
+        self.index = index
+    
+    def __len__(self) -> int:
+        return len(self.index.faq_entries)
+    
+    def __getitem__(self, faq_id: int) -> Dict:
+        if not 0 <= faq_id < len(self):
+            raise IndexError(faq_id)
+        index = self.index
+        faq = json.loads(index.faq_entries[faq_id])
+        faq['processed_question'] = [index.vocabulary[token_id] for token_id in index.question_tokens[faq_id]]
+        faq['processed_keywords'] = [index.vocabulary[token_id] for token_id in index.keyword_tokens[faq_id]]
+        return faq
+
+class MappedIndex:
+    """
+    Read-only FAQ index memory-mapped from a file written by
+    FAQIndex.write_index. Nothing is tokenized or copied at load time:
+    lookups probe the mapped string hash tables and slice the mapped
+    postings, so startup cost does not grow with the corpus and worker
+    processes share one copy of the index pages through the page cache.
+    """
+    
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if view[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"{path} is not an FAQ index file")
+        
+        header_offset = struct.unpack_from('<Q', view, len(INDEX_MAGIC))[0]
+        header = json.loads(view[header_offset:].tobytes())
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was compiled on a {header['byteorder']}-endian machine")
+        
+        sections = {name: view[offset:offset + length].cast(typecode)
+                    for name, (offset, length, typecode) in header['sections'].items()}
+        
+        def strings(name):
+            return MappedStrings(sections[name + '_offsets'], sections[name], sections.get(name + '_slots'))
+        
+        def lists(name):
+            return MappedLists(sections[name + '_offsets'], sections[name])
+        
+        self.faq_entries = strings('faqs')
+        self.vocabulary = strings('vocabulary')
+        self.raw_keywords = strings('raw_keywords')
+        self.question_tokens = lists('question_tokens')
+        self.keyword_tokens = lists('keyword_tokens')
+        self.faq_keywords = lists('faq_keywords')
+        self.keyword_index = lists('keyword_postings')
+        self.question_index = lists('question_postings')
+        self.keyword_owners = lists('keyword_owners')
+        self.keyword_fragments = MappedStringLists(strings('fragments'), lists('fragment_keywords'))
+        self.keyword_search = MappedKeywordSearch(self.raw_keywords, header['max_keyword_length'])
+        # FuzzyIndex keys over the vocabulary positions and their (max_distance, prefix_length);
+        # index files compiled before they were stored have neither
+        self.fuzzy_keys = sections.get('fuzzy_keys')
+        self.fuzzy_settings = header.get('fuzzy_settings')
+        # CorpusStatistics of the live FAQs, likewise missing from older files
+        self.statistics = (CorpusStatistics.from_counts(header['document_count'], header['total_length'],
+                                                        MappedCounts(sections['document_frequency']))
+                           if 'document_frequency' in sections else None)
+        self.records = MappedRecords(self)
+        self.faqs = MappedFAQs(self)
+    
+    @staticmethod
+    def write(path: str, sections: Dict[str, object], **settings):
+        """Write typed array/bytes sections and their JSON header (with settings such as max_keyword_length) to path"""
+        header = {'byteorder': sys.byteorder, **settings, 'sections': {}}
+        with open(path, 'wb') as f:
+            f.write(INDEX_MAGIC + struct.pack('<Q', 0))
+            for name, data in sections.items():
+                # Keep every section 8-byte aligned for the typed memoryview casts
+                f.write(b'\0' * (-f.tell() % 8))
+                typecode = data.typecode if isinstance(data, array) else 'B'
+                payload = data.tobytes() if isinstance(data, array) else data
+                header['sections'][name] = [f.tell(), len(payload), typecode]
+                f.write(payload)
+            header_offset = f.tell()
+            f.write(json.dumps(header).encode('utf-8'))
+            f.seek(len(INDEX_MAGIC))
+            f.write(struct.pack('<Q', header_offset))
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (edits plus adjacent swaps), or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # Shared prefixes and suffixes never change the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return min(max(len(a), len(b)), limit + 1)
+    
+    before_previous, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        char = a[i - 1]
+        current = [i] * (len(b) + 1)
+        for j in range(1, len(b) + 1):
+            cost = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == b[j - 1] and before_previous[j - 2] + 1 < cost:
+                cost = before_previous[j - 2] + 1
+            current[j] = cost
+        if min(current) > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class FuzzyIndex:
+    """
+    SymSpell-style deletion index over the vocabulary, used to correct
+    misspelled query tokens. Each token is indexed under every string
+    obtained by deleting up to max_distance characters from its first
+    prefix_length characters. A query word is looked up through its own
+    deletes, so only tokens sharing a delete are compared by edit distance,
+    never the whole vocabulary. Entries are stored as sorted 64-bit
+    (hash << 32 | token id) keys in one array to stay compact on a large
+    vocabulary; a hash collision only adds a candidate that fails the
+    distance check. The hash is crc32, so the keys can be compiled into an
+    index file and passed back in as keys (e.g. a mapped section) instead
+    of being rebuilt. Tokens added after construction are kept in a small
+    delete -> token ids dict so that adding one never re-sorts the array.
+    """
+    
+    def __init__(self, tokens, max_distance: int = 2, prefix_length: int = 7, keys: Optional[Sequence[int]] = None):
+        self.tokens = tokens
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.added: Dict[str, List[int]] = {}
+        if keys is None:
+            keys = []
+            for token_id in range(len(tokens)):
+                for variant in self._deletes(tokens[token_id][:prefix_length], max_distance):
+                    keys.append(self._hash(variant) << 32 | token_id)
+            keys.sort()
+            keys = array('Q', keys)
+        self.keys = keys
+    
+    @staticmethod
+    def _hash(variant: str) -> int:
+        return zlib.crc32(variant.encode())
+    
+    @staticmethod
+    def _deletes(text: str, max_distance: int) -> set:
+        """text and every string obtained by deleting up to max_distance of its characters"""
+        variants, frontier = {text}, {text}
+        for _ in range(max_distance):
+            frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))} - variants
+            variants |= frontier
+        return variants
+    
+    def deletion_map(self) -> Dict[str, List[int]]:
+        """Every indexed delete -> token ids, unhashed, for clients that look words up themselves"""
+        deletes: Dict[str, List[int]] = {}
+        for token_id in range(len(self.tokens)):
+            # Sorted, so the map's order does not depend on string hashing
+            for variant in sorted(self._deletes(self.tokens[token_id][:self.prefix_length], self.max_distance)):
+                deletes.setdefault(variant, []).append(token_id)
+        return deletes
+    
+    def add(self, token_id: int, token: str):
+        """Index a token appended to the vocabulary after construction"""
+        if isinstance(self.tokens, list):
+            self.tokens.append(token)
+        for variant in self._deletes(token[:self.prefix_length], self.max_distance):
+            self.added.setdefault(variant, []).append(token_id)
+    
+    def _bucket(self, variant: str) -> Iterator[int]:
+        """Token ids indexed under a delete (plus hash collisions)"""
+        bucket = self._hash(variant)
+        position = bisect_left(self.keys, bucket << 32)
+        while position < len(self.keys) and self.keys[position] >> 32 == bucket:
+            yield self.keys[position] & 0xFFFFFFFF
+            position += 1
+        yield from self.added.get(variant, ())
+    
+    def lookup(self, word: str, max_distance: int) -> List[int]:
+        """Ids of the tokens at the smallest edit distance from word, if it is at most max_distance"""
+        max_distance = min(max_distance, self.max_distance)
+        best_distance, best, seen = max_distance, [], set()
+        for variant in self._deletes(word[:self.prefix_length], max_distance):
+            for token_id in self._bucket(variant):
+                if token_id in seen:
+                    continue
+                seen.add(token_id)
+                distance = _edit_distance(word, self.tokens[token_id], best_distance)
+                if distance < best_distance:
+                    best_distance, best = distance, [token_id]
+                elif distance == best_distance:
+                    best.append(token_id)
+        return best
+
+
+class FAQIndex:
+    """
+    FAQ entries and the indexes questions are matched against: the interned
+    vocabulary, one FAQRecord per entry, token postings, the raw keyword
+    substring index and the fuzzy index used to correct misspellings. It is
+    built from a list of entries or memory-mapped from a compiled index file,
+    and owns the response cache and the incremental add/update/remove API.
+    Each chatbot subclasses it with its own scoring, and extends
+    _index_built, _entry_changed and _commit to keep derived state current.
+    """
+    
+    def __init__(self, faq_database: List[Dict], cache_size: int = 1024, cache_ttl: Optional[float] = 300.0,
+                 preprocessor: Optional[TextPreprocessor] = None, index_path: Optional[str] = None,
+                 fuzzy: bool = True, scorer: str = 'weighted'):
+        self.faq_database = faq_database
+        
+        # 'weighted' leaves scoring to the chatbot's similarity blend; 'bm25' and 'tfidf'
+        # replace its cosine and Jaccard signals with a term-weighted score from SCORERS
+        if scorer != 'weighted' and scorer not in SCORERS:
+            raise ValueError(f"Unknown scorer: {scorer}")
+        self.scorer_name = scorer
+        
+        self.preprocessor = preprocessor if preprocessor is not None else TextPreprocessor(memo_size=4096)
+        
+        # Responses keyed on preprocessed tokens, cleared whenever the index changes
+        self.response_cache = ResponseCache(cache_size, cache_ttl)
+        
+        # Correct misspelled query tokens through a FuzzyIndex, built with the index
+        self.fuzzy = fuzzy
+        self._fuzzy_index: Optional[FuzzyIndex] = None
+        
+        # Held while the index is read for scoring and while add/update/remove_faq
+        # change it, so a question never sees a half-applied edit
+        self._index_lock = threading.RLock()
+        
+        # Memory-map a compiled index, or preprocess the FAQ database
+        if index_path is not None:
+            self._load_index(index_path)
+        else:
+            self._preprocess_database()
+    
+    def _preprocess_database(self):
+        """
+        Preprocess all FAQ entries for better matching, build one FAQRecord
+        per entry and the inverted indexes used for candidate retrieval:
+        - vocabulary: processed token -> interned token id
+        - keyword_index / question_index: token id -> set of FAQ ids
+        - raw_keywords: distinct raw keyword -> keyword id
+        - keyword_owners: keyword id -> set of FAQ ids
+        - keyword_fragments: substring of a raw keyword -> keyword ids
+        - keyword_automaton: finds the raw keywords contained in a word
+          (keywords added later wait in _pending_keywords until a rebuild)
+        """
+        self.vocabulary: Dict[str, int] = {}
+        self.records: List[FAQRecord] = []
+        self.keyword_index: Dict[int, set] = {}
+        self.question_index: Dict[int, set] = {}
+        self.raw_keywords: Dict[str, int] = {}
+        self.keyword_owners: List[set] = []
+        self.keyword_fragments: Dict[str, List[int]] = {}
+        self._pending_keywords: List[Tuple[str, int]] = []
+        
+        for faq_id, faq in enumerate(self.faq_database):
+            record = self._build_record(faq)
+            self.records.append(record)
+            self._link(faq_id, record)
+        
+        self._rebuild_automaton()
+        self._index_built()
+    
+    def _load_index(self, index_path: str):
+        """Serve from a memory-mapped index written by write_index instead of preprocessing"""
+        index = MappedIndex(index_path)
+        self.faq_database = index.faqs
+        self.vocabulary = index.vocabulary
+        self.records = index.records
+        self.keyword_index = index.keyword_index
+        self.question_index = index.question_index
+        self.raw_keywords = index.raw_keywords
+        self.keyword_owners = index.keyword_owners
+        self.keyword_fragments = index.keyword_fragments
+        self.keyword_automaton = index.keyword_search
+        self._pending_keywords = []
+        self._index_built()
+    
+    def _index_built(self):
+        """
+        Rebuild the state derived from a freshly built or loaded index:
+        cached responses, scorer and fuzzy index. The fuzzy index is built
+        (or, for a compiled index, mapped) here rather than on the first
+        misspelling, so a large vocabulary is indexed once at load time
+        (before share_index forks workers) and never inside a request.
+        """
+        self._fuzzy_index = self._build_fuzzy_index() if self.fuzzy else None
+        self._removed = 0
+        self.response_cache.clear()
+        self.scorer = SCORERS[self.scorer_name](self._corpus_statistics()) if self.scorer_name in SCORERS else None
+    
+    @property
+    def faq_count(self) -> int:
+        """Number of live FAQ entries (ids of removed entries stay reserved until the index is rebuilt)"""
+        return len(self.faq_database) - self._removed
+    
+    def write_index(self, path: str):
+        """
+        Compile the preprocessed database (FAQ entries, processed tokens,
+        vocabulary, postings and keyword substring index) into a binary
+        index file for index_path=... String tables are sorted by UTF-8
+        bytes (token and keyword ids are renumbered by rank) and carry hash
+        slots for constant-time lookups. The sorted FuzzyIndex keys over the
+        renumbered vocabulary and the CorpusStatistics of the term-weighted
+        scorers are stored too, so loading maps them instead of rebuilding
+        them. Entries removed with remove_faq are dropped, so the compiled
+        index numbers the live FAQs from 0.
+        """
+        faqs = [faq for faq in self.faq_database if faq is not None]
+        faq_ids = {faq_id: position for position, faq_id in
+                   enumerate(faq_id for faq_id, faq in enumerate(self.faq_database) if faq is not None)}
+        
+        def postings(faq_ids_list):
+            return sorted(faq_ids[faq_id] for faq_id in faq_ids_list)
+        
+        tokens = sorted(self.vocabulary, key=_utf8)
+        token_ids = {self.vocabulary[token]: rank for rank, token in enumerate(tokens)}
+        keywords = sorted(self.raw_keywords, key=_utf8)
+        keyword_ids = {self.raw_keywords[keyword]: rank for rank, keyword in enumerate(keywords)}
+        fragments = sorted(self.keyword_fragments, key=_utf8)
+        
+        sections = {}
+        
+        def add_strings(name, strings, hashed=True):
+            strings = list(strings)
+            sections[name + '_offsets'], sections[name] = _string_section(strings)
+            if hashed:
+                sections[name + '_slots'] = _hash_section(strings)
+        
+        def add_lists(name, lists):
+            sections[name + '_offsets'], sections[name] = _lists_section(lists)
+        
+        add_strings('faqs', (json.dumps({key: value for key, value in faq.items() if not key.startswith('processed_')})
+                             for faq in faqs), hashed=False)
+        add_strings('vocabulary', tokens)
+        add_strings('raw_keywords', keywords)
+        add_strings('fragments', fragments)
+        add_lists('question_tokens', ([token_ids[self.vocabulary[token]] for token in faq['processed_question']]
+                                      for faq in faqs))
+        add_lists('keyword_tokens', ([token_ids[self.vocabulary[token]] for token in faq['processed_keywords']]
+                                     for faq in faqs))
+        add_lists('faq_keywords', ([keyword_ids[self.raw_keywords[keyword]] for keyword in faq['keywords']]
+                                   for faq in faqs))
+        add_lists('keyword_postings', (postings(self.keyword_index.get(self.vocabulary[token], ())) for token in tokens))
+        add_lists('question_postings', (postings(self.question_index.get(self.vocabulary[token], ())) for token in tokens))
+        add_lists('keyword_owners', (postings(self.keyword_owners[self.raw_keywords[keyword]]) for keyword in keywords))
+        add_lists('fragment_keywords', (sorted(keyword_ids[keyword_id] for keyword_id in self.keyword_fragments[fragment])
+                                        for fragment in fragments))
+        
+        fuzzy_index = FuzzyIndex(tokens)
+        sections['fuzzy_keys'] = fuzzy_index.keys
+        statistics = (self.scorer.statistics if self.scorer is not None
+                      else CorpusStatistics(self.records[faq_id] for faq_id in faq_ids))
+        sections['document_frequency'] = array('I', (statistics.document_frequency.get(self.vocabulary[token], 0)
+                                                     for token in tokens))
+        
+        MappedIndex.write(path, sections, max_keyword_length=max((len(keyword) for keyword in keywords), default=0),
+                          fuzzy_settings=[fuzzy_index.max_distance, fuzzy_index.prefix_length],
+                          document_count=statistics.document_count, total_length=statistics.total_length)
+    
+    def _build_record(self, faq: Dict) -> FAQRecord:
+        """Preprocess an FAQ entry (storing its processed tokens on it) and build its FAQRecord"""
+        faq['processed_question'] = self._preprocess_text(faq['question'])
+        faq['processed_keywords'] = [self._preprocess_keyword(kw) for kw in faq['keywords']]
+        
+        return FAQRecord(
+            tuple(sorted({self._intern(token) for token in faq['processed_keywords']})),
+            tuple(sorted({self._intern(token) for token in faq['processed_question']})),
+            tuple(faq['keywords'])
+        )
+    
+    def _link(self, faq_id: int, record: FAQRecord):
+        """Add an FAQ to the postings of its tokens and the owners of its raw keywords"""
+        for token_id in record.keyword_ids:
+            self.keyword_index.setdefault(token_id, set()).add(faq_id)
+        for token_id in record.question_ids:
+            self.question_index.setdefault(token_id, set()).add(faq_id)
+        
+        # In first-seen order, so keyword ids (and compiled and exported indexes) do not depend on string hashing
+        for keyword in dict.fromkeys(record.keywords):
+            self.keyword_owners[self._register_keyword(keyword)].add(faq_id)
+    
+    def _unlink(self, faq_id: int, record: FAQRecord):
+        """
+        Remove an FAQ from every posting and keyword owner set _link added it
+        to. Postings are sets, so this costs O(record size) however many
+        FAQs share its tokens.
+        """
+        for token_id in record.keyword_ids:
+            self.keyword_index[token_id].remove(faq_id)
+        for token_id in record.question_ids:
+            self.question_index[token_id].remove(faq_id)
+        
+        # Keywords and tokens left without owners stay registered; they just match nothing
+        for keyword in set(record.keywords):
+            self.keyword_owners[self.raw_keywords[keyword]].remove(faq_id)
+    
+    def _rebuild_automaton(self):
+        """Build a new KeywordAutomaton over every raw keyword, emptying the pending list"""
+        automaton = KeywordAutomaton()
+        for keyword, keyword_id in self.raw_keywords.items():
+            automaton.add(keyword, keyword_id)
+        automaton.build()
+        self.keyword_automaton = automaton
+        self._pending_keywords = []
+    
+    def _require_mutable(self):
+        if isinstance(self.faq_database, MappedFAQs):
+            raise ValueError("FAQs cannot be changed in a memory-mapped index; rebuild it from the FAQ file")
+    
+    @staticmethod
+    def _validate_faq(faq: Dict) -> Dict:
+        """Return a copy of an FAQ entry after checking its question, answer and keywords"""
+        if not isinstance(faq, dict):
+            raise ValueError("An FAQ entry must be an object")
+        for field in ('question', 'answer'):
+            if not isinstance(faq.get(field), str) or not faq[field].strip():
+                raise ValueError(f"An FAQ entry needs a non-empty '{field}' string")
+        keywords = faq.get('keywords', [])
+        if not isinstance(keywords, list) or not all(isinstance(keyword, str) for keyword in keywords):
+            raise ValueError("FAQ 'keywords' must be a list of strings")
+        return dict({key: value for key, value in faq.items() if not key.startswith('processed_')}, keywords=keywords)
+    
+    def add_faq(self, faq: Dict) -> int:
+        """Add one FAQ entry and return its id"""
+        return self.add_faqs([faq])[0]
+    
+    def add_faqs(self, faqs: List[Dict]) -> List[int]:
+        """
+        Add FAQ entries in one index commit and return their ids. Each
+        entry only touches its own tokens, postings and keywords; the
+        per-commit work (cache flush, keyword automaton and derived state)
+        runs once for the whole batch, so bulk imports should use one call.
+        """
+        self._require_mutable()
+        faqs = [self._validate_faq(faq) for faq in faqs]
+        with self._index_lock:
+            vocabulary_size = len(self.vocabulary)
+            faq_ids = []
+            for faq in faqs:
+                faq_id = len(self.faq_database)
+                record = self._build_record(faq)
+                self.faq_database.append(faq)
+                self.records.append(record)
+                self._link(faq_id, record)
+                if self.scorer is not None:
+                    self.scorer.statistics.add(record)
+                self._entry_changed(faq_id)
+                faq_ids.append(faq_id)
+            self._commit(faqs, vocabulary_size)
+        return faq_ids
+    
+    def update_faq(self, faq_id: int, faq: Dict):
+        """Replace the FAQ entry with the given id, reindexing only that entry"""
+        self._require_mutable()
+        faq = self._validate_faq(faq)
+        with self._index_lock:
+            self._require_entry(faq_id)
+            vocabulary_size = len(self.vocabulary)
+            old_record = self.records[faq_id]
+            self._unlink(faq_id, old_record)
+            record = self._build_record(faq)
+            self.faq_database[faq_id] = faq
+            self.records[faq_id] = record
+            self._link(faq_id, record)
+            if self.scorer is not None:
+                self.scorer.statistics.remove(old_record)
+                self.scorer.statistics.add(record)
+            self._entry_changed(faq_id)
+            self._commit([faq], vocabulary_size)
+    
+    def remove_faq(self, faq_id: int) -> Dict:
+        """
+        Remove the FAQ entry with the given id and return it. Every other id
+        stays valid: the entry is left as a tombstone (None in faq_database
+        and an empty record in no posting), so it can never match. Ids are
+        compacted only when the index is rebuilt or compiled with write_index.
+        """
+        self._require_mutable()
+        with self._index_lock:
+            self._require_entry(faq_id)
+            removed = self.faq_database[faq_id]
+            record = self.records[faq_id]
+            self._unlink(faq_id, record)
+            if self.scorer is not None:
+                self.scorer.statistics.remove(record)
+            self.faq_database[faq_id] = None
+            self.records[faq_id] = FAQRecord((), (), ())
+            self._removed += 1
+            self._entry_changed(faq_id)
+            self._commit([], len(self.vocabulary))
+        return {key: value for key, value in removed.items() if not key.startswith('processed_')}
+    
+    def _require_entry(self, faq_id: int):
+        if not 0 <= faq_id < len(self.faq_database) or self.faq_database[faq_id] is None:
+            raise IndexError(f"No FAQ with id {faq_id}")
+    
+    def _entry_changed(self, faq_id: int):
+        """Called under the index lock after the entry with this id was added, replaced or removed (None)"""
+    
+    def _commit(self, faqs: List[Dict], vocabulary_size: int):
+        """
+        Finish an index change to the given new or updated entries: index the
+        tokens they added to the vocabulary in the fuzzy index, fold pending
+        keywords into a new automaton once there are more than 512 of them
+        (until then they are matched by a linear scan), and drop cached
+        responses.
+        """
+        if self._fuzzy_index is not None:
+            new_tokens = {token for faq in faqs for token in faq['processed_question'] + faq['processed_keywords']
+                          if self.vocabulary[token] >= vocabulary_size}
+            for token in sorted(new_tokens, key=self.vocabulary.get):
+                self._fuzzy_index.add(self.vocabulary[token], token)
+        if len(self._pending_keywords) > 512:
+            self._rebuild_automaton()
+        self.response_cache.clear()
+    
+    def _intern(self, token: str) -> int:
+        """Return the interned id of a processed token, assigning a new one if needed"""
+        return self.vocabulary.setdefault(token, len(self.vocabulary))
+    
+    def _register_keyword(self, keyword: str) -> int:
+        """Return the id of a raw keyword, indexing its fragments the first time it is seen"""
+        keyword_id = self.raw_keywords.get(keyword)
+        if keyword_id is None:
+            keyword_id = self.raw_keywords[keyword] = len(self.keyword_owners)
+            self.keyword_owners.append(set())
+            self._pending_keywords.append((keyword, keyword_id))
+            # User words are always longer than two characters, so shorter
+            # fragments can never match the "word in keyword" test
+            fragments = dict.fromkeys(keyword[start:end] for start in range(len(keyword) - 2)
+                                      for end in range(start + 3, len(keyword) + 1))
+            for fragment in fragments:
+                self.keyword_fragments.setdefault(fragment, []).append(keyword_id)
+        return keyword_id
+    
+    def _find_candidates(self, user_words: List[str], top_k: Optional[int] = None) -> List[Tuple[int, int, int, int]]:
+        """
+        Return (faq_id, keyword_hits, question_hits, overlap_hits) in database
+        order for the FAQs that can score above zero: those sharing a processed
+        token with the question, or owning a raw keyword that contains or is
+        contained in one of the user words. keyword_hits and question_hits are
+        the sizes of the intersections of the question's distinct tokens with
+        the FAQ's keyword and question token sets; overlap_hits is the number
+        of user words (with repeats) matching one of the FAQ's raw keywords.
+        With top_k, only the k FAQs touched by the most user words are kept.
+        """
+        keyword_hits, question_hits, overlap_hits, touched = Counter(), Counter(), Counter(), Counter()
+        for word, count in Counter(user_words).items():
+            matched = self._keyword_matches(word)
+            for faq_id in matched:
+                overlap_hits[faq_id] += count
+            
+            token_id = self.vocabulary.get(word)
+            if token_id is not None:
+                keyword_hits.update(self.keyword_index.get(token_id, ()))
+                question_hits.update(self.question_index.get(token_id, ()))
+                matched.update(self.keyword_index.get(token_id, ()))
+                matched.update(self.question_index.get(token_id, ()))
+            touched.update(matched)
+        
+        candidates = touched
+        if top_k is not None and len(touched) > top_k:
+            candidates = sorted(touched, key=lambda faq_id: (-touched[faq_id], faq_id))[:top_k]
+        return [(faq_id, keyword_hits[faq_id], question_hits[faq_id], overlap_hits[faq_id])
+                for faq_id in sorted(candidates)]
+    
+    def _keyword_matches(self, word: str) -> set:
+        """
+        Ids of the FAQs owning a raw keyword that contains word (fragment
+        lookup) or is contained in word (automaton scan), i.e. the FAQs for
+        which the word overlap signal counts this word.
+        """
+        keyword_ids = set(self.keyword_fragments.get(word, ()))
+        keyword_ids.update(self.keyword_automaton.search(word))
+        for keyword, keyword_id in self._pending_keywords:
+            if keyword in word:
+                keyword_ids.add(keyword_id)
+        
+        matched = set()
+        for keyword_id in keyword_ids:
+            matched.update(self.keyword_owners[keyword_id])
+        return matched
+    
+    def _preprocess_text(self, text: str) -> List[str]:
+        """Preprocess text with the chatbot's TextPreprocessor"""
+        return self.preprocessor(text)
+    
+    def _query_words(self, text: str) -> List[str]:
+        """Preprocess a user question, correcting misspelled tokens when fuzzy matching is on"""
+        words = self._preprocess_text(text)
+        if self.fuzzy and not all(self._known_word(word) for word in words):
+            # Corrections read the fuzzy index, which add/update/remove_faq extend, so only a
+            # question with a word to correct waits for the index lock
+            with self._index_lock:
+                words = [self._correct_word(word) for word in words]
+        return words
+    
+    def _known_word(self, word: str) -> bool:
+        """Whether a token is kept as-is: shorter than 4 characters, in the vocabulary or a keyword substring match"""
+        return len(word) < 4 or self.vocabulary.get(word) is not None or bool(self._keyword_matches(word))
+    
+    def _correct_word(self, word: str) -> str:
+        """
+        Replace a token that matches nothing (not in the vocabulary and no
+        keyword substring match) with the most frequent vocabulary token
+        within edit distance 1, or 2 for words of 8+ characters. Tokens
+        shorter than 4 characters and tokens with no close match are kept.
+        Call with the index lock held.
+        """
+        if self._known_word(word):
+            return word
+        
+        fuzzy_index = self._fuzzy_index
+        token_ids = fuzzy_index.lookup(word, 1 if len(word) < 8 else 2)
+        if not token_ids:
+            return word
+        return min((fuzzy_index.tokens[token_id] for token_id in token_ids),
+                   key=lambda token: (-self._document_frequency(token), token))
+    
+    def _corpus_statistics(self) -> CorpusStatistics:
+        """CorpusStatistics for a term-weighted scorer, read from a compiled index when it carries them"""
+        if isinstance(self.faq_database, MappedFAQs) and self.faq_database.index.statistics is not None:
+            return self.faq_database.index.statistics
+        return CorpusStatistics(self.records)
+    
+    def _build_fuzzy_index(self) -> FuzzyIndex:
+        """
+        FuzzyIndex over the vocabulary by token id (interned ids count up
+        from 0, mapped ids are table positions). A mapped index carrying
+        compiled fuzzy keys serves them from the mapping as they are.
+        """
+        if isinstance(self.faq_database, MappedFAQs):
+            index = self.faq_database.index
+            if index.fuzzy_keys is not None:
+                return FuzzyIndex(index.vocabulary, *index.fuzzy_settings, keys=index.fuzzy_keys)
+            return FuzzyIndex(index.vocabulary)
+        return FuzzyIndex(list(self.vocabulary))
+    
+    def _document_frequency(self, token: str) -> int:
+        """Number of FAQ keyword and question postings of a vocabulary token"""
+        token_id = self.vocabulary.get(token)
+        return len(self.keyword_index.get(token_id, ())) + len(self.question_index.get(token_id, ()))
+    
+    def _preprocess_keyword(self, keyword: str) -> str:
+        """A keyword is matched on its first processed token, or as-is if it has none"""
+        tokens = self.preprocessor.cached(keyword)
+        return tokens[0] if tokens else keyword
+    
+    def _term_scores(self, user_words: List[str], candidates: List[Tuple[int, int, int, int]]) -> List[Tuple[int, float, float]]:
+        """
+        (faq_id, scorer score, word overlap) for each candidate of a
+        term-weighted scorer, in database order; the final score is
+            TERM_WEIGHT * scorer score + OVERLAP_WEIGHT * word overlap
+        """
+        term_scores = self.scorer.score(self, user_words)
+        return [(faq_id, term_scores.get(faq_id, 0.0), overlap_hits / len(user_words))
+                for faq_id, _, _, overlap_hits in candidates]
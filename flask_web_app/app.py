@@ -1,15 +1,455 @@
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, render_template_string, request, jsonify
 from flask_cors import CORS
 import re
 import math
-from typing import List, Dict, Optional
+import threading
+import time
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+from bisect import bisect_left
+from heapq import heappush, heapreplace, nsmallest
+from collections import Counter, OrderedDict, deque, namedtuple
+from functools import wraps
+from typing import List, Dict, Tuple, Optional, Hashable, Iterable, Iterator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from faq_core import (TERM_WEIGHT, OVERLAP_WEIGHT, FAQIndex, FAQRecord, MappedFAQs, MappedStrings,
+                      TextPreprocessor, load_faq_file)
+
+try:
+    import brotli
+except ImportError:  # optional: without it pages are served gzip-compressed
+    brotli = None
 
 app = Flask(__name__)
 CORS(app)
 
-class FAQChatbot:
+class CachedResponse(dict):
+    # A /chat response kept in the ResponseCache; body holds its JSON bytes once serialized
+    __slots__ = ('body',)
+    
+    def __init__(self, response: Dict):
+        super().__init__(response)
+        self.body: Optional[bytes] = None
+
+class RateLimiter:
+    # Per-client token buckets refilled at rate tokens/second up to burst. Only the max_clients most
+    # recently seen clients are tracked; a forgotten client comes back with a full bucket.
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+    
+    def allow(self, client: Hashable) -> float:
+        # 0.0 when the request may proceed, else the seconds until the client's next token
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if not wait:
+                tokens -= 1
+            else:
+                self.limited += 1
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+class AdmissionQueue:
+    # Bounded work queue: max_active requests run at once, up to max_queued more wait at most timeout
+    # seconds for a slot, and anything beyond that is turned away at once, so under overload latency
+    # stays near timeout plus one request instead of growing with the backlog. When not enabled every
+    # request is admitted at once and only counted.
+    def __init__(self, max_active: int, max_queued: int, timeout: float, enabled: bool = True):
+        self.enabled = enabled
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+    
+    def acquire(self) -> bool:
+        with self._condition:
+            if not self.enabled or self.active < self.max_active:
+                self.active += 1
+                return True
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                return False
+            self.queued += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self.active < self.max_active, self.timeout)
+            finally:
+                self.queued -= 1
+            if not admitted:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+    
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+    
+    def stats(self) -> Dict:
+        with self._condition:
+            return {'enabled': self.enabled, 'active': self.active, 'queued': self.queued, 'max_active': self.max_active,
+                    'max_queued': self.max_queued, 'rejected': self.rejected}
+
+class Flight:
+    # One in-progress SingleFlight computation; waiters block on done
+    __slots__ = ('done', 'result', 'error')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    # Coalesces concurrent calls with the same key: the first caller runs the computation and every
+    # caller arriving before it finishes waits for and shares its result (or exception)
     def __init__(self):
-        self.faq_database = [
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+    
+    def run(self, key: Hashable, compute):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = compute()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'in_flight': len(self._flights), 'leaders': self.leaders, 'coalesced': self.coalesced}
+
+class QueryLog:
+    # Buffered JSONL log of answered questions. record() only appends to a bounded deque (the oldest
+    # entries are dropped if the writer falls behind), and a daemon thread appends the buffer to path
+    # every flush_interval seconds and keeps running totals for stats(), pruned to the max_tracked most
+    # frequent FAQs and fallback questions at each flush. The thread is started on first use in each
+    # process, so workers forked after import each run their own writer.
+    def __init__(self, path: str, flush_interval: float = 1.0, max_buffer: int = 10000, max_tracked: int = 1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_tracked = max_tracked
+        self._buffer: deque = deque(maxlen=max_buffer)
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.written = 0
+        self.faqs: Counter = Counter()
+        self.fallbacks: Counter = Counter()
+    
+    def record(self, words: Tuple[str, ...], suggestions: int, response: Dict):
+        if self._pid != os.getpid():
+            self._start()
+        entry = (time.time(), words, suggestions, response['matched_question'], response['confidence'])
+        with self._lock:
+            self._buffer.append(entry)
+            self.recorded += 1
+    
+    def _start(self):
+        # A forked worker starts from empty counts: the parent's buffered entries and totals are the parent's
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._buffer.clear()
+                self.recorded = self.written = 0
+                self.faqs.clear()
+                self.fallbacks.clear()
+                threading.Thread(target=self._run, name='faq-query-log', daemon=True).start()
+    
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+    
+    def flush(self):
+        with self._lock:
+            entries = list(self._buffer)
+            self._buffer.clear()
+            for _, words, _, question, _ in entries:
+                if question is None:
+                    self.fallbacks[' '.join(words)] += 1
+                else:
+                    self.faqs[question] += 1
+            # Rarely asked questions would otherwise keep these growing for the life of the process
+            for counter in (self.faqs, self.fallbacks):
+                if len(counter) > self.max_tracked:
+                    kept = counter.most_common(self.max_tracked)
+                    counter.clear()
+                    counter.update(dict(kept))
+        if not entries:
+            return
+        lines = [json.dumps({'time': round(logged_at, 3), 'words': words, 'suggestions': suggestions,
+                             'matched_question': question, 'confidence': confidence}) + '\n'
+                 for logged_at, words, suggestions, question, confidence in entries]
+        try:
+            # One append per batch keeps lines from several worker processes whole
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+            with self._lock:
+                self.written += len(lines)
+        except OSError:
+            app.logger.exception("Writing the query log failed")
+    
+    def stats(self, top: int = 10) -> Dict:
+        # Since this process started: the FAQs answering the most questions and the most common
+        # questions that fell through to the fallback
+        with self._lock:
+            return {
+                'path': self.path,
+                'recorded': self.recorded,
+                'written': self.written,
+                'dropped': self.recorded - self.written - len(self._buffer),
+                'top_faqs': self.faqs.most_common(top),
+                'top_fallbacks': self.fallbacks.most_common(top)
+            }
+
+def read_query_log(path: str) -> Iterator[Dict]:
+    # Entries of a query log, skipping lines cut short by a crash; a missing log has none
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and isinstance(entry.get('words'), list):
+                    yield entry
+    except FileNotFoundError:
+        return
+
+def top_logged_queries(path: str, count: int) -> List[Tuple[Tuple[str, ...], int]]:
+    # The count most frequent (words, suggestions) keys in a query log
+    keys = Counter((tuple(entry['words']), entry.get('suggestions', 0)) for entry in read_query_log(path))
+    return [key for key, _ in keys.most_common(count)]
+
+def summarize_query_log(path: str, top: int = 20) -> Dict:
+    # Whole-log totals: the FAQs answering the most questions and the most common fallback questions
+    faqs, fallbacks, total = Counter(), Counter(), 0
+    for entry in read_query_log(path):
+        total += 1
+        if entry.get('matched_question') is None:
+            fallbacks[' '.join(entry['words'])] += 1
+        else:
+            faqs[entry['matched_question']] += 1
+    return {
+        'questions': total,
+        'fallback_rate': round(sum(fallbacks.values()) / total, 4) if total else 0.0,
+        'top_faqs': faqs.most_common(top),
+        'top_fallbacks': fallbacks.most_common(top)
+    }
+
+class Histogram:
+    # Cumulative-bucket histogram in the Prometheus layout (bucket upper bounds, sum, count)
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def render(self, name: str, labels: str = '') -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{le}"}} {cumulative}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+    
+    def state(self) -> Dict:
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+    
+    def absorb(self, state: Dict):
+        # Add the state() of a histogram with the same buckets, e.g. from another worker process
+        self.counts = [count + other for count, other in zip(self.counts, state['counts'])]
+        self.sum += state['sum']
+        self.count += state['count']
+
+def index_stats(chatbot: 'FAQChatbot') -> Dict:
+    # The /metrics values kept by the serving chatbot rather than by Metrics: response cache and
+    # coalescing counters (reset with each index version) and the FAQ count
+    cache = chatbot.response_cache.stats()
+    flights = chatbot.flights.stats() if chatbot.flights is not None else None
+    return {'hits': cache['hits'], 'misses': cache['misses'], 'size': cache['size'], 'faqs': chatbot.faq_count,
+            'coalesced': flights['coalesced'] if flights else None, 'leaders': flights['leaders'] if flights else None}
+
+class Metrics:
+    # Per-stage timers and counters for /metrics. When disabled every instrumentation point is a single
+    # attribute check, so FAQ_METRICS=0 costs nothing measurable on the request path.
+    STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 1.0)
+    CANDIDATE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000, 10000)
+    CONFIDENCE_BUCKETS = (0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100)
+    
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Histogram] = {}
+        self.candidates = Histogram(self.CANDIDATE_BUCKETS)
+        self.confidence = Histogram(self.CONFIDENCE_BUCKETS)
+        self.requests: Counter = Counter()
+        self.outcomes: Counter = Counter()
+    
+    def lap(self, stage: str, start: float) -> float:
+        # Record the time since start against stage and return now, so stages can be chained
+        now = time.perf_counter()
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.STAGE_BUCKETS)
+            histogram.observe(now - start)
+        return now
+    
+    def observe_candidates(self, count: int):
+        with self._lock:
+            self.candidates.observe(count)
+    
+    def observe_response(self, response: Dict):
+        # Confidence 0 is the "I'm not sure" fallback branch of _format_response
+        with self._lock:
+            self.confidence.observe(response['confidence'])
+            self.outcomes['fallback' if response['matched_question'] is None else 'answered'] += 1
+    
+    def count_request(self, route: str, status: int):
+        with self._lock:
+            self.requests[route, status] += 1
+    
+    def snapshot(self) -> Dict:
+        # The counters and histograms as JSON-serializable data, for absorb() in another process
+        with self._lock:
+            return {'stages': {stage: histogram.state() for stage, histogram in self.stages.items()},
+                    'candidates': self.candidates.state(),
+                    'confidence': self.confidence.state(),
+                    'requests': [[route, status, count] for (route, status), count in self.requests.items()],
+                    'outcomes': dict(self.outcomes)}
+    
+    def absorb(self, state: Dict):
+        # Add a snapshot() into these metrics; asgi.py sums its workers' metrics this way
+        with self._lock:
+            for stage, histogram in state['stages'].items():
+                self.stages.setdefault(stage, Histogram(self.STAGE_BUCKETS)).absorb(histogram)
+            self.candidates.absorb(state['candidates'])
+            self.confidence.absorb(state['confidence'])
+            for route, status, count in state['requests']:
+                self.requests[route, status] += count
+            self.outcomes.update(state['outcomes'])
+    
+    def render(self, index: Dict) -> str:
+        # Prometheus text format of these metrics plus the serving chatbot's index_stats()
+        lines = ['# HELP faq_metrics_enabled Whether request instrumentation is on (FAQ_METRICS)',
+                 '# TYPE faq_metrics_enabled gauge',
+                 f'faq_metrics_enabled {int(self.enabled)}']
+        with self._lock:
+            lines += ['# HELP faq_stage_seconds Time spent in each stage of a chat request',
+                      '# TYPE faq_stage_seconds histogram']
+            for stage, histogram in sorted(self.stages.items()):
+                lines += histogram.render('faq_stage_seconds', f'stage="{stage}"')
+            lines += ['# HELP faq_candidates FAQs scored per matched question',
+                      '# TYPE faq_candidates histogram']
+            lines += self.candidates.render('faq_candidates')
+            lines += ['# HELP faq_response_confidence Confidence of each chat response (0 for the fallback)',
+                      '# TYPE faq_response_confidence histogram']
+            lines += self.confidence.render('faq_response_confidence')
+            lines += ['# HELP faq_responses_total Chat responses by outcome',
+                      '# TYPE faq_responses_total counter']
+            lines += [f'faq_responses_total{{outcome="{outcome}"}} {self.outcomes[outcome]}'
+                      for outcome in ('answered', 'fallback')]
+            lines += ['# HELP faq_http_requests_total HTTP requests by route and status',
+                      '# TYPE faq_http_requests_total counter']
+            lines += [f'faq_http_requests_total{{route="{route}",status="{status}"}} {count}'
+                      for (route, status), count in sorted(self.requests.items())]
+        lines += ['# HELP faq_cache_requests_total Response cache lookups by result (current index version)',
+                  '# TYPE faq_cache_requests_total counter',
+                  f'faq_cache_requests_total{{result="hit"}} {index["hits"]}',
+                  f'faq_cache_requests_total{{result="miss"}} {index["misses"]}',
+                  '# HELP faq_cache_entries Cached responses',
+                  '# TYPE faq_cache_entries gauge',
+                  f'faq_cache_entries {index["size"]}',
+                  '# HELP faq_index_faqs FAQs in the serving index',
+                  '# TYPE faq_index_faqs gauge',
+                  f'faq_index_faqs {index["faqs"]}']
+        if index['coalesced'] is not None:
+            lines += ['# HELP faq_coalesced_requests_total Cache misses that waited for an identical in-flight question',
+                      '# TYPE faq_coalesced_requests_total counter',
+                      f'faq_coalesced_requests_total {index["coalesced"]}',
+                      '# HELP faq_scored_misses_total Cache misses that scored their question (current index version)',
+                      '# TYPE faq_scored_misses_total counter',
+                      f'faq_scored_misses_total {index["leaders"]}']
+        return '\n'.join(lines) + '\n'
+
+def _deep_size(root) -> int:
+    # sys.getsizeof summed over root and every container, string and FAQRecord reachable from it, each once
+    seen, stack, total = set(), [root], 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, FAQRecord):
+            stack.extend(getattr(obj, slot) for slot in FAQRecord.__slots__)
+    return total
+
+def _positional(strings) -> List[str]:
+    # Interned dicts map string -> id in insertion order, mapped tables are already positional
+    if isinstance(strings, MappedStrings):
+        return [strings[position] for position in range(len(strings))]
+    return list(strings)
+
+class FAQChatbot(FAQIndex):
+    def __init__(self, faq_database: Optional[List[Dict]] = None, cache_size: int = 1024,
+                 cache_ttl: Optional[float] = 300.0, preprocessor: Optional[TextPreprocessor] = None,
+                 index_path: Optional[str] = None, metrics: Optional[Metrics] = None, fuzzy: bool = True,
+                 scorer: str = 'weighted', coalesce: bool = True, query_log: Optional[QueryLog] = None):
+        faq_database = faq_database if faq_database is not None else [
             {
                 "question": "How do I reset my password?",
                 "answer": "To reset your password: 1) Go to the login page, 2) Click 'Forgot Password', 3) Enter your email address, 4) Check your email for reset instructions, 5) Follow the link and create a new password. If you don't receive the email, check your spam folder.",
@@ -51,65 +491,292 @@ class FAQChatbot:
                 "keywords": ["upgrade", "plan", "subscription", "premium", "account", "billing", "features", "tier"]
             }
         ]
-        self._preprocess_database()
-    
-    def _preprocess_database(self):
-        for faq in self.faq_database:
-            faq['processed_question'] = self._preprocess_text(faq['question'])
-            faq['processed_keywords'] = [self._preprocess_text(kw)[0] if self._preprocess_text(kw) else kw for kw in faq['keywords']]
-    
-    def _preprocess_text(self, text: str) -> List[str]:
-        text = re.sub(r'[^\w\s]', ' ', text.lower())
-        words = [word for word in text.split() if len(word) > 2]
-        stop_words = {'the', 'and', 'are', 'you', 'for', 'can', 'how', 'what', 'where', 'when', 'why', 'with', 'this', 'that'}
-        words = [word for word in words if word not in stop_words]
-        return words
-    
-    def _calculate_cosine_similarity(self, vec1: List[str], vec2: List[str]) -> float:
-        if not vec1 or not vec2:
-            return 0.0
-        set1, set2 = set(vec1), set(vec2)
-        intersection = len(set1.intersection(set2))
-        magnitude1 = math.sqrt(len(set1))
-        magnitude2 = math.sqrt(len(set2))
-        if magnitude1 == 0 or magnitude2 == 0:
-            return 0.0
-        return intersection / (magnitude1 * magnitude2)
+        # FAQ answers and questions JSON-encoded once, for get_response_body
+        self._json_strings: Dict[str, bytes] = {}
+        # client_index() output, kept until the index changes
+        self._client_index: Optional[bytes] = None
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        # Concurrent cache misses for the same question share one computation (coalesce=False scores each)
+        self.flights: Optional[SingleFlight] = SingleFlight() if coalesce else None
+        # Answered questions are handed to query_log, if given, without waiting on its file
+        self.query_log = query_log
+        # 'weighted' blends the cosine and overlap scores; 'bm25' and 'tfidf' replace the cosines
+        # with a term-weighted score from SCORERS
+        super().__init__(faq_database, cache_size, cache_ttl, preprocessor, index_path, fuzzy, scorer)
     
-    def _calculate_word_overlap(self, user_words: List[str], keywords: List[str]) -> float:
-        if not user_words:
-            return 0.0
-        overlap_count = 0
-        for word in user_words:
-            for keyword in keywords:
-                if word in keyword or keyword in word:
-                    overlap_count += 1
-                    break
-        return overlap_count / len(user_words)
-    
-    def find_best_match(self, user_question: str) -> Optional[Dict]:
-        user_words = self._preprocess_text(user_question)
+    def _index_built(self):
+        # Serialized strings and the client index belong to the index they were built from
+        super()._index_built()
+        self._json_strings.clear()
+        self._client_index = None
+    
+    def _commit(self, faqs: List[Dict], vocabulary_size: int):
+        super()._commit(faqs, vocabulary_size)
+        self._json_strings.clear()
+        self._client_index = None
+    
+    def memory_estimate(self) -> int:
+        # Approximate bytes held by the FAQ entries and index structures; a memory-mapped index counts
+        # its mapped file (shared page cache) plus the fuzzy index and response cache instead
+        with self._index_lock:
+            fuzzy = [] if self._fuzzy_index is None else [self._fuzzy_index.keys, self._fuzzy_index.added]
+            if isinstance(self.faq_database, MappedFAQs):
+                # Compiled fuzzy keys are part of the mapped file
+                if self.faq_database.index.fuzzy_keys is not None:
+                    fuzzy = fuzzy[1:]
+                return len(self.faq_database.index._mmap) + _deep_size(fuzzy + [self.response_cache._entries])
+            return _deep_size([self.faq_database, self.vocabulary, self.records, self.keyword_index,
+                               self.question_index, self.raw_keywords, self.keyword_owners,
+                               self.keyword_fragments, self.response_cache._entries] + fuzzy)
+    
+    def client_index(self) -> bytes:
+        # Compact JSON index for static_version/chatbot.html, which scores with it exactly as _match_words
+        # does. Token ids are positions in "vocabulary" and index the two postings lists; per-FAQ token
+        # counts stand in for the norms, which both sides take as sqrt(count). "fragments" (keyword
+        # substring -> positions in "keywords") and "deletes" (the fuzzy index's delete -> token ids) let
+        # the page look words up as the server does instead of scanning every keyword and token.
+        with self._index_lock:
+            if self._client_index is None:
+                if self.scorer is not None:
+                    raise ValueError("The client index only supports the 'weighted' scorer")
+                tokens = _positional(self.vocabulary)
+                keywords = _positional(self.raw_keywords)
+                owned = [position for position in range(len(keywords)) if self.keyword_owners[position]]
+                positions = {keyword_id: position for position, keyword_id in enumerate(owned)}
+                fragments = {}
+                for fragment, keyword_ids in self.keyword_fragments.items():
+                    exported = sorted(positions[keyword_id] for keyword_id in keyword_ids if keyword_id in positions)
+                    if exported:
+                        fragments[fragment] = exported
+                index = {
+                    'format': 2,
+                    'min_length': self.preprocessor.min_length,
+                    'stop_words': sorted(self.preprocessor.stop_words),
+                    'fuzzy': self.fuzzy,
+                    'fuzzy_prefix_length': self._fuzzy_index.prefix_length if self.fuzzy else 0,
+                    'fuzzy_max_distance': self._fuzzy_index.max_distance if self.fuzzy else 0,
+                    # A removed entry keeps its position as null; it is in no posting, so it never matches
+                    'questions': [faq and faq['question'] for faq in self.faq_database],
+                    'answers': [faq and faq['answer'] for faq in self.faq_database],
+                    'keyword_counts': [len(record.keyword_ids) for record in self.records],
+                    'question_counts': [len(record.question_ids) for record in self.records],
+                    'vocabulary': tokens,
+                    'keyword_postings': [sorted(self.keyword_index.get(token_id, ())) for token_id in range(len(tokens))],
+                    'question_postings': [sorted(self.question_index.get(token_id, ())) for token_id in range(len(tokens))],
+                    'keywords': [keywords[position] for position in owned],
+                    'keyword_owners': [sorted(self.keyword_owners[position]) for position in owned],
+                    'fragments': fragments,
+                    'deletes': self._fuzzy_index.deletion_map() if self.fuzzy else {}
+                }
+                self._client_index = json.dumps(index, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            return self._client_index
+    
+    def find_best_match(self, user_question: str, top_k: Optional[int] = None) -> Optional[Dict]:
+        user_words = self._query_words(user_question)
         if not user_words:
             return None
-        
-        best_match = None
+        return self._match_words(user_words, top_k)
+    
+    def find_best_matches(self, user_questions: List[str]) -> List[Optional[Dict]]:
+        # Questions that preprocess to the same tokens are scored once per batch
+        queries = [tuple(self._query_words(question)) for question in user_questions]
+        matches = {words: self._match_words(list(words)) for words in dict.fromkeys(queries) if words}
+        return [matches.get(words) for words in queries]
+    
+    def _match_words(self, user_words: List[str], top_k: Optional[int] = None) -> Optional[Dict]:
+        with self._index_lock:
+            timed = self.metrics.enabled
+            if timed:
+                start = time.perf_counter()
+            candidates = self._find_candidates(user_words, top_k)
+            if timed:
+                start = self.metrics.lap('candidates', start)
+                self.metrics.observe_candidates(len(candidates))
+            
+            best = self._score_candidates(user_words, candidates)
+            if timed:
+                self.metrics.lap('scoring', start)
+            # Only the winner is materialized
+            if best is None or best[1] <= 0.15:
+                return None
+            return {**self.faq_database[best[0]], 'confidence': round(best[1] * 100, 2)}
+    
+    @staticmethod
+    def _blend(keyword_score: float, question_score: float, overlap_score: float) -> float:
+        return (keyword_score * 0.4) + (question_score * 0.3) + (overlap_score * 0.3)
+    
+    def _weighted_score(self, candidate: Tuple[int, int, int, int], query_norm: float, word_count: int) -> float:
+        # Final 'weighted' score of one (faq_id, keyword_hits, question_hits, overlap_hits) candidate
+        faq_id, keyword_hits, question_hits, overlap_hits = candidate
+        record = self.records[faq_id]
+        keyword_score = keyword_hits / (query_norm * record.keyword_norm) if record.keyword_ids else 0.0
+        question_score = question_hits / (query_norm * record.question_norm) if record.question_ids else 0.0
+        return self._blend(keyword_score, question_score, overlap_hits / word_count)
+    
+    def _score_candidates(self, user_words: List[str], candidates: List[Tuple[int, int, int, int]]) -> Optional[Tuple[int, float]]:
+        # (faq_id, final score) of the best scoring candidate, keeping the earliest FAQ on ties
+        if self.scorer is not None:
+            scored = self._blended_term_scores(user_words, candidates)
+        else:
+            query_norm = math.sqrt(len(set(user_words)))
+            scored = ((candidate[0], self._weighted_score(candidate, query_norm, len(user_words)))
+                      for candidate in candidates)
+        best = None
         highest_score = 0.0
+        for faq_id, final_score in scored:
+            if final_score > highest_score:
+                highest_score = final_score
+                best = (faq_id, final_score)
+        return best
+    
+    def _blended_term_scores(self, user_words: List[str], candidates: List[Tuple[int, int, int, int]]) -> List[Tuple[int, float]]:
+        # (faq_id, final score) of each candidate with a term-weighted scorer, in database order
+        return [(faq_id, term_score * TERM_WEIGHT + word_overlap * OVERLAP_WEIGHT)
+                for faq_id, term_score, word_overlap in self._term_scores(user_words, candidates)]
+    
+    def find_top_matches(self, user_question: str, k: int = 3) -> List[Dict]:
+        # Up to k matches above the threshold, best first; the first is find_best_match's match
+        user_words = self._query_words(user_question)
+        if not user_words or k <= 0:
+            return []
+        return self._top_matches(user_words, k)
+    
+    def _top_matches(self, user_words: List[str], k: int) -> List[Dict]:
+        with self._index_lock:
+            return [{**self.faq_database[faq_id], 'confidence': round(score * 100, 2)}
+                    for faq_id, score in self._top_candidates(user_words, k)]
+    
+    def _top_candidates(self, user_words: List[str], k: int) -> List[Tuple[int, float]]:
+        # Bounded min-heap of the k best (score, -faq_id). A record has at least keyword_hits keyword
+        # tokens and question_hits question tokens, so sqrt(hits) bounds its norms from below: candidates
+        # whose bound cannot beat the threshold or the k-th best score are skipped before their record is
+        # read. The small margin keeps float rounding from skipping a tie.
+        if self.scorer is not None:
+            scored = [item for item in self._blended_term_scores(user_words, self._find_candidates(user_words)) if item[1] > 0.15]
+            return nsmallest(k, scored, key=lambda item: (-item[1], item[0]))
+        query_norm = math.sqrt(len(set(user_words)))
+        heap = []
+        floor = 0.15
         
-        for faq in self.faq_database:
-            keyword_score = self._calculate_cosine_similarity(user_words, faq['processed_keywords'])
-            question_score = self._calculate_cosine_similarity(user_words, faq['processed_question'])
-            overlap_score = self._calculate_word_overlap(user_words, faq['keywords'])
+        for candidate in self._find_candidates(user_words):
+            faq_id, keyword_hits, question_hits, overlap_hits = candidate
+            bound = self._blend(math.sqrt(keyword_hits) / query_norm, math.sqrt(question_hits) / query_norm,
+                                overlap_hits / len(user_words))
+            if bound * (1 + 1e-9) <= floor:
+                continue
             
-            final_score = (keyword_score * 0.4) + (question_score * 0.3) + (overlap_score * 0.3)
+            final_score = self._weighted_score(candidate, query_norm, len(user_words))
+            if final_score <= floor:
+                continue
             
-            if final_score > highest_score:
-                highest_score = final_score
-                best_match = {**faq, 'confidence': round(final_score * 100, 2)}
+            if len(heap) < k:
+                heappush(heap, (final_score, -faq_id))
+            else:
+                heapreplace(heap, (final_score, -faq_id))
+            if len(heap) == k:
+                floor = max(0.15, heap[0][0])
         
-        return best_match if highest_score > 0.15 else None
+        return [(-negative_id, score) for score, negative_id in sorted(heap, reverse=True)]
+    
+    def get_response(self, user_question: str, suggestions: int = 0) -> Dict:
+        # suggestions > 0 adds up to that many runner-up questions to the response
+        return dict(self._cached_response(user_question, suggestions))
     
-    def get_response(self, user_question: str) -> Dict:
-        match = self.find_best_match(user_question)
+    def get_response_body(self, user_question: str, suggestions: int = 0) -> bytes:
+        # get_response as the JSON bytes jsonify would send; a cache hit returns the bytes kept with the entry
+        response = self._cached_response(user_question, suggestions)
+        if response.body is None:
+            response.body = self._serialize(response)
+        return response.body
+    
+    def _cached_response(self, user_question: str, suggestions: int) -> CachedResponse:
+        timed = self.metrics.enabled
+        if timed:
+            start = time.perf_counter()
+        user_words = tuple(self._query_words(user_question))
+        key = (user_words, suggestions) if suggestions else user_words
+        if timed:
+            start = self.metrics.lap('preprocess', start)
+        response = self.response_cache.get(key)
+        if timed:
+            start = self.metrics.lap('cache_lookup', start)
+        if response is None:
+            if self.flights is not None:
+                # Identical questions already being scored wait for that result instead of scoring again
+                response = self.flights.run(key, lambda: self._compute_response(user_words, suggestions, key))
+            else:
+                response = self._compute_response(user_words, suggestions, key)
+        if timed:
+            self.metrics.observe_response(response)
+        if self.query_log is not None:
+            self.query_log.record(user_words, suggestions, response)
+        return response
+    
+    def warm(self, queries: Iterable[Tuple[Tuple[str, ...], int]]) -> int:
+        # Prefill the response cache (and serialized bodies) for (normalized words, suggestions) keys,
+        # such as top_logged_queries returns; returns how many were computed
+        computed = 0
+        for words, suggestions in queries:
+            key = (words, suggestions) if suggestions else words
+            if words and self.response_cache.get(key) is None:
+                response = self._compute_response(words, suggestions, key)
+                response.body = self._serialize(response)
+                computed += 1
+        return computed
+    
+    def _compute_response(self, user_words: Tuple[str, ...], suggestions: int, key: Hashable) -> CachedResponse:
+        # Scored and cached under the index lock, so an FAQ edit cannot leave a stale response cached
+        timed = self.metrics.enabled
+        with self._index_lock:
+            if suggestions:
+                matches = self._top_matches(list(user_words), suggestions + 1) if user_words else []
+                match = matches[0] if matches else None
+            else:
+                match = self._match_words(list(user_words)) if user_words else None
+            if timed:
+                start = time.perf_counter()
+            response = CachedResponse(self._format_response(match))
+            if suggestions:
+                response['suggestions'] = [other['question'] for other in matches
+                                           if other['question'] != response['matched_question']][:suggestions]
+            self.response_cache.put(key, response)
+        if timed:
+            self.metrics.lap('format', start)
+        return response
+    
+    def get_responses(self, user_questions: List[str]) -> List[Dict]:
+        queries = [tuple(self._query_words(question)) for question in user_questions]
+        responses = {}
+        for words in dict.fromkeys(queries):
+            response = self.response_cache.get(words)
+            if response is None:
+                with self._index_lock:
+                    response = CachedResponse(self._format_response(self._match_words(list(words)) if words else None))
+                    self.response_cache.put(words, response)
+            responses[words] = response
+        if self.metrics.enabled:
+            for words in queries:
+                self.metrics.observe_response(responses[words])
+        return [dict(responses[words]) for words in queries]
+    
+    def _serialize(self, response: Dict) -> bytes:
+        # Byte-for-byte what jsonify sends outside debug mode (sorted keys, compact separators, trailing newline),
+        # with each answer and question string encoded once per FAQ
+        parts = [b'{"answer":', self._json_string(response['answer']),
+                 b',"confidence":', json.dumps(response['confidence']).encode(), b',"matched_question":',
+                 b'null' if response['matched_question'] is None else self._json_string(response['matched_question'])]
+        if 'suggestions' in response:
+            parts += [b',"suggestions":[', b','.join(map(self._json_string, response['suggestions'])), b']']
+        parts.append(b'}\n')
+        return b''.join(parts)
+    
+    def _json_string(self, text: str) -> bytes:
+        encoded = self._json_strings.get(text)
+        if encoded is None:
+            encoded = self._json_strings[text] = json.dumps(text).encode()
+        return encoded
+    
+    def _format_response(self, match: Optional[Dict]) -> Dict:
         if match and match['confidence'] > 30:
             return {
                 'answer': match['answer'],
@@ -123,8 +790,257 @@ class FAQChatbot:
                 'matched_question': None
             }
 
+# Request instrumentation shared by every chatbot version; FAQ_METRICS=0 turns it off
+metrics = Metrics(enabled=os.environ.get('FAQ_METRICS', '1') != '0')
+
+# FAQ_QUERY_LOG=path logs default-corpus questions there; every new chatbot version is then warmed with
+# the FAQ_WARMUP_QUERIES (1000) most frequent logged questions before it serves
+query_log = QueryLog(os.environ['FAQ_QUERY_LOG']) if os.environ.get('FAQ_QUERY_LOG') else None
+WARMUP_QUERIES = int(os.environ.get('FAQ_WARMUP_QUERIES', 1000))
+
+def warm_up(chatbot: FAQChatbot) -> FAQChatbot:
+    if query_log is not None and WARMUP_QUERIES > 0:
+        start = time.perf_counter()
+        computed = chatbot.warm(top_logged_queries(query_log.path, WARMUP_QUERIES))
+        app.logger.info("Warmed %d cached responses in %.2f s", computed, time.perf_counter() - start)
+    return chatbot
+
+def create_chatbot() -> FAQChatbot:
+    # FAQ_INDEX memory-maps a compiled index, FAQ_FILE loads a .json/.jsonl/.csv corpus;
+    # FAQ_SCORER picks 'weighted' (default), 'bm25' or 'tfidf'; FAQ_COALESCE=0 turns off request coalescing
+    scorer = os.environ.get('FAQ_SCORER', 'weighted')
+    coalesce = os.environ.get('FAQ_COALESCE', '1') != '0'
+    options = dict(metrics=metrics, scorer=scorer, coalesce=coalesce, query_log=query_log)
+    if os.environ.get('FAQ_INDEX'):
+        return warm_up(FAQChatbot(index_path=os.environ['FAQ_INDEX'], **options))
+    if os.environ.get('FAQ_FILE'):
+        return warm_up(FAQChatbot(load_faq_file(os.environ['FAQ_FILE']), **options))
+    return warm_up(FAQChatbot(**options))
+
+def file_signature(paths: List[str]) -> List[Optional[int]]:
+    # Modification times of the watched files; a changed signature means a reload is due
+    return [os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in paths]
+
+# One immutable serving version: the chatbot plus when and how fast it was built
+ChatbotSnapshot = namedtuple('ChatbotSnapshot', ['chatbot', 'version', 'built_at', 'build_seconds'])
+
+class ChatbotStore:
+    # Copy-on-write holder for the serving chatbot. A reload builds a complete new FAQChatbot in a
+    # background thread and publishes it with a single reference assignment, so requests read either
+    # the old or the new snapshot, never a half-built index, and never wait on the rebuild.
+    def __init__(self, factory):
+        self.factory = factory
+        self.last_error: Optional[str] = None
+        self._reload_lock = threading.Lock()
+        self._watch_lock = threading.Lock()
+        self._watcher_pid: Optional[int] = None
+        self.current: Optional[ChatbotSnapshot] = None
+        self._build()
+    
+    def _build(self):
+        start = time.perf_counter()
+        chatbot = self.factory()
+        version = self.current.version + 1 if self.current else 1
+        self.current = ChatbotSnapshot(chatbot, version, time.time(), round(time.perf_counter() - start, 4))
+    
+    @property
+    def reloading(self) -> bool:
+        return self._reload_lock.locked()
+    
+    def reload(self) -> bool:
+        # Start a background rebuild; False if one is already running
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._reload, daemon=True).start()
+        return True
+    
+    def _reload(self):
+        try:
+            self.rebuild()
+        finally:
+            self._reload_lock.release()
+    
+    def rebuild(self) -> bool:
+        # Build and publish a new snapshot in the calling thread; False (keeping the previous one) on failure
+        try:
+            self._build()
+            self.last_error = None
+            return True
+        except Exception as error:
+            self.last_error = str(error)
+            app.logger.exception("FAQ reload failed")
+            return False
+    
+    def watch(self, paths: List[str], interval: float):
+        # Poll the FAQ/index files and reload when one changes. Replace files by writing a new file
+        # and renaming it over the old one: an index rewritten in place would break live mmaps.
+        # Starts one poller per process, so a forked child calling it again gets its own.
+        if self._watcher_pid == os.getpid():
+            return
+        with self._watch_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        
+        def poll(last):
+            while True:
+                time.sleep(interval)
+                current = file_signature(paths)
+                if current != last and self.reload():
+                    last = current
+        
+        # Changes made after watch() returns are caught even before the thread first runs
+        threading.Thread(target=poll, args=(file_signature(paths),), daemon=True).start()
+    
+    def share_index(self, directory: Optional[str] = None) -> ChatbotSnapshot:
+        # Pre-fork mode: compile the current snapshot into an index file (on tmpfs when available) and
+        # return a snapshot serving it memory-mapped. Workers forked afterwards inherit the mapping, so they
+        # all read one copy of the index pages instead of each dirtying its own copy of the dicts and token
+        # lists. The current snapshot is left in place, so the parent can still reload it and share it again.
+        snapshot = self.current
+        if isinstance(snapshot.chatbot.faq_database, MappedFAQs):
+            return snapshot
+        if directory is None and os.path.isdir('/dev/shm'):
+            directory = '/dev/shm'
+        fd, path = tempfile.mkstemp(prefix='faq-', suffix='.idx', dir=directory)
+        os.close(fd)
+        try:
+            snapshot.chatbot.write_index(path)
+            chatbot = FAQChatbot(index_path=path, cache_size=snapshot.chatbot.response_cache.max_entries,
+                                 cache_ttl=snapshot.chatbot.response_cache.ttl, preprocessor=snapshot.chatbot.preprocessor,
+                                 metrics=snapshot.chatbot.metrics, fuzzy=snapshot.chatbot.fuzzy,
+                                 scorer=snapshot.chatbot.scorer_name, coalesce=snapshot.chatbot.flights is not None,
+                                 query_log=snapshot.chatbot.query_log)
+            warm_up(chatbot)
+        finally:
+            # The mapping outlives the file name
+            os.unlink(path)
+        return snapshot._replace(chatbot=chatbot)
+    
+    def health(self) -> Dict:
+        snapshot = self.current
+        return {
+            'version': snapshot.version,
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(snapshot.built_at)),
+            'build_seconds': snapshot.build_seconds,
+            'reloading': self.reloading,
+            'last_error': self.last_error
+        }
+
 # Initialize chatbot
-chatbot = FAQChatbot()
+chatbot_store = ChatbotStore(create_chatbot)
+
+TenantEntry = namedtuple('TenantEntry', ['chatbot', 'memory_bytes', 'load_seconds', 'loaded_at'])
+
+class TenantRegistry:
+    # Per-tenant chatbots for FAQ_TENANTS_DIR/<tenant>.{idx,json,jsonl,csv}, built (or memory-mapped for
+    # .idx) on first use and kept in an LRU bounded by memory_budget estimated bytes: loading a tenant
+    # evicts the least recently used ones until the rest fit. Concurrent first requests for one tenant
+    # share a single load, and requests holding an evicted chatbot finish with it.
+    EXTENSIONS = ('.idx', '.json', '.jsonl', '.csv')
+    TENANT_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
+    
+    def __init__(self, directory: str, memory_budget: int, factory):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.factory = factory
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._loads = SingleFlight()
+        self.loads = 0
+        self.evictions = 0
+    
+    def path(self, tenant: str) -> Optional[str]:
+        if not self.TENANT_ID.fullmatch(tenant):
+            return None
+        for extension in self.EXTENSIONS:
+            path = os.path.join(self.directory, tenant + extension)
+            if os.path.isfile(path):
+                return path
+        return None
+    
+    def get(self, tenant: str) -> FAQChatbot:
+        # Raises KeyError for a tenant without a corpus file
+        with self._lock:
+            entry = self._entries.get(tenant)
+            if entry is not None:
+                self._entries.move_to_end(tenant)
+                return entry.chatbot
+        return self._loads.run(tenant, lambda: self._load(tenant))
+    
+    def _load(self, tenant: str) -> FAQChatbot:
+        with self._lock:
+            entry = self._entries.get(tenant)
+            if entry is not None:
+                return entry.chatbot
+        path = self.path(tenant)
+        if path is None:
+            raise KeyError(tenant)
+        start = time.perf_counter()
+        chatbot = self.factory(path)
+        entry = TenantEntry(chatbot, chatbot.memory_estimate(), round(time.perf_counter() - start, 4), time.time())
+        with self._lock:
+            self._entries[tenant] = entry
+            self.loads += 1
+            used = sum(other.memory_bytes for other in self._entries.values())
+            while used > self.memory_budget and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                used -= evicted.memory_bytes
+                self.evictions += 1
+        return chatbot
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = list(self._entries.items())
+            loads, evictions = self.loads, self.evictions
+        return {
+            'loaded': len(entries),
+            'memory_mb': round(sum(entry.memory_bytes for _, entry in entries) / 2**20, 2),
+            'memory_budget_mb': round(self.memory_budget / 2**20, 2),
+            'loads': loads,
+            'evictions': evictions,
+            # Least recently used first
+            'tenants': {tenant: {'faqs': entry.chatbot.faq_count,
+                                 'memory_mb': round(entry.memory_bytes / 2**20, 2),
+                                 'load_seconds': entry.load_seconds,
+                                 'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(entry.loaded_at))}
+                        for tenant, entry in entries}
+        }
+
+def create_tenant_chatbot(path: str) -> FAQChatbot:
+    scorer = os.environ.get('FAQ_SCORER', 'weighted')
+    coalesce = os.environ.get('FAQ_COALESCE', '1') != '0'
+    if path.endswith('.idx'):
+        return FAQChatbot(index_path=path, metrics=metrics, scorer=scorer, coalesce=coalesce)
+    return FAQChatbot(load_faq_file(path), metrics=metrics, scorer=scorer, coalesce=coalesce)
+
+# FAQ_TENANTS_DIR turns on multi-tenant serving: requests naming a "tenant" are answered from that
+# tenant's corpus, within TENANT_MEMORY_MB of loaded indexes; requests without one use the default corpus
+tenants = (TenantRegistry(os.environ['FAQ_TENANTS_DIR'], int(float(os.environ.get('TENANT_MEMORY_MB', 512)) * 2**20),
+                          create_tenant_chatbot)
+           if os.environ.get('FAQ_TENANTS_DIR') else None)
+
+def tenant_chatbot(tenant) -> FAQChatbot:
+    # The chatbot for a request's tenant (None or '' for the default corpus); KeyError for an unknown tenant
+    if not tenant:
+        return chatbot_store.current.chatbot
+    if tenants is None or not isinstance(tenant, str):
+        raise KeyError(tenant)
+    return tenants.get(tenant)
+
+# FAQ_WATCH_INTERVAL=seconds polls FAQ_INDEX / FAQ_FILE and reloads when one changes
+WATCH_PATHS = [path for path in (os.environ.get('FAQ_INDEX'), os.environ.get('FAQ_FILE')) if path]
+WATCH_INTERVAL = float(os.environ.get('FAQ_WATCH_INTERVAL', 0))
+
+def start_watcher():
+    # Called by the process that serves requests, never at import: a pre-fork server imports this module
+    # in a parent that only forks, and a thread started there would not exist in the workers
+    if WATCH_INTERVAL > 0 and WATCH_PATHS:
+        chatbot_store.watch(WATCH_PATHS, WATCH_INTERVAL)
+
+@app.before_request
+def ensure_watcher():
+    start_watcher()
 
 # HTML template
 HTML_TEMPLATE = """
@@ -362,30 +1278,294 @@ HTML_TEMPLATE = """
 </html>
 """
 
+class StaticPage:
+    # A page rendered once and served from memory: identity, gzip and (with brotli installed) br
+    # bodies are compressed up front, and a matching If-None-Match gets a 304
+    def __init__(self, body: bytes, content_type: str, cache_control: str = 'public, max-age=300'):
+        self.content_type = content_type
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        self.headers = {'ETag': self.etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body)
+    
+    def respond(self, accept_encoding: str = '', if_none_match: str = '') -> Tuple[int, bytes, Dict[str, str]]:
+        # Returns (status, body, headers) for the request's Accept-Encoding and If-None-Match headers
+        if if_none_match and self._matches(if_none_match):
+            return 304, b'', dict(self.headers)
+        encoding = self._encoding(accept_encoding)
+        headers = dict(self.headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, self.bodies[encoding], headers
+    
+    def _matches(self, if_none_match: str) -> bool:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        # Weak comparison, as RFC 9110 asks for If-None-Match
+        return '*' in tags or self.etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+    
+    def _encoding(self, accept_encoding: str) -> str:
+        # Highest-q encoding we have, br over gzip on a tie; identity if none is acceptable
+        best, best_q = 'identity', 0.0
+        for part in accept_encoding.lower().split(','):
+            name, _, params = part.partition(';')
+            name, q = name.strip(), 1.0
+            if name not in self.bodies or name == 'identity':
+                continue
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    continue
+            if q > best_q or (q == best_q and q > 0 and name == 'br'):
+                best, best_q = name, q
+        return best
+
+# The index page has no per-request state, so it is rendered and compressed once at import
+with app.app_context():
+    INDEX_PAGE = StaticPage(render_template_string(HTML_TEMPLATE).encode('utf-8'), 'text/html; charset=utf-8')
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    status, body, headers = INDEX_PAGE.respond(request.headers.get('Accept-Encoding', ''),
+                                               request.headers.get('If-None-Match', ''))
+    return Response(body, status=status, headers=headers, content_type=INDEX_PAGE.content_type)
+
+# The client index of the serving chatbot, recompressed only when client_index() returns new bytes
+_client_index_page: Optional[StaticPage] = None
+
+def client_index_page() -> StaticPage:
+    # Raises ValueError when the serving chatbot uses a scorer the client cannot reproduce
+    global _client_index_page
+    body = chatbot_store.current.chatbot.client_index()
+    page = _client_index_page
+    if page is None or page.bodies['identity'] is not body:
+        # no-cache makes browsers revalidate, which is a 304 until the FAQs change
+        page = _client_index_page = StaticPage(body, 'application/json', cache_control='no-cache')
+    return page
+
+@app.route('/faq-index.json')
+def faq_index():
+    # The scoring index static_version/chatbot.html loads to answer questions in the browser
+    try:
+        page = client_index_page()
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 404
+    status, body, headers = page.respond(request.headers.get('Accept-Encoding', ''),
+                                         request.headers.get('If-None-Match', ''))
+    return Response(body, status=status, headers=headers, content_type=page.content_type)
+
+# Admission control for /chat and /chat/batch. Bodies over MAX_REQUEST_BYTES get a 413 before they are
+# read, questions are cut to MAX_QUESTION_LENGTH characters before tokenization, each client (by address)
+# gets RATE_LIMIT requests/second with bursts of RATE_LIMIT_BURST (0 turns rate limiting off), and with
+# ADMISSION_CONTROL=1 at most MAX_ACTIVE_REQUESTS run while MAX_QUEUED_REQUESTS wait up to QUEUE_TIMEOUT seconds
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', 64 * 1024))
+MAX_QUESTION_LENGTH = int(os.environ.get('MAX_QUESTION_LENGTH', 1000))
+MAX_BATCH_QUESTIONS = int(os.environ.get('MAX_BATCH_QUESTIONS', 100))
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+rate_limiter = RateLimiter(float(os.environ.get('RATE_LIMIT', 0)), float(os.environ.get('RATE_LIMIT_BURST', 20)))
+admission = AdmissionQueue(int(os.environ.get('MAX_ACTIVE_REQUESTS', 8)), int(os.environ.get('MAX_QUEUED_REQUESTS', 64)),
+                           float(os.environ.get('QUEUE_TIMEOUT', 0.5)),
+                           enabled=os.environ.get('ADMISSION_CONTROL', '0') == '1')
+
+def bounded_question(question: str) -> str:
+    # Truncated before tokenization, so preprocessing and overlap scoring see at most MAX_QUESTION_LENGTH characters
+    return question[:MAX_QUESTION_LENGTH] if isinstance(question, str) else question
+
+def rejection(message: str, status: int, retry_after: float):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def admission_controlled(validate):
+    # Rate-limited clients get a 429, bodies validate() finds fault with a 400 and a full queue a 503, all
+    # without touching the chatbot. The view is called with the parsed JSON body.
+    def decorator(view):
+        @wraps(view)
+        def admitted():
+            wait = rate_limiter.allow(request.remote_addr)
+            if wait:
+                if metrics.enabled:
+                    metrics.count_request(request.path, 429)
+                return rejection('Too many requests, please slow down', 429, wait)
+            data = request.get_json(silent=True)
+            error = validate(data)
+            if error is not None:
+                if metrics.enabled:
+                    metrics.count_request(request.path, 400)
+                return jsonify({'error': error}), 400
+            if not admission.acquire():
+                if metrics.enabled:
+                    metrics.count_request(request.path, 503)
+                return rejection('Server busy, please retry', 503, 1)
+            try:
+                return view(data)
+            finally:
+                admission.release()
+        return admitted
+    return decorator
+
+# /chat bodies may ask for runner-up questions: "suggestions": true (DEFAULT_SUGGESTIONS) or a count
+DEFAULT_SUGGESTIONS = 3
+MAX_SUGGESTIONS = 5
+
+def requested_suggestions(data: Dict) -> int:
+    # Raises ValueError when "suggestions" is neither a boolean nor a whole number
+    value = data.get('suggestions', 0)
+    if isinstance(value, bool):
+        return DEFAULT_SUGGESTIONS if value else 0
+    if not isinstance(value, int):
+        raise ValueError("suggestions must be a boolean or an integer")
+    return max(0, min(value, MAX_SUGGESTIONS))
+
+def chat_body_error(data) -> Optional[str]:
+    # Why a /chat body can never be answered, or None; shared with asgi.py, both check it before admission
+    if not isinstance(data, dict):
+        return 'Expected a JSON object'
+    question = data.get('question', '')
+    if not isinstance(question, str):
+        return 'question must be a string'
+    if not question:
+        return 'No question provided'
+    try:
+        requested_suggestions(data)
+    except ValueError as error:
+        return str(error)
+    return None
+
+def batch_body_error(data) -> Optional[str]:
+    # The same for a /chat/batch body
+    if not isinstance(data, list) or not all(isinstance(question, str) for question in data):
+        return 'Expected a JSON array of questions'
+    if len(data) > MAX_BATCH_QUESTIONS:
+        return f"At most {MAX_BATCH_QUESTIONS} questions per batch"
+    return None
 
 @app.route('/chat', methods=['POST'])
-def chat():
-    data = request.json
-    user_question = data.get('question', '')
+@admission_controlled(chat_body_error)
+def chat(data: Dict):
+    timed = metrics.enabled
+    if timed:
+        request_start = start = time.perf_counter()
+    user_question = bounded_question(data.get('question', ''))
+    suggestions = requested_suggestions(data)
+    if timed:
+        metrics.lap('parse', start)
     
-    if not user_question:
-        return jsonify({'error': 'No question provided'}), 400
+    # "tenant" in the body or the query string picks a tenant corpus
+    try:
+        chatbot = tenant_chatbot(data.get('tenant') or request.args.get('tenant'))
+    except KeyError:
+        if timed:
+            metrics.count_request('/chat', 404)
+        return jsonify({'error': 'Unknown tenant'}), 404
     
-    response = chatbot.get_response(user_question)
-    return jsonify(response)
+    # Cached responses keep their JSON bytes, so a repeated question skips serialization
+    if not timed:
+        return Response(chatbot.get_response_body(user_question, suggestions), mimetype='application/json')
+    
+    body = chatbot.get_response_body(user_question, suggestions)
+    start = time.perf_counter()
+    result = Response(body, mimetype='application/json')
+    metrics.lap('serialize', start)
+    metrics.lap('request', request_start)
+    metrics.count_request('/chat', 200)
+    return result
 
-@app.route('/health')
-def health():
-    return jsonify({
+@app.route('/chat/batch', methods=['POST'])
+@admission_controlled(batch_body_error)
+def chat_batch(questions: List[str]):
+    try:
+        chatbot = tenant_chatbot(request.args.get('tenant'))
+    except KeyError:
+        if metrics.enabled:
+            metrics.count_request('/chat/batch', 404)
+        return jsonify({'error': 'Unknown tenant'}), 404
+    
+    if metrics.enabled:
+        metrics.count_request('/chat/batch', 200)
+    return jsonify(chatbot.get_responses([bounded_question(question) for question in questions]))
+
+@app.route('/metrics')
+def metrics_route():
+    return Response(metrics.render(index_stats(chatbot_store.current.chatbot)), mimetype='text/plain; version=0.0.4')
+
+def admin_authorized(token: Optional[str]) -> bool:
+    # Admin routes are refused unless ADMIN_TOKEN is set and the X-Admin-Token header matches it.
+    # A client address is no proof of locality behind a proxy, so there is no unauthenticated fallback.
+    expected = os.environ.get('ADMIN_TOKEN')
+    if not expected or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+def reload_payload(started: bool) -> Dict:
+    return {'status': 'reloading' if started else 'already reloading', 'index': chatbot_store.health()}
+
+def apply_admin_edit(chatbot: FAQChatbot, method: str, faq_id: Optional[int], data) -> Tuple[Dict, int]:
+    # The admin FAQ edits as (payload, status), shared by the Flask routes and asgi.py. POST adds one FAQ
+    # object or an array of them in a single index commit; PUT replaces entry faq_id and DELETE removes it,
+    # leaving every other id as it was. Edits apply to the serving index only: a reload rebuilds it from FAQ_FILE.
+    if isinstance(chatbot.faq_database, MappedFAQs):
+        return {'error': 'The memory-mapped index is read-only; edit the FAQ file and reload'}, 409
+    try:
+        if method == 'POST':
+            faq_ids = chatbot.add_faqs(data if isinstance(data, list) else [data])
+            return {'ids': faq_ids, 'total_faqs': chatbot.faq_count}, 201
+        if method == 'PUT':
+            chatbot.update_faq(faq_id, data)
+            return {'id': faq_id, 'total_faqs': chatbot.faq_count}, 200
+        removed = chatbot.remove_faq(faq_id)
+    except IndexError as error:
+        return {'error': str(error)}, 404
+    except ValueError as error:
+        return {'error': str(error)}, 400
+    return {'removed': removed, 'total_faqs': chatbot.faq_count}, 200
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    if not admin_authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(reload_payload(chatbot_store.reload())), 202
+
+@app.route('/admin/faqs', methods=['POST'])
+@app.route('/admin/faqs/<int:faq_id>', methods=['PUT', 'DELETE'])
+def admin_faqs(faq_id: Optional[int] = None):
+    if not admin_authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Forbidden'}), 403
+    payload, status = apply_admin_edit(chatbot_store.current.chatbot, request.method, faq_id,
+                                       request.get_json(silent=True))
+    return jsonify(payload), status
+
+def health_payload() -> Dict:
+    chatbot = chatbot_store.current.chatbot
+    return {
         'status': 'healthy', 
         'message': 'FAQ Chatbot is running!',
-        'total_faqs': len(chatbot.faq_database)
-    })
+        'total_faqs': chatbot.faq_count,
+        'cache': chatbot.response_cache.stats(),
+        'coalescing': chatbot.flights.stats() if chatbot.flights is not None else None,
+        'admission': dict(admission.stats(), rate_limited=rate_limiter.limited),
+        'tenants': tenants.stats() if tenants is not None else None,
+        'query_log': query_log.stats() if query_log is not None else None,
+        'index': chatbot_store.health()
+    }
+
+@app.route('/health')
+def health():
+    return jsonify(health_payload())
 
 if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--query-log-report':
+        # python app.py --query-log-report queries.jsonl
+        print(json.dumps(summarize_query_log(sys.argv[2]), indent=2))
+        sys.exit(0)
+    if len(sys.argv) == 3 and sys.argv[1] == '--export-client-index':
+        # python app.py --export-client-index ../static_version/faq_index.json
+        with open(sys.argv[2], 'wb') as f:
+            f.write(chatbot_store.current.chatbot.client_index())
+        sys.exit(0)
     print(" FAQ Chatbot Server Starting...")
     print(" Features: NLP preprocessing, cosine similarity, intent matching")
     print(" Access at: http://localhost:5000")
@@ -0,0 +1,549 @@
+import argparse
+import asyncio
+import gc
+import json
+import math
+import os
+import re
+import select
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, which has no forked workers and so no shared metrics directory to lock
+    fcntl = None
+
+from app import (INDEX_PAGE, MAX_REQUEST_BYTES, WATCH_INTERVAL, WATCH_PATHS, Metrics, admin_authorized, admission,
+                 apply_admin_edit, batch_body_error, bounded_question, chat_body_error, chatbot_store,
+                 client_index_page, file_signature, health_payload, index_stats, metrics, rate_limiter,
+                 reload_payload, requested_suggestions, start_watcher, tenant_chatbot)
+
+# Scoring runs on this pool so the event loop only parses requests and writes responses
+SCORING_THREADS = int(os.environ.get('SCORING_THREADS', 4))
+# Requests beyond this many in flight (per worker process) get an immediate 503
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', 256))
+
+executor = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix='faq-scoring')
+in_flight = 0
+# Scoring admission, as in app.py: SCORING_THREADS requests score at once, and with ADMISSION_CONTROL=1 up
+# to MAX_QUEUED_REQUESTS more wait at most QUEUE_TIMEOUT seconds for a thread before getting a 503
+scoring_slots: Optional[asyncio.Semaphore] = None
+scoring = queued = shed = 0
+# Set in workers forked by serve_forked, whose parent watches the FAQ files and reloads for them
+forked_worker = False
+parent_snapshot = None
+# The parent's control socket in forked workers: admin commands go there, so the parent applies them to its
+# index and replaces every worker, instead of one worker changing only its own copy
+control_path: Optional[str] = None
+# This forked worker's uvicorn server
+worker_server = None
+# Forked workers publish their metrics snapshot as <pid>.json here every METRICS_PUBLISH_INTERVAL seconds
+# and on exit, and /metrics in any worker sums the directory. The parent folds the files of exited workers
+# into retired.json, so the counters never go backwards when workers are replaced.
+metrics_dir: Optional[str] = None
+METRICS_PUBLISH_INTERVAL = 1.0
+# After an admin edit reaches the parent, edits arriving within this many seconds join it, and the batch is
+# applied with one index share and one round of worker replacement instead of one per edit
+ADMIN_EDIT_BATCH_WINDOW = float(os.environ.get('ADMIN_EDIT_BATCH_WINDOW', 0.05))
+
+ADMIN_FAQ_PATH = re.compile(r'/admin/faqs/(\d+)')
+
+class Overloaded(Exception):
+    pass
+
+# status, body, content type and any extra headers
+Response = Tuple[int, bytes, str, Dict[str, str]]
+
+def json_response(payload, status: int = 200) -> Response:
+    return status, json.dumps(payload).encode('utf-8'), 'application/json', {}
+
+async def read_body(receive) -> Optional[bytes]:
+    # None once the body grows past MAX_REQUEST_BYTES; the rest is not read
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_REQUEST_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def score(func, *args):
+    # Raises Overloaded when admission control is on and the scoring queue is full or the wait for a
+    # scoring thread times out
+    global scoring_slots, scoring, queued, shed
+    if scoring_slots is None:
+        scoring_slots = asyncio.Semaphore(SCORING_THREADS)
+    if scoring_slots.locked():
+        if admission.enabled and queued >= admission.max_queued:
+            shed += 1
+            raise Overloaded
+        queued += 1
+        try:
+            await asyncio.wait_for(scoring_slots.acquire(), admission.timeout if admission.enabled else None)
+        except asyncio.TimeoutError:
+            shed += 1
+            raise Overloaded
+        finally:
+            queued -= 1
+    else:
+        await scoring_slots.acquire()
+    scoring += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    finally:
+        scoring -= 1
+        scoring_slots.release()
+
+@contextmanager
+def metrics_lock(exclusive: bool):
+    # Readers share the lock; the parent takes it alone while it moves an exited worker into retired.json
+    with open(os.path.join(metrics_dir, 'lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+def write_metrics_file(name: str, state: Dict):
+    # Replaced in one step, so a reader never sees a partly written file
+    path = os.path.join(metrics_dir, name)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+def publish_metrics():
+    write_metrics_file(f'{os.getpid()}.json',
+                       dict(metrics.snapshot(), index=index_stats(chatbot_store.current.chatbot)))
+
+def read_metrics_files() -> List[Dict]:
+    states = []
+    for name in os.listdir(metrics_dir):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(metrics_dir, name)) as f:
+                    states.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+    return states
+
+def retire_metrics(pid: int):
+    # Called by the parent once a worker has exited: add its counters to retired.json and drop its file.
+    # Its index stats are dropped with it; they describe only the live workers' caches.
+    path = os.path.join(metrics_dir, f'{pid}.json')
+    with metrics_lock(exclusive=True):
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        retired = Metrics()
+        for previous in read_metrics_files():
+            if previous.get('index') is None:
+                retired.absorb(previous)
+        retired.absorb(state)
+        write_metrics_file('retired.json', dict(retired.snapshot(), index=None))
+        os.unlink(path)
+
+def combined_metrics() -> str:
+    # Counters and histograms summed over every worker, past and present; cache and coalescing counters and
+    # cache entries summed over the live workers, which all serve the same index
+    publish_metrics()
+    total = Metrics(metrics.enabled)
+    index = index_stats(chatbot_store.current.chatbot)
+    index.update(hits=0, misses=0, size=0, coalesced=None if index['coalesced'] is None else 0, leaders=0)
+    with metrics_lock(exclusive=False):
+        states = read_metrics_files()
+    for state in states:
+        total.absorb(state)
+        if state.get('index') is not None:
+            for key in ('hits', 'misses', 'size', 'coalesced', 'leaders'):
+                if index[key] is not None and state['index'][key] is not None:
+                    index[key] += state['index'][key]
+    return total.render(index)
+
+async def publish_metrics_periodically():
+    while True:
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+        publish_metrics()
+
+async def handle(method: str, path: str, receive, request_headers: Dict[bytes, bytes],
+                 query: Dict[str, List[str]]) -> Response:
+    if path in ('/', '/faq-index.json') and method == 'GET':
+        try:
+            page = INDEX_PAGE if path == '/' else client_index_page()
+        except ValueError as error:
+            return json_response({'error': str(error)}, 404)
+        status, body, headers = page.respond(request_headers.get(b'accept-encoding', b'').decode('latin-1'),
+                                             request_headers.get(b'if-none-match', b'').decode('latin-1'))
+        return status, body, page.content_type, headers
+
+    if path == '/health' and method == 'GET':
+        # This worker's scoring queue in place of the Flask server's admission queue
+        return json_response(dict(health_payload(), admission={
+            'enabled': admission.enabled, 'active': scoring, 'queued': queued, 'max_active': SCORING_THREADS,
+            'max_queued': admission.max_queued,
+            'rejected': shed, 'in_flight': in_flight, 'max_in_flight': MAX_CONCURRENT_REQUESTS,
+            'rate_limited': rate_limiter.limited}))
+
+    if path == '/metrics' and method == 'GET':
+        text = combined_metrics() if metrics_dir is not None else metrics.render(index_stats(chatbot_store.current.chatbot))
+        return 200, text.encode('utf-8'), 'text/plain; version=0.0.4', {}
+
+    if path in ('/chat', '/chat/batch') and method == 'POST':
+        try:
+            return await handle_chat(path, receive, query)
+        except Overloaded:
+            status, body, content_type, _ = json_response({'error': 'Server busy, please retry'}, 503)
+            return status, body, content_type, {'Retry-After': '1'}
+
+    if path in ('/admin/reload', '/admin/faqs') or ADMIN_FAQ_PATH.fullmatch(path):
+        return await handle_admin(method, path, receive, request_headers)
+
+    if path in ('/', '/faq-index.json', '/health', '/metrics', '/chat', '/chat/batch'):
+        return json_response({'error': 'Method not allowed'}, 405)
+    return json_response({'error': 'Not found'}, 404)
+
+async def handle_admin(method: str, path: str, receive, request_headers: Dict[bytes, bytes]) -> Response:
+    # POST /admin/reload, POST /admin/faqs and PUT/DELETE /admin/faqs/<id>, as in app.py
+    faq_path = ADMIN_FAQ_PATH.fullmatch(path)
+    if method not in (('PUT', 'DELETE') if faq_path else ('POST',)):
+        return json_response({'error': 'Method not allowed'}, 405)
+    token = request_headers.get(b'x-admin-token')
+    if not admin_authorized(token.decode('latin-1') if token is not None else None):
+        return json_response({'error': 'Forbidden'}, 403)
+
+    if path == '/admin/reload':
+        command = {'command': 'reload'}
+    else:
+        body = await read_body(receive)
+        if body is None:
+            return json_response({'error': 'Request body too large'}, 413)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        command = {'command': 'edit', 'method': method, 'faq_id': int(faq_path.group(1)) if faq_path else None,
+                   'data': data}
+    # Off the scoring pool: an edit in a forked worker waits for the parent to share the new index
+    payload, status, replaced = await asyncio.get_running_loop().run_in_executor(None, run_admin_command, command)
+    if replaced:
+        # The parent has replaced this worker. It stops accepting now, before the edit is acknowledged,
+        # instead of on uvicorn's next shutdown check, so no later request reaches the old index here.
+        for server in worker_server.servers:
+            server.close()
+    return json_response(payload, status)
+
+def run_admin_command(command: Dict) -> Tuple[Dict, int, bool]:
+    # (payload, status, whether the parent replaced this worker). A single process applies admin commands
+    # itself; a forked worker sends them to the parent.
+    if control_path is None:
+        if command['command'] == 'reload':
+            return reload_payload(chatbot_store.reload()), 202, False
+        return apply_admin_edit(chatbot_store.current.chatbot, command['method'], command['faq_id'],
+                                command['data']) + (False,)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(control_path)
+            connection.sendall(json.dumps(dict(command, pid=os.getpid())).encode('utf-8') + b'\n')
+            reply = json.loads(connection.makefile('rb').readline())
+    except (OSError, ValueError):
+        return {'error': 'Server is restarting, please retry'}, 503, False
+    return reply['payload'], reply['status'], reply.get('replaced', False)
+
+async def load_tenant(tenant):
+    # First use of a tenant loads its corpus, so that runs on the scoring pool, under the same admission
+    return await score(tenant_chatbot, tenant)
+
+async def handle_chat(path: str, receive, query: Dict[str, List[str]]) -> Response:
+    timed = metrics.enabled
+    body = await read_body(receive)
+    if body is None:
+        return json_response({'error': 'Request body too large'}, 413)
+    if timed:
+        request_start = start = time.perf_counter()
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return json_response({'error': 'Invalid JSON'}, 400)
+    # Checked before loading a tenant or waiting for a scoring thread, as app.py checks before admission
+    error = chat_body_error(data) if path == '/chat' else batch_body_error(data)
+    if error is not None:
+        return json_response({'error': error}, 400)
+    tenant = (data.get('tenant') if path == '/chat' else None) or query.get('tenant', [None])[0]
+    try:
+        chatbot = await load_tenant(tenant) if tenant else chatbot_store.current.chatbot
+    except KeyError:
+        return json_response({'error': 'Unknown tenant'}, 404)
+
+    if path == '/chat':
+        user_question = bounded_question(data.get('question', ''))
+        suggestions = requested_suggestions(data)
+        if timed:
+            metrics.lap('parse', start)
+        # Cached responses keep their JSON bytes, so a repeated question skips serialization
+        body = await score(chatbot.get_response_body, user_question, suggestions)
+        if timed:
+            metrics.lap('request', request_start)
+        return 200, body, 'application/json', {}
+
+    return json_response(await score(chatbot.get_responses, [bounded_question(question) for question in data]))
+
+async def lifespan(receive, send):
+    publisher = None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if not forked_worker:
+                start_watcher()
+            if metrics_dir is not None:
+                publisher = asyncio.ensure_future(publish_metrics_periodically())
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if publisher is not None:
+                # In-flight requests are done by now; publish their counts before the parent retires this worker
+                publisher.cancel()
+                publish_metrics()
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    # ASGI serving mode for the /, /faq-index.json, /health, /metrics, /chat and /chat/batch routes of app.py
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    global in_flight
+    headers: List[Tuple[bytes, bytes]] = [(b'access-control-allow-origin', b'*')]
+    chat = scope['path'] in ('/chat', '/chat/batch')
+    # Per-client token bucket, checked before the request takes an in-flight slot
+    wait = rate_limiter.allow((scope.get('client') or ('',))[0]) if chat and scope['method'] == 'POST' else 0.0
+    if scope['method'] == 'OPTIONS':
+        # CORS preflight, matching flask_cors defaults
+        headers += [(b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+                    (b'access-control-allow-headers', b'content-type')]
+        status, body, content_type, extra = 204, b'', 'text/plain', {}
+    elif wait:
+        status, body, content_type, extra = json_response({'error': 'Too many requests, please slow down'}, 429)
+        headers.append((b'retry-after', str(max(1, math.ceil(wait))).encode('latin-1')))
+    elif in_flight >= MAX_CONCURRENT_REQUESTS:
+        status, body, content_type, extra = json_response({'error': 'Server busy, please retry'}, 503)
+        headers.append((b'retry-after', b'1'))
+    else:
+        in_flight += 1
+        try:
+            status, body, content_type, extra = await handle(scope['method'], scope['path'], receive,
+                                                             dict(scope['headers']),
+                                                             parse_qs(scope.get('query_string', b'').decode('latin-1')))
+        finally:
+            in_flight -= 1
+
+    if metrics.enabled and scope['method'] == 'POST' and chat:
+        metrics.count_request(scope['path'], status)
+    headers += [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in extra.items()]
+    headers += [(b'content-type', content_type.encode('latin-1')), (b'content-length', str(len(body)).encode('latin-1'))]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+def serve_forked(host: str, port: int, workers: int, shared_index: bool = True):
+    # Bind once in the parent and fork workers that accept on the shared socket.
+    # Accepted sockets inherit TCP_NODELAY, so small JSON responses are not held back by Nagle.
+    # The parent serves no requests. It owns the index, runs the FAQ_WATCH_INTERVAL watcher and applies
+    # the admin commands workers send over a Unix control socket: after a reload or an edit it shares the
+    # index again and replaces the workers with new forks, so every worker serves the new index (a thread
+    # started before the fork would not exist in them, and a worker changing its own copy changes only one).
+    # Edits arriving within ADMIN_EDIT_BATCH_WINDOW of each other share one index share and one replacement.
+    global metrics_dir
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+
+    control_dir = tempfile.mkdtemp(prefix='faq-control-')
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    control.bind(os.path.join(control_dir, 'control.sock'))
+    control.listen(64)
+    # Inherited by the workers
+    metrics_dir = os.path.join(control_dir, 'metrics')
+    os.mkdir(metrics_dir)
+
+    class WorkerServer(uvicorn.Server):
+        async def shutdown(self, sockets=None):
+            # uvicorn closes connections that have not sent a request yet when it shuts down. A retired worker
+            # stops accepting first and gives connections it accepted just before a moment to send theirs.
+            for server in self.servers:
+                server.close()
+            await asyncio.sleep(0.2)
+            await super().shutdown(sockets)
+
+    def spawn() -> List[int]:
+        global forked_worker, parent_snapshot, control_path, worker_server
+        # The parent builds the index once; workers inherit it read-only
+        served = chatbot_store.share_index() if shared_index else chatbot_store.current
+        # Keep the collector from touching (and so copying) every inherited object in each worker
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        pids = []
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                forked_worker = True
+                control_path = control.getsockname()
+                control.close()
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                # Keep the parent's snapshot referenced: freeing it here would write to every shared page it uses
+                parent_snapshot, chatbot_store.current = chatbot_store.current, served
+                worker_server = WorkerServer(uvicorn.Config(app, log_level='warning'))
+                try:
+                    worker_server.run(sockets=[sock])
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        return pids
+
+    def terminate(pids: List[int]):
+        # uvicorn stops accepting and finishes its in-flight requests before exiting
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def wait_for_exit(pids: List[int], timeout: float):
+        # Wait up to timeout for retired workers to exit, so none of them still accepts connections
+        deadline = time.monotonic() + timeout
+        pending = list(pids)
+        while pending and time.monotonic() < deadline:
+            for pid in list(pending):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        pending.remove(pid)
+                        retire_metrics(pid)
+                except ChildProcessError:
+                    pending.remove(pid)
+            time.sleep(0.01)
+
+    def reply(connection, payload, status: int, replaced: bool = False):
+        # replaced tells a worker waiting on an edit that the workers were replaced, its own included
+        try:
+            connection.sendall(json.dumps({'payload': payload, 'status': status,
+                                           'replaced': replaced}).encode('utf-8') + b'\n')
+        except OSError:
+            pass
+
+    def receive_command():
+        # The next worker's (connection, command), or None if it sent nothing readable
+        connection, _ = control.accept()
+        connection.settimeout(10)
+        try:
+            return connection, json.loads(connection.makefile('rb').readline())
+        except (OSError, ValueError):
+            connection.close()
+            return None
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    children = spawn()
+    watching = WATCH_INTERVAL > 0 and bool(WATCH_PATHS)
+    signature = file_signature(WATCH_PATHS)
+    try:
+        while children and not stopping:
+            # Waiting in short steps keeps the parent responsive to SIGTERM between polls
+            readable, _, _ = select.select([control], [], [], min(WATCH_INTERVAL, 1.0) if watching else 1.0)
+            while children:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+                if not pid:
+                    break
+                if pid in children:
+                    children.remove(pid)
+                retire_metrics(pid)
+
+            reload = False
+            edits = []
+            deadline = None
+            while readable:
+                received = receive_command()
+                if received is not None and received[1].get('command') == 'reload':
+                    # Answered at once, as in app.py; the workers are replaced once the rebuild is done
+                    with received[0]:
+                        reply(received[0], reload_payload(True), 202)
+                    reload = True
+                elif received is not None:
+                    edits.append(received)
+                    deadline = deadline or time.monotonic() + ADMIN_EDIT_BATCH_WINDOW
+                # Only an edit waits for more commands to join its batch
+                remaining = deadline - time.monotonic() if deadline is not None else 0
+                readable = select.select([control], [], [], remaining)[0] if remaining > 0 else []
+            if edits:
+                results = [apply_admin_edit(chatbot_store.current.chatbot, command.get('method'),
+                                            command.get('faq_id'), command.get('data')) for _, command in edits]
+                replaced = any(status < 300 for _, status in results)
+                if replaced:
+                    # Replace the workers before answering, so requests after the replies see the edits.
+                    # The workers waiting for these replies close their listeners themselves; a retired worker
+                    # that is itself waiting on the parent is only waited for up to the timeout.
+                    editors = {command.get('pid') for _, command in edits}
+                    retired, children = children, spawn()
+                    terminate(retired)
+                    wait_for_exit([pid for pid in retired if pid not in editors], 2.0)
+                for (connection, _), (payload, status) in zip(edits, results):
+                    with connection:
+                        reply(connection, payload, status, replaced)
+            if watching and file_signature(WATCH_PATHS) != signature:
+                reload = True
+            if reload:
+                signature = file_signature(WATCH_PATHS)
+                if chatbot_store.rebuild():
+                    retired, children = children, spawn()
+                    terminate(retired)
+    finally:
+        terminate(children)
+        while True:
+            try:
+                os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+        control.close()
+        shutil.rmtree(control_dir, ignore_errors=True)
+
+def main():
+    # Production launcher: N worker processes, each running this ASGI app under uvicorn
+    global SCORING_THREADS, MAX_CONCURRENT_REQUESTS, executor
+    parser = argparse.ArgumentParser(description="Serve the FAQ chatbot over ASGI")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--scoring-threads', type=int, default=SCORING_THREADS, help="scoring threads per worker")
+    parser.add_argument('--max-concurrent-requests', type=int, default=MAX_CONCURRENT_REQUESTS,
+                        help="in-flight requests per worker before answering 503")
+    parser.add_argument('--no-shared-index', action='store_true',
+                        help="let each forked worker keep its own in-memory copy of the index")
+    args = parser.parse_args()
+
+    SCORING_THREADS, MAX_CONCURRENT_REQUESTS = args.scoring_threads, args.max_concurrent_requests
+    executor = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix='faq-scoring')
+
+    print(f" FAQ Chatbot ASGI server on http://{args.host}:{args.port} with {args.workers} workers")
+    if hasattr(os, 'fork'):
+        serve_forked(args.host, args.port, args.workers, shared_index=not args.no_shared_index)
+    else:
+        import uvicorn
+        uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+QUESTIONS = [
+    "How do I reset my password?",
+    "What are your business hours?",
+    "How can I contact support?",
+    "Do you offer refunds?",
+    "How long does shipping take?",
+    "Can I change my order?",
+    "Where is my package?",
+    "Is my payment secure?",
+    "forgot my login",
+    "tell me about the weather on mars",
+]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def run_load(host: str, port: int, concurrency: int, duration: float, path: str = '/chat',
+             questions: List[str] = QUESTIONS, keep_alive: bool = True, back_off: bool = False) -> Dict:
+    # Each client thread holds one keep-alive connection (or opens one per request) and posts
+    # questions in a closed loop; path '/' instead fetches the index page, accepting gzip and br
+    latencies: List[float] = []
+    ok_latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = [0]
+    lock = threading.Lock()
+    page = path == '/'
+    headers = {'Accept-Encoding': 'gzip, br'} if page else {'Content-Type': 'application/json'}
+    if not keep_alive:
+        headers['Connection'] = 'close'
+    deadline = time.perf_counter() + duration
+
+    def client(seed: int):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        local_latencies, local_ok_latencies, local_statuses, local_errors = [], [], {}, 0
+        while time.perf_counter() < deadline:
+            body = None if page else json.dumps({'question': rng.choice(questions)})
+            start = time.perf_counter()
+            try:
+                connection.request('GET' if page else 'POST', path, body, headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                continue
+            local_latencies.append(time.perf_counter() - start)
+            if response.status == 200:
+                local_ok_latencies.append(local_latencies[-1])
+            local_statuses[response.status] = local_statuses.get(response.status, 0) + 1
+            if not keep_alive or response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+            if back_off and response.status in (429, 503):
+                # A well-behaved client waits as told (capped so the run still ends on time)
+                time.sleep(min(float(response.getheader('Retry-After', 1)), max(0.0, deadline - time.perf_counter())))
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            ok_latencies.extend(local_ok_latencies)
+            errors[0] += local_errors
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ok_latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'statuses': statuses,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'ok_p99_ms': percentile(ok_latencies, 0.99) * 1000,
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_health(port: int, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not become healthy")
+
+def server_cpu_seconds(pid: int) -> Optional[float]:
+    # User + system CPU time of a server process and its forked workers, from /proc (None elsewhere)
+    total, found = 0.0, False
+    ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return None
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as handle:
+                fields = handle.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(entry) == pid or int(fields[1]) == pid:
+            total += (int(fields[11]) + int(fields[12])) / ticks
+            found = True
+    return total if found else None
+
+def start_server(kind: str, port: int, workers: int, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    if kind == 'flask':
+        # The current server: app.py's development server, without the reloader
+        command = [sys.executable, '-c', f"import app; app.app.run(host='127.0.0.1', port={port})"]
+    else:
+        command = [sys.executable, 'asgi.py', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)]
+    return subprocess.Popen(command, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            env=dict(os.environ, **(env or {})))
+
+def print_row(name: str, result: Dict):
+    cpu = f"{result['cpu_ms']:.3f}" if result.get('cpu_ms') is not None else '-'
+    print(f"{name:>18} {result['requests']:>9} {result['rps']:>9.0f} {result['p50_ms']:>8.2f} "
+          f"{result['p99_ms']:>8.2f} {result['errors'] + sum(c for s, c in result['statuses'].items() if s != 200):>7} "
+          f"{cpu:>10}")
+
+def write_overload_corpus(path: str, size: int = 5000, vocabulary_size: int = 500, seed: int = 3) -> List[str]:
+    # FAQs over a small vocabulary, so every word is common and a question scores ~1000 candidates
+    # (several ms, like a large production corpus); returns distinct questions that mostly miss the cache
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 9))) for _ in range(vocabulary_size)]
+    faqs = [{'question': 'How do I ' + ' '.join(rng.sample(vocabulary, 6)) + '?', 'answer': f'Answer {i}.',
+             'keywords': rng.sample(vocabulary, 8)} for i in range(size)]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(faqs, f)
+    return [' '.join(rng.sample(vocabulary, 12)) for _ in range(20000)]
+
+def run_overload(levels: List[int], duration: float, workers: int):
+    # Both servers on a corpus where scoring dominates, at rising client counts, with admission control
+    # on (ADMISSION_CONTROL=1 at its default limits) and off. Shedding keeps the p99 of answered requests
+    # near the queue timeout; without it latency grows with the number of clients. Clients honor Retry-After.
+    import tempfile
+    corpus = os.path.join(tempfile.mkdtemp(prefix='faq-overload-'), 'faqs.json')
+    questions = write_overload_corpus(corpus)
+    unlimited = {'ADMISSION_CONTROL': '0', 'MAX_CONCURRENT_REQUESTS': '1000000'}
+    print(f"{'server':>18} {'admission':>10} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'200 p99':>8} {'shed':>6}")
+    for name, kind in (('flask dev server', 'flask'), (f"asgi x{workers}", 'asgi')):
+        for admission, env in (('on', {'ADMISSION_CONTROL': '1'}), ('off', unlimited)):
+            port = free_port()
+            process = start_server(kind, port, workers, dict(env, FAQ_FILE=corpus))
+            try:
+                wait_for_health(port)
+                for clients in levels:
+                    result = run_load('127.0.0.1', port, clients, duration, questions=questions, back_off=True)
+                    shed = sum(count for status, count in result['statuses'].items() if status in (429, 503))
+                    print(f"{name:>18} {admission:>10} {clients:>8} {result['rps']:>9.0f} {result['p50_ms']:>8.2f} "
+                          f"{result['p99_ms']:>8.2f} {result['ok_p99_ms']:>8.2f} {shed / max(1, result['requests']):>6.0%}")
+            finally:
+                process.terminate()
+                process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the FAQ chatbot /chat endpoint")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32, help="client threads")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per run")
+    parser.add_argument('--path', default='/chat', choices=['/chat', '/'], help="route to load")
+    parser.add_argument('--compare', action='store_true',
+                        help="start the Flask development server and the ASGI server and load test both")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="ASGI worker processes for --compare")
+    parser.add_argument('--overload', type=int, nargs='+', metavar='CLIENTS',
+                        help="load the Flask and ASGI servers at these client counts with and without admission control")
+    args = parser.parse_args()
+
+    if args.overload:
+        run_overload(args.overload, args.duration, args.workers)
+        return
+
+    print(f"{'server':>18} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'non-200':>7} {'cpu ms/req':>10}")
+    if not args.compare:
+        print_row(f"{args.host}:{args.port}", run_load(args.host, args.port, args.concurrency, args.duration, args.path))
+        return
+
+    servers = [('flask dev server', 'flask', 1), (f"asgi x{args.workers}", 'asgi', args.workers)]
+    for name, kind, workers in servers:
+        port = free_port()
+        process = start_server(kind, port, workers)
+        try:
+            wait_for_health(port)
+            # Server CPU (not the load generator's) spent per request during the run
+            cpu_before = server_cpu_seconds(process.pid)
+            result = run_load('127.0.0.1', port, args.concurrency, args.duration, args.path)
+            cpu_after = server_cpu_seconds(process.pid)
+            if cpu_before is not None and cpu_after is not None and result['requests']:
+                result['cpu_ms'] = (cpu_after - cpu_before) * 1000 / result['requests']
+            print_row(name, result)
+        finally:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from loadtest import free_port, run_load, wait_for_health
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def write_corpus(path: str, size: int, seed: int = 42) -> List[str]:
+    # Synthetic FAQs over a vocabulary twice the corpus size; returns queries built from its words
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(size * 2)]
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(size):
+            f.write(json.dumps({
+                'question': "How do I " + ' '.join(rng.sample(vocabulary, 6)) + "?",
+                'answer': f"Synthetic answer number {i}.",
+                'keywords': rng.sample(vocabulary, 8)
+            }) + '\n')
+    return [' '.join(rng.sample(vocabulary, 3)) for _ in range(10000)]
+
+def child_pids(parent: int) -> List[int]:
+    pids = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may contain spaces, so split after its closing parenthesis
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == parent:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return pids
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    # Rss counts shared pages in every process; Pss splits them between sharers; Private is unique to pid
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': fields['Rss'],
+        'pss': fields['Pss'],
+        'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+def measure(corpus_path: str, queries: List[str], workers: int, shared_index: bool, warmup: float) -> Dict:
+    import subprocess
+
+    port = free_port()
+    command = [sys.executable, 'asgi.py', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)]
+    if not shared_index:
+        command.append('--no-shared-index')
+    env = dict(os.environ, FAQ_FILE=corpus_path)
+    env.pop('FAQ_INDEX', None)
+    process = subprocess.Popen(command, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_health(port, timeout=600)
+        # Serve traffic so every worker touches the index the way it would in production;
+        # a connection per request spreads the requests over all workers
+        run_load('127.0.0.1', port, concurrency=workers * 2, duration=warmup, questions=queries, keep_alive=False)
+        time.sleep(0.5)
+        processes = [process.pid] + child_pids(process.pid)
+        usage = [memory_kb(pid) for pid in processes]
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        'workers': workers,
+        'shared_index': shared_index,
+        'total_rss_mb': sum(u['rss'] for u in usage) / 1024,
+        'total_pss_mb': sum(u['pss'] for u in usage) / 1024,
+        'worker_private_mb': sum(u['private'] for u in usage[1:]) / len(usage[1:]) / 1024
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pre-fork memory use with and without the shared index")
+    parser.add_argument('--faqs', type=int, default=100000, help="synthetic corpus size")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--warmup', type=float, default=10.0, help="seconds of load before measuring")
+    args = parser.parse_args()
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        sys.exit("memory_benchmark.py needs Linux /proc/<pid>/smaps_rollup")
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus_path = os.path.join(directory, 'faqs.jsonl')
+        queries = write_corpus(corpus_path, args.faqs)
+
+        print(f"{args.faqs} FAQs; totals include the parent process")
+        print(f"{'index':>8} {'workers':>8} {'total RSS MB':>13} {'total PSS MB':>13} {'private/worker MB':>18}")
+        results = {}
+        for shared_index in (False, True):
+            for workers in args.workers:
+                result = measure(corpus_path, queries, workers, shared_index, args.warmup)
+                results[shared_index, workers] = result
+                print(f"{'shared' if shared_index else 'heap':>8} {workers:>8} {result['total_rss_mb']:>13.1f} "
+                      f"{result['total_pss_mb']:>13.1f} {result['worker_private_mb']:>18.1f}")
+
+        if len(args.workers) > 1:
+            low, high = min(args.workers), max(args.workers)
+            for shared_index in (False, True):
+                growth = results[shared_index, high]['total_pss_mb'] - results[shared_index, low]['total_pss_mb']
+                print(f"{'shared' if shared_index else 'heap':>8}: {growth / (high - low):.1f} MB PSS per extra worker")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,629 @@
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import re
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Dict, Optional, Callable
+
+from faq_chatbot import FAQChatbot, SemanticIndex, np
+from faq_core import FuzzyIndex, TextPreprocessor
+
+
+def generate_corpus(size: int, vocabulary_size: int, keywords_per_faq: int = 8,
+                    words_per_question: int = 6, seed: int = 42) -> List[Dict]:
+    """Generate a synthetic FAQ corpus drawn from a random vocabulary"""
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+                  for _ in range(vocabulary_size)]
+
+    corpus = []
+    for i in range(size):
+        words = rng.sample(vocabulary, words_per_question)
+        corpus.append({
+            "question": "How do I " + ' '.join(words) + "?",
+            "answer": f"Synthetic answer number {i}.",
+            "keywords": rng.sample(vocabulary, keywords_per_faq)
+        })
+    return corpus
+
+
+def generate_queries(corpus: List[Dict], count: int, seed: int = 7) -> List[str]:
+    """Generate queries by mixing words from random FAQ questions"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        faq = rng.choice(corpus)
+        words = faq['question'].rstrip('?').split()[3:] + faq['keywords']
+        queries.append(' '.join(rng.sample(words, 3)))
+    return queries
+
+
+def generate_workload(corpus: List[Dict], kind: str, count: int, seed: int = 11) -> List[str]:
+    """
+    Generate a query workload of one kind:
+    hits (words of one FAQ), repeats (a small pool of hits asked over and
+    over), misses (words outside the vocabulary) and long (40-word queries
+    around a few FAQ words)
+    """
+    rng = random.Random(seed)
+    if kind == 'hits':
+        return generate_queries(corpus, count, seed)
+    if kind == 'repeats':
+        pool = generate_queries(corpus, max(1, count // 20), seed)
+        return [rng.choice(pool) for _ in range(count)]
+    if kind == 'misses':
+        # Generated vocabulary words are at most 10 letters long
+        return [' '.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(11, 14))) for _ in range(3))
+                for _ in range(count)]
+    if kind == 'long':
+        filler = [word for faq in rng.sample(corpus, min(len(corpus), 50)) for word in faq['keywords']]
+        return [' '.join(rng.sample(filler, 37)) + ' ' + query for query in generate_queries(corpus, count, seed)]
+    raise ValueError(f"Unknown workload: {kind}")
+
+
+WORKLOADS = ('hits', 'repeats', 'misses', 'long')
+
+
+def set_cosine(words1: List[str], words2: List[str]) -> float:
+    """Cosine similarity of two token lists taken as sets"""
+    if not words1 or not words2:
+        return 0.0
+    set1, set2 = set(words1), set(words2)
+    return len(set1 & set2) / (math.sqrt(len(set1)) * math.sqrt(len(set2)))
+
+
+def set_jaccard(words1: List[str], words2: List[str]) -> float:
+    """Jaccard similarity of two token lists taken as sets"""
+    if not words1 or not words2:
+        return 0.0
+    set1, set2 = set(words1), set(words2)
+    return len(set1 & set2) / len(set1 | set2)
+
+
+def substring_overlap(user_words: List[str], keywords: List[str]) -> float:
+    """Share of the question's words that contain, or are contained in, a raw keyword"""
+    if not user_words:
+        return 0.0
+    return sum(any(word in keyword or keyword in word for keyword in keywords) for word in user_words) / len(user_words)
+
+
+def reference_score(user_words: List[str], faq: Dict) -> float:
+    """The 'weighted' final score of one FAQ, computed from its token lists without any index"""
+    return (
+        set_cosine(user_words, faq['processed_keywords']) * 0.3 +
+        set_cosine(user_words, faq['processed_question']) * 0.25 +
+        set_jaccard(user_words, faq['processed_keywords']) * 0.25 +
+        substring_overlap(user_words, faq['keywords']) * 0.2
+    )
+
+
+def full_scan_best_match(chatbot: FAQChatbot, user_question: str) -> Optional[Dict]:
+    """Reference implementation scoring every FAQ in the database"""
+    user_words = chatbot._preprocess_text(user_question)
+    if not user_words:
+        return None
+
+    best_match = None
+    highest_score = 0.0
+    for faq in chatbot.faq_database:
+        final_score = reference_score(user_words, faq)
+        if final_score > highest_score:
+            highest_score = final_score
+            best_match = {**faq, 'confidence': round(final_score * 100, 2)}
+
+    return best_match if highest_score > 0.15 else None
+
+
+def dict_layout_best_match(chatbot: FAQChatbot, user_question: str) -> Optional[Dict]:
+    """Score index candidates from the list-of-dicts layout, rebuilding sets per FAQ"""
+    user_words = chatbot._preprocess_text(user_question)
+    if not user_words:
+        return None
+
+    best_match = None
+    highest_score = 0.0
+    for faq_id, *_ in chatbot._find_candidates(user_words):
+        faq = chatbot.faq_database[faq_id]
+        final_score = reference_score(user_words, faq)
+        if final_score > highest_score:
+            highest_score = final_score
+            best_match = {**faq, 'confidence': round(final_score * 100, 2)}
+
+    return best_match if highest_score > 0.15 else None
+
+
+def deep_size(obj, seen: Optional[set] = None) -> int:
+    """Approximate deep memory footprint of an object graph in bytes"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_size(getattr(obj, slot), seen) for slot in obj.__slots__)
+    return size
+
+
+def legacy_preprocess_text(text: str) -> List[str]:
+    """The original per-call preprocessing: uncompiled re.sub, two passes, stop words rebuilt"""
+    text = re.sub(r'[^\w\s]', ' ', text.lower())
+    words = [word for word in text.split() if len(word) > 2]
+    stop_words = {'the', 'and', 'are', 'you', 'for', 'can', 'how', 'what', 'where', 'when', 'why', 'with', 'this', 'that'}
+    return [word for word in words if word not in stop_words]
+
+
+def _time_per_query(func, queries: List[str]) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        func(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def latency_stats(func: Callable, queries: List[str]) -> Dict:
+    """Call func once per query and summarize per-call latency"""
+    # Start every run from a collected heap so one run's garbage does not pause the next
+    gc.collect()
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        call_start = time.perf_counter()
+        func(query)
+        latencies.append(time.perf_counter() - call_start)
+    total = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(fraction):
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 4)
+
+    return {
+        'queries': len(queries),
+        'throughput_qps': round(len(queries) / total, 1),
+        'mean_ms': round(total / len(queries) * 1000, 4),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def resident_memory_mb() -> Optional[float]:
+    """Current resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def load_flask_app():
+    """Import flask_web_app/app.py, or return None when Flask is not installed"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask_web_app'))
+    try:
+        import app as flask_app
+    except ImportError:
+        return None
+    finally:
+        sys.path.pop(0)
+    return flask_app
+
+
+def run_suite(sizes: List[int], queries_per_workload: int = 1000, vocabulary_ratio: float = 2.0,
+              keywords_per_faq: int = 8, flask: bool = True) -> Dict:
+    """
+    Build a chatbot per corpus size and measure build time, memory and
+    find_best_match / get_response / Flask /chat latency on every workload
+    """
+    flask_app = load_flask_app() if flask else None
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'commit': _git_commit(),
+            'queries_per_workload': queries_per_workload,
+            'vocabulary_ratio': vocabulary_ratio,
+            'keywords_per_faq': keywords_per_faq,
+        },
+        'sizes': {}
+    }
+
+    for size in sizes:
+        corpus = generate_corpus(size, vocabulary_size=max(1, int(size * vocabulary_ratio)),
+                                 keywords_per_faq=keywords_per_faq)
+        workloads = {kind: generate_workload(corpus, kind, queries_per_workload) for kind in WORKLOADS}
+
+        rss_before = resident_memory_mb()
+        start = time.perf_counter()
+        chatbot = FAQChatbot(corpus)
+        build_s = time.perf_counter() - start
+        rss_after = resident_memory_mb()
+
+        entry = {
+            'build_s': round(build_s, 4),
+            'memory_mb': round(rss_after - rss_before, 1) if rss_before is not None else None,
+            'find_best_match': {},
+            'get_response': {},
+        }
+        for kind, queries in workloads.items():
+            entry['find_best_match'][kind] = latency_stats(chatbot.find_best_match, queries)
+            chatbot.response_cache.clear()
+            entry['get_response'][kind] = latency_stats(chatbot.get_response, queries)
+
+        if flask_app is not None:
+            # The route in-process through Flask's test client, serving this corpus
+            store = flask_app.chatbot_store
+            store.current = store.current._replace(chatbot=flask_app.FAQChatbot([dict(faq) for faq in corpus]))
+            client = flask_app.app.test_client()
+            entry['flask_chat'] = {}
+            for kind, queries in workloads.items():
+                store.current.chatbot.response_cache.clear()
+                entry['flask_chat'][kind] = latency_stats(
+                    lambda query: client.post('/chat', json={'question': query}), queries)
+            store.current = store.current._replace(chatbot=None)
+
+        results['sizes'][str(size)] = entry
+        del chatbot
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_suite(results: Dict):
+    """Print a suite result as tables"""
+    for size, entry in results['sizes'].items():
+        memory = f"{entry['memory_mb']} MB" if entry['memory_mb'] is not None else "n/a"
+        print(f"\n{size} FAQs: build {entry['build_s']:.3f} s, memory {memory}")
+        print(f"{'target':>16} {'workload':>9} {'qps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for target in ('find_best_match', 'get_response', 'flask_chat'):
+            for kind, stats in entry.get(target, {}).items():
+                print(f"{target:>16} {kind:>9} {stats['throughput_qps']:>9.0f} {stats['p50_ms']:>8.3f} "
+                      f"{stats['p95_ms']:>8.3f} {stats['p99_ms']:>8.3f}")
+
+
+def compare_suites(baseline: Dict, current: Dict, tolerance: float = 0.10) -> List[str]:
+    """List p50/p99 latencies and build times that regressed by more than tolerance"""
+    regressions = []
+    for size, entry in current['sizes'].items():
+        base = baseline['sizes'].get(size)
+        if base is None:
+            continue
+        if entry['build_s'] > base['build_s'] * (1 + tolerance):
+            regressions.append(f"{size} FAQs build_s: {base['build_s']} -> {entry['build_s']}")
+        for target in ('find_best_match', 'get_response', 'flask_chat'):
+            for kind, stats in entry.get(target, {}).items():
+                base_stats = base.get(target, {}).get(kind)
+                if base_stats is None:
+                    continue
+                for metric in ('p50_ms', 'p99_ms'):
+                    if stats[metric] > base_stats[metric] * (1 + tolerance):
+                        regressions.append(f"{size} FAQs {target} {kind} {metric}: "
+                                           f"{base_stats[metric]} -> {stats[metric]}")
+    return regressions
+
+
+def benchmark_index_scaling(sizes: List[int], queries_per_size: int = 50):
+    """
+    Compare indexed retrieval with a full scan as the corpus grows.
+    The vocabulary grows with the corpus, so posting lists stay roughly
+    the same length and indexed latency should stay flat.
+    """
+    print(f"{'faqs':>8} {'candidates':>11} {'indexed ms':>11} {'full scan ms':>13} {'speedup':>8}")
+    for size in sizes:
+        corpus = generate_corpus(size, vocabulary_size=size * 2)
+        chatbot = FAQChatbot(corpus)
+        queries = generate_queries(corpus, queries_per_size)
+
+        for query in queries:
+            indexed = chatbot.find_best_match(query)
+            reference = full_scan_best_match(chatbot, query)
+            assert (indexed and indexed['question']) == (reference and reference['question'])
+            assert (indexed and indexed['confidence']) == (reference and reference['confidence'])
+
+        candidates = sum(len(chatbot._find_candidates(chatbot._preprocess_text(q))) for q in queries) / len(queries)
+        indexed_ms = _time_per_query(chatbot.find_best_match, queries)
+        full_ms = _time_per_query(lambda q: full_scan_best_match(chatbot, q), queries)
+        print(f"{size:>8} {candidates:>11.1f} {indexed_ms:>11.3f} {full_ms:>13.3f} {full_ms / indexed_ms:>7.1f}x")
+
+
+def benchmark_record_layout(size: int = 20000, queries_per_size: int = 1000):
+    """Compare FAQRecord scoring data with the list-of-dicts layout"""
+    corpus = generate_corpus(size, vocabulary_size=size * 2)
+    chatbot = FAQChatbot(corpus)
+    queries = generate_queries(corpus, queries_per_size)
+
+    dict_layout = [{key: faq[key] for key in ('processed_question', 'processed_keywords', 'keywords')}
+                   for faq in chatbot.faq_database]
+    dict_bytes = deep_size(dict_layout)
+    record_bytes = deep_size(chatbot.records) + deep_size(chatbot.vocabulary)
+
+    dict_qps = 1000 / _time_per_query(lambda q: dict_layout_best_match(chatbot, q), queries)
+    record_qps = 1000 / _time_per_query(chatbot.find_best_match, queries)
+
+    print(f"{'layout':>14} {'memory MB':>10} {'queries/s':>10}")
+    print(f"{'list of dicts':>14} {dict_bytes / 2**20:>10.2f} {dict_qps:>10.0f}")
+    print(f"{'FAQRecord':>14} {record_bytes / 2**20:>10.2f} {record_qps:>10.0f}")
+
+
+def benchmark_engines(size: int = 20000, queries_per_size: int = 1000):
+    """Compare the pure-Python candidate loop with the sparse engine on one batch"""
+    corpus = generate_corpus(size, vocabulary_size=size * 2)
+    python_bot = FAQChatbot([dict(faq) for faq in corpus], engine='python')
+    sparse_bot = FAQChatbot([dict(faq) for faq in corpus], engine='sparse')
+    if sparse_bot.engine is None:
+        print("NumPy/SciPy not installed, skipping")
+        return
+
+    queries = [python_bot._preprocess_text(q) for q in generate_queries(corpus, queries_per_size)]
+    start = time.perf_counter()
+    expected = [python_bot._score_candidates(words) for words in queries]
+    python_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = sparse_bot.engine.best_matches(queries)
+    sparse_s = time.perf_counter() - start
+    assert results == expected
+
+    print(f"{'engine':>14} {'queries/s':>10}")
+    print(f"{'python loop':>14} {len(queries) / python_s:>10.0f}")
+    print(f"{'sparse batch':>14} {len(queries) / sparse_s:>10.0f}")
+
+
+def benchmark_preprocessing(size: int = 50000):
+    """Compare tokens/sec of the legacy preprocessing with TextPreprocessor"""
+    corpus = generate_corpus(size, vocabulary_size=size)
+    questions = [faq['question'] for faq in corpus]
+    keywords = [keyword for faq in corpus for keyword in faq['keywords']]
+
+    pipelines = [
+        ('legacy', legacy_preprocess_text),
+        ('compiled', TextPreprocessor()),
+        ('memoized', TextPreprocessor(memo_size=size * 8).cached),
+    ]
+    print(f"{'pipeline':>10} {'question tok/s':>15} {'keyword tok/s':>14}")
+    for name, preprocess in pipelines:
+        start = time.perf_counter()
+        question_tokens = sum(len(preprocess(question)) for question in questions)
+        question_s = time.perf_counter() - start
+
+        # Keywords are preprocessed twice, like the original _preprocess_database did
+        start = time.perf_counter()
+        keyword_tokens = sum(len(preprocess(keyword)) + len(preprocess(keyword)) for keyword in keywords)
+        keyword_s = time.perf_counter() - start
+        print(f"{name:>10} {question_tokens / question_s:>15.0f} {keyword_tokens / keyword_s:>14.0f}")
+
+
+def benchmark_cold_start(sizes: List[int], queries_per_size: int = 200):
+    """Compare preprocessing the corpus at startup with memory-mapping a compiled index"""
+    print(f"{'faqs':>8} {'build s':>9} {'mmap load s':>12} {'mmap query ms':>14} {'index MB':>9}")
+    for size in sizes:
+        corpus = generate_corpus(size, vocabulary_size=size * 2)
+        queries = generate_queries(corpus, queries_per_size)
+
+        start = time.perf_counter()
+        chatbot = FAQChatbot(corpus)
+        build_s = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'faqs.idx')
+            chatbot.write_index(path)
+
+            start = time.perf_counter()
+            mapped = FAQChatbot(index_path=path, cache_size=0)
+            load_s = time.perf_counter() - start
+
+            query_ms = _time_per_query(mapped.find_best_match, queries)
+            print(f"{size:>8} {build_s:>9.3f} {load_s:>12.4f} {query_ms:>14.3f} {os.path.getsize(path) / 2**20:>9.1f}")
+            del mapped
+
+
+def benchmark_fuzzy(sizes: List[int], words_per_size: int = 500):
+    """Measure FuzzyIndex build time and correction latency for misspelled vocabulary words"""
+    print(f"{'faqs':>8} {'vocabulary':>11} {'build s':>8} {'lookup ms':>10} {'corrected':>10}")
+    rng = random.Random(5)
+    for size in sizes:
+        chatbot = FAQChatbot(generate_corpus(size, vocabulary_size=size * 2))
+        tokens = list(chatbot.vocabulary)
+
+        start = time.perf_counter()
+        FuzzyIndex(tokens)
+        build_s = time.perf_counter() - start
+
+        # Drop one character from words long enough to be corrected
+        words = rng.sample([token for token in tokens if len(token) >= 5], words_per_size)
+        misspelled = []
+        for word in words:
+            position = rng.randrange(len(word))
+            misspelled.append(word[:position] + word[position + 1:])
+        start = time.perf_counter()
+        corrected = [chatbot._correct_word(word) for word in misspelled]
+        lookup_ms = (time.perf_counter() - start) / len(misspelled) * 1000
+        recovered = sum(fixed == word for fixed, word in zip(corrected, words)) / len(words)
+        print(f"{size:>8} {len(tokens):>11} {build_s:>8.2f} {lookup_ms:>10.3f} {recovered:>9.0%}")
+
+
+def generate_topical_corpus(size: int, words_per_topic: int = 10, seed: int = 42) -> List[Dict]:
+    """
+    Generate a synthetic corpus whose questions cluster by topic, like real
+    FAQs grouped around product areas: four words from one of sqrt(size)
+    topic vocabularies and two from a shared random vocabulary
+    """
+    rng = random.Random(seed)
+    topic_count = max(1, int(size ** 0.5))
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+             for _ in range(topic_count * words_per_topic + size)]
+    topics = [words[t * words_per_topic:(t + 1) * words_per_topic] for t in range(topic_count)]
+    shared = words[topic_count * words_per_topic:]
+
+    corpus = []
+    for i in range(size):
+        question = rng.sample(rng.choice(topics), 4) + rng.sample(shared, 2)
+        corpus.append({
+            "question": "How do I " + ' '.join(question) + "?",
+            "answer": f"Synthetic answer number {i}.",
+            "keywords": question[:3]
+        })
+    return corpus
+
+
+def benchmark_semantic(sizes: List[int], queries_per_size: int = 300):
+    """
+    Measure SemanticIndex build time, search latency and how often the IVF
+    search returns the exact nearest FAQ, on a topical corpus with queries
+    made of three question words of one FAQ with their last letter dropped
+    """
+    if np is None:
+        print("NumPy/SciPy not installed, skipping")
+        return
+
+    print(f"{'faqs':>8} {'build s':>8} {'search ms':>10} {'exact scan ms':>14} {'recall@1':>9}")
+    rng = random.Random(9)
+    for size in sizes:
+        corpus = generate_topical_corpus(size)
+        chatbot = FAQChatbot(corpus)
+        start = time.perf_counter()
+        index = SemanticIndex(chatbot)
+        build_s = time.perf_counter() - start
+
+        queries = [index.embed([word[:-1] for word in rng.sample(faq['question'].rstrip('?').split()[3:], 3)])
+                   for faq in rng.sample(corpus, queries_per_size)]
+        start = time.perf_counter()
+        nearest = [index.search(query, 20) for query in queries]
+        search_ms = (time.perf_counter() - start) / len(queries) * 1000
+        start = time.perf_counter()
+        exact = [int(np.argmax(index.vectors @ query)) for query in queries]
+        scan_ms = (time.perf_counter() - start) / len(queries) * 1000
+        recall = sum(best in {faq_id for faq_id, _ in found} for best, found in zip(exact, nearest)) / len(queries)
+        print(f"{size:>8} {build_s:>8.2f} {search_ms:>10.3f} {scan_ms:>14.3f} {recall:>8.0%}")
+
+
+def benchmark_coalescing(size: int = 20000, burst: int = 32, rounds: int = 20):
+    """
+    Fire bursts of one uncached question from many threads at once at the
+    Flask chatbot and compare process CPU time per request with and without
+    request coalescing
+    """
+    flask_app = load_flask_app()
+    if flask_app is None:
+        print("Flask not installed, skipping")
+        return
+
+    # A small vocabulary makes every word common, so one long question scores thousands of candidates
+    # (tens of ms, longer than the interpreter's thread switch interval, as a slow miss would be)
+    corpus = generate_corpus(size, vocabulary_size=max(1, size // 20))
+    questions = generate_workload(corpus, 'long', rounds)
+    print(f"{'coalesce':>9} {'requests':>9} {'scored':>7} {'coalesced':>10} {'cpu ms/req':>11} {'wall s':>7}")
+    for coalesce in (False, True):
+        chatbot = flask_app.FAQChatbot([dict(faq) for faq in corpus], coalesce=coalesce)
+        scored = [0]
+        compute = chatbot._compute_response
+
+        def counted(*args):
+            scored[0] += 1
+            return compute(*args)
+        chatbot._compute_response = counted
+
+        def client(barrier, question):
+            barrier.wait()
+            chatbot.get_response(question)
+
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        for question in questions:
+            # Every thread asks the round's question the moment the barrier opens
+            barrier = threading.Barrier(burst)
+            threads = [threading.Thread(target=client, args=(barrier, question)) for _ in range(burst)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        cpu_ms = (time.process_time() - cpu_start) / (burst * rounds) * 1000
+        wall_s = time.perf_counter() - wall_start
+        coalesced = chatbot.flights.stats()['coalesced'] if chatbot.flights is not None else 0
+        print(f"{str(coalesce):>9} {burst * rounds:>9} {scored[0]:>7} {coalesced:>10} {cpu_ms:>11.3f} {wall_s:>7.2f}")
+
+
+def main():
+    """Run the matcher benchmarks, or the regression suite with --suite"""
+    parser = argparse.ArgumentParser(description="FAQ matcher benchmarks")
+    parser.add_argument('--suite', action='store_true', help="run the regression suite instead of the sections")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="corpus sizes for --suite (up to 1000000)")
+    parser.add_argument('--queries', type=int, default=1000, help="queries per workload")
+    parser.add_argument('--vocabulary-ratio', type=float, default=2.0, help="vocabulary size / corpus size")
+    parser.add_argument('--keywords', type=int, default=8, help="keywords per FAQ")
+    parser.add_argument('--no-flask', action='store_true', help="skip the Flask /chat route")
+    parser.add_argument('--output', help="write the suite results as JSON to this path")
+    parser.add_argument('--baseline', help="compare against a previous --output file and exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed slowdown for --baseline")
+    args = parser.parse_args()
+
+    if args.suite:
+        results = run_suite(args.sizes, args.queries, args.vocabulary_ratio, args.keywords, flask=not args.no_flask)
+        print_suite(results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                regressions = compare_suites(json.load(f), results, args.tolerance)
+            print(f"\n{len(regressions)} regressions against {args.baseline}")
+            for regression in regressions:
+                print("  " + regression)
+            if regressions:
+                sys.exit(1)
+        return
+
+    print("Inverted index scaling")
+    print("=" * 55)
+    benchmark_index_scaling([1000, 5000, 20000])
+
+    print("\nScoring data layout (20000 FAQs)")
+    print("=" * 55)
+    benchmark_record_layout()
+
+    print("\nScoring engines (20000 FAQs, one batch of 1000 queries)")
+    print("=" * 55)
+    benchmark_engines()
+
+    print("\nText preprocessing (50000 synthetic FAQs)")
+    print("=" * 55)
+    benchmark_preprocessing()
+
+    print("\nCold start: preprocessing vs memory-mapped index")
+    print("=" * 55)
+    benchmark_cold_start([1000, 10000, 50000])
+
+    print("\nFuzzy correction of misspelled tokens")
+    print("=" * 55)
+    benchmark_fuzzy([1000, 10000, 100000])
+
+    print("\nSemantic retrieval: IVF search vs exact scan")
+    print("=" * 55)
+    benchmark_semantic([1000, 10000, 100000])
+
+    print("\nRequest coalescing: bursts of 32 identical uncached questions (20000 FAQs)")
+    print("=" * 55)
+    benchmark_coalescing()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,301 @@
-import re
 import math
-from collections import Counter
-from typing import List, Dict, Tuple, Optional
+import time
+import argparse
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappush, heapreplace, nsmallest
+from collections import Counter, deque
+from typing import List, Dict, Tuple, Optional, Iterable, Iterator, TextIO
 import json
 
-class FAQChatbot:
-    def __init__(self):
-        self.faq_database = [
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from faq_core import SCORERS, TERM_WEIGHT, OVERLAP_WEIGHT, FAQIndex, MappedStrings, TextPreprocessor, load_faq_file
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # NumPy/SciPy are optional; FAQChatbot falls back to pure Python
+    np = sparse = None
+
+# The raw scores of the 'weighted' scorer, in the order FAQChatbot._weighted_signals returns them
+WEIGHTED_SCORES = ('keyword_cosine', 'question_cosine', 'keyword_jaccard', 'word_overlap', 'final_score')
+
+class SparseScoringEngine:
+    """
+    Vectorized scorer that computes the four similarity signals for a batch
+    of queries against every FAQ at once. FAQ keyword and question tokens are
+    encoded as sparse binary token x FAQ matrices, so all intersection counts
+    for the batch come from one sparse matrix product per field. Every signal
+    is evaluated with the same floating point operations as the pure-Python
+    loop, so confidences and scores are identical.
+    """
+    
+    def __init__(self, chatbot: 'FAQChatbot'):
+        if np is None:
+            raise ImportError("The sparse scoring engine requires NumPy and SciPy")
+        
+        self.chatbot = chatbot
+        faq_count, token_count = len(chatbot.records), len(chatbot.vocabulary)
+        self.keyword_matrix = self._postings_matrix(chatbot.keyword_index, token_count, faq_count)
+        self.question_matrix = self._postings_matrix(chatbot.question_index, token_count, faq_count)
+        self.keyword_norms = np.array([record.keyword_norm for record in chatbot.records])
+        self.keyword_counts = np.array([len(record.keyword_ids) for record in chatbot.records], dtype=float)
+        self.question_norms = np.array([record.question_norm for record in chatbot.records])
+    
+    @staticmethod
+    def _postings_matrix(index: Dict[int, Iterable[int]], token_count: int, faq_count: int):
+        """Encode token -> FAQ postings as a binary CSR matrix"""
+        rows = [token_id for token_id, faq_ids in index.items() for _ in faq_ids]
+        cols = [faq_id for faq_ids in index.values() for faq_id in faq_ids]
+        return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(token_count, faq_count))
+    
+    @staticmethod
+    def _map_data(matrix, func):
+        """Return a CSR matrix with the same sparsity as matrix and data func(data, rows, cols)"""
+        rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        return sparse.csr_matrix((func(matrix.data, rows, matrix.indices), matrix.indices, matrix.indptr),
+                                 shape=matrix.shape)
+    
+    def score(self, queries: List[List[str]]) -> Dict:
+        """
+        Score preprocessed queries against every FAQ. Returns sparse
+        (query x FAQ) matrices for each signal and the weighted final score.
+        """
+        vocabulary = self.chatbot.vocabulary
+        query_rows, query_cols = [], []
+        overlap_rows, overlap_cols, overlap_counts = [], [], []
+        sizes, lengths = [], []
+        
+        for row, user_words in enumerate(queries):
+            word_counts = Counter(user_words)
+            sizes.append(len(word_counts))
+            lengths.append(len(user_words) or 1)
+            for word, count in word_counts.items():
+                token_id = vocabulary.get(word)
+                if token_id is not None:
+                    query_rows.append(row)
+                    query_cols.append(token_id)
+                for faq_id in self.chatbot._keyword_matches(word):
+                    overlap_rows.append(row)
+                    overlap_cols.append(faq_id)
+                    overlap_counts.append(count)
+        
+        shape = (len(queries), len(self.keyword_norms))
+        query_matrix = sparse.csr_matrix((np.ones(len(query_rows)), (query_rows, query_cols)),
+                                         shape=(len(queries), len(vocabulary)))
+        keyword_hits = query_matrix @ self.keyword_matrix
+        question_hits = query_matrix @ self.question_matrix
+        overlap_hits = sparse.csr_matrix((np.array(overlap_counts, dtype=float), (overlap_rows, overlap_cols)),
+                                         shape=shape)
+        
+        sizes = np.array(sizes, dtype=float)
+        norms = np.sqrt(sizes)
+        lengths = np.array(lengths, dtype=float)
+        
+        keyword_cosine = self._map_data(keyword_hits, lambda hits, rows, cols: hits / (norms[rows] * self.keyword_norms[cols]))
+        question_cosine = self._map_data(question_hits, lambda hits, rows, cols: hits / (norms[rows] * self.question_norms[cols]))
+        keyword_jaccard = self._map_data(keyword_hits, lambda hits, rows, cols: hits / (sizes[rows] + self.keyword_counts[cols] - hits))
+        word_overlap = self._map_data(overlap_hits, lambda hits, rows, cols: hits / lengths[rows])
+        
+        final_score = (
+            keyword_cosine * 0.3 +
+            question_cosine * 0.25 +
+            keyword_jaccard * 0.25 +
+            word_overlap * 0.2
+        ).tocsr()
+        final_score.sort_indices()
+        
+        return {
+            'keyword_cosine': keyword_cosine,
+            'question_cosine': question_cosine,
+            'keyword_jaccard': keyword_jaccard,
+            'word_overlap': word_overlap,
+            'final_score': final_score
+        }
+    
+    def best_matches(self, queries: List[List[str]]) -> List[Optional[Tuple[int, Dict[str, float]]]]:
+        """Return (faq_id, raw scores) of the highest scoring FAQ per query, or None"""
+        scores = self.score(queries)
+        final_score = scores['final_score']
+        
+        results = []
+        for row in range(len(queries)):
+            start, end = final_score.indptr[row], final_score.indptr[row + 1]
+            if start == end:
+                results.append(None)
+                continue
+            # Indices are sorted, so argmax keeps the earliest FAQ on ties like the Python loop
+            best = start + int(np.argmax(final_score.data[start:end]))
+            faq_id = int(final_score.indices[best])
+            results.append((faq_id, {name: float(matrix[row, faq_id]) for name, matrix in scores.items()}))
+        return results
+
+class SemanticIndex:
+    """
+    Optional semantic retrieval stage for FAQChatbot(semantic_weight=...).
+    Every FAQ question is embedded once at load time as a signed
+    hashed-feature vector: each processed question token adds its character
+    trigrams and a lighter whole-word feature, so inflections and shared
+    word parts ("cancelling subscriptions", "cancel my subscription") land
+    close together without a model download. Vectors are stored in an
+    IVF index: spherical k-means splits the FAQs into about sqrt(N) lists
+    and a query scans only the nprobe lists with the closest centroids, so
+    query cost grows with sqrt(N) rather than N. Corpora of up to
+    exact_limit FAQs are scanned exactly. FAQs embedded after the lists
+    were built are scanned exactly until they make up a quarter of the
+    corpus, when the lists are rebuilt.
+    """
+    
+    def __init__(self, chatbot: 'FAQChatbot', dims: int = 256, nprobe: int = 16,
+                 exact_limit: int = 4096, seed: int = 0):
+        if np is None:
+            raise ImportError("The semantic index requires NumPy and SciPy")
+        
+        self.dims = dims
+        self.nprobe = nprobe
+        self.exact_limit = exact_limit
+        self._rng = np.random.default_rng(seed)
+        # Hashed (column, sign) of each feature string seen so far; trigrams repeat across tokens
+        self._hashes: Dict[str, Tuple[int, float]] = {}
+        # vectors is a view of the first N rows of a buffer that grows by doubling
+        self._buffer = self.vectors = self._embed_database(chatbot)
+        # FAQ ids embedded or changed since the lists were built
+        self._unlisted: set = set()
+        self.centroids = None
+        if len(self.vectors) > exact_limit:
+            self._build_lists(self._rng)
+    
+    def _hash(self, feature: str) -> Tuple[int, float]:
+        """Column and sign of a feature string"""
+        hashed = self._hashes.get(feature)
+        if hashed is None:
+            h = zlib.crc32(feature.encode('utf-8'))
+            hashed = (h % self.dims, 1.0 if h & 0x80000000 else -1.0)
+            if len(feature) == 3:
+                self._hashes[feature] = hashed
+        return hashed
+    
+    def _features(self, token: str) -> Dict[int, float]:
+        """Signed hashed features of one token: its boundary-padded trigrams plus the whole word at half weight"""
+        padded = f'<{token}>'
+        trigram_weight = 1.0 / math.sqrt(len(padded) - 2)
+        features = Counter()
+        for start in range(len(padded) - 2):
+            column, sign = self._hash(padded[start:start + 3])
+            features[column] += sign * trigram_weight
+        column, sign = self._hash('#' + token)
+        features[column] += sign * 0.5
+        return features
+    
+    @staticmethod
+    def _normalize(vectors):
+        """L2-normalize rows in place, leaving all-zero rows as they are"""
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+    
+    def _embed_database(self, chatbot: 'FAQChatbot'):
+        """
+        Embed every FAQ question as a (FAQ x token) @ (token x feature) sparse
+        product, so each vocabulary token is hashed once however many FAQs use it
+        """
+        rows = [faq_id for faq_id, record in enumerate(chatbot.records) for _ in record.question_ids]
+        cols = [token_id for record in chatbot.records for token_id in record.question_ids]
+        
+        feature_rows, feature_cols, feature_weights = [], [], []
+        for token_id, token in enumerate(chatbot.vocabulary if isinstance(chatbot.vocabulary, MappedStrings)
+                                         else list(chatbot.vocabulary)):
+            for column, weight in self._features(token).items():
+                feature_rows.append(token_id)
+                feature_cols.append(column)
+                feature_weights.append(weight)
+        
+        token_count = len(chatbot.vocabulary)
+        faq_tokens = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(chatbot.records), token_count))
+        token_features = sparse.csr_matrix((feature_weights, (feature_rows, feature_cols)),
+                                           shape=(token_count, self.dims))
+        vectors = np.empty((len(chatbot.records), self.dims), dtype=np.float32)
+        for start in range(0, len(vectors), 65536):
+            vectors[start:start + 65536] = (faq_tokens[start:start + 65536] @ token_features).toarray()
+        return self._normalize(vectors)
+    
+    def embed(self, words: List[str]):
+        """Embed a preprocessed question the same way as the FAQs"""
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for word in set(words):
+            for column, weight in self._features(word).items():
+                vector[column] += weight
+        return self._normalize(vector)
+    
+    def set(self, faq_id: int, words: List[str]):
+        """Embed the processed question of a new (faq_id == N) or changed FAQ"""
+        count = len(self.vectors)
+        if faq_id == count:
+            if count == len(self._buffer):
+                buffer = np.zeros((max(16, 2 * count), self.dims), dtype=np.float32)
+                buffer[:count] = self.vectors
+                self._buffer = buffer
+            self.vectors = self._buffer[:count + 1]
+        self.vectors[faq_id] = self.embed(words)
+        self._unlisted.add(faq_id)
+        
+        count = len(self.vectors)
+        if count > self.exact_limit and (self.centroids is None or len(self._unlisted) > count // 4):
+            self._build_lists(self._rng)
+    
+    @staticmethod
+    def _nearest(vectors, centroids):
+        """Index of the most similar centroid for each vector, in chunks to bound memory"""
+        return np.concatenate([np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+                               for start in range(0, len(vectors), 65536)])
+    
+    def _build_lists(self, rng, iterations: int = 10):
+        """Train sqrt(N) centroids on a sample with spherical k-means, then bucket every FAQ by centroid"""
+        list_count = int(math.sqrt(len(self.vectors)))
+        sample = self.vectors[rng.choice(len(self.vectors), min(len(self.vectors), list_count * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), list_count, replace=False)].copy()
+        for _ in range(iterations):
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, self._nearest(sample, centroids), sample)
+            # A centroid that lost all its members keeps its old position
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = self._normalize(sums)
+        
+        assignment = self._nearest(self.vectors, centroids)
+        self.centroids = centroids
+        self.list_ids = np.argsort(assignment, kind='stable').astype(np.int32)
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=list_count))))
+        self._unlisted = set()
+    
+    def search(self, query, k: int) -> List[Tuple[int, float]]:
+        """Return up to k (faq_id, similarity) nearest to an embedded query, most similar first"""
+        if self.centroids is None:
+            faq_ids = np.arange(len(self.vectors))
+        else:
+            centroid_scores = self.centroids @ query
+            probes = np.argpartition(-centroid_scores, min(self.nprobe, len(centroid_scores)) - 1)[:self.nprobe]
+            faq_ids = np.concatenate([self.list_ids[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes])
+            if self._unlisted:
+                faq_ids = np.union1d(faq_ids[faq_ids < len(self.vectors)], np.fromiter(self._unlisted, dtype=np.int32))
+        similarities = self.vectors[faq_ids] @ query
+        if len(faq_ids) > k:
+            top = np.argpartition(-similarities, k - 1)[:k]
+            faq_ids, similarities = faq_ids[top], similarities[top]
+        return sorted(zip(faq_ids.tolist(), similarities.tolist()), key=lambda item: (-item[1], item[0]))
+    
+    def similarities(self, query, faq_ids: List[int]) -> List[float]:
+        """Exact similarity between an embedded query and the given FAQs"""
+        return (self.vectors[faq_ids] @ query).tolist()
+
+class FAQChatbot(FAQIndex):
+    def __init__(self, faq_database: Optional[List[Dict]] = None, engine: str = 'python',
+                 cache_size: int = 1024, cache_ttl: Optional[float] = 300.0,
+                 preprocessor: Optional[TextPreprocessor] = None, index_path: Optional[str] = None,
+                 fuzzy: bool = True, semantic_weight: float = 0.0, scorer: str = 'weighted'):
+        faq_database = faq_database if faq_database is not None else [
             {
                 "question": "How do I reset my password?",
                 "answer": "To reset your password: 1) Go to the login page, 2) Click 'Forgot Password', 3) Enter your email address, 4) Check your email for reset instructions, 5) Follow the link and create a new password.",
@@ -39,136 +328,331 @@ class FAQChatbot:
             }
         ]
         
-        # Preprocess FAQ database
-        self._preprocess_database()
+        # 'python' scores index candidates in a loop (fastest for single questions),
+        # 'sparse' scores with SparseScoringEngine and falls back to 'python'
+        # when NumPy and SciPy are not installed
+        if engine not in ('python', 'sparse'):
+            raise ValueError(f"Unknown scoring engine: {engine}")
+        self.engine_name = engine if np is not None else 'python'
+        
+        # With semantic_weight > 0, FAQs are also embedded into a SemanticIndex and
+        # final scores blend the lexical score with the embedding similarity
+        # (skipped when NumPy and SciPy are not installed)
+        if not 0.0 <= semantic_weight <= 1.0:
+            raise ValueError("semantic_weight must be between 0 and 1")
+        self.semantic_weight = semantic_weight if np is not None else 0.0
+        
+        # 'weighted' blends the four similarity signals; 'bm25' and 'tfidf' replace the
+        # cosine and Jaccard signals with a term-weighted score from SCORERS
+        super().__init__(faq_database, cache_size, cache_ttl, preprocessor, index_path, fuzzy, scorer)
     
-    def _preprocess_database(self):
-        """Preprocess all FAQ entries for better matching"""
-        for faq in self.faq_database:
-            faq['processed_question'] = self._preprocess_text(faq['question'])
-            faq['processed_keywords'] = [self._preprocess_text(kw)[0] if self._preprocess_text(kw) else kw for kw in faq['keywords']]
+    def _index_built(self):
+        """Also build the sparse engine and semantic index over a new index, when they are on"""
+        super()._index_built()
+        self.engine = SparseScoringEngine(self) if self.engine_name == 'sparse' else None
+        self._engine_stale = False
+        self.semantic = SemanticIndex(self) if self.semantic_weight > 0 else None
     
-    def _preprocess_text(self, text: str) -> List[str]:
-        """
-        Preprocess text using NLP techniques:
-        - Convert to lowercase
-        - Remove punctuation
-        - Tokenize
-        - Remove stop words and short words
+    def _entry_changed(self, faq_id: int):
+        """Embed the question of an added or replaced entry; a removed entry gets an all-zero vector"""
+        if self.semantic is not None:
+            faq = self.faq_database[faq_id]
+            self.semantic.set(faq_id, faq['processed_question'] if faq is not None else [])
+    
+    def _commit(self, faqs: List[Dict], vocabulary_size: int):
+        """Also mark the sparse engine's matrices for a rebuild on their next use"""
+        super()._commit(faqs, vocabulary_size)
+        if self.engine is not None:
+            self._engine_stale = True
+    
+    def find_best_match(self, user_question: str, top_k: Optional[int] = None) -> Optional[Dict]:
         """
-        # Convert to lowercase and remove punctuation
-        text = re.sub(r'[^\w\s]', ' ', text.lower())
+        Find the best matching FAQ using multiple similarity techniques:
+        - Cosine similarity
+        - Jaccard similarity  
+        - Keyword overlap
+        - Question similarity
         
-        # Tokenize and filter
-        words = [word for word in text.split() if len(word) > 2]
+        Only candidates from the inverted index are scored. Pass top_k to
+        stop after the k candidates sharing the most words with the question
+        (this always uses the pure-Python loop).
+        """
+        user_words = self._query_words(user_question)
         
-        # Simple stop words removal
-        stop_words = {'the', 'and', 'are', 'you', 'for', 'can', 'how', 'what', 'where', 'when', 'why', 'with', 'this', 'that'}
-        words = [word for word in words if word not in stop_words]
+        if not user_words:
+            return None
         
-        return words
+        return self._match_words(user_words, top_k)
     
-    def _calculate_cosine_similarity(self, vec1: List[str], vec2: List[str]) -> float:
-        """Calculate cosine similarity between two text vectors"""
-        if not vec1 or not vec2:
-            return 0.0
-        
-        # Convert to sets for intersection
-        set1, set2 = set(vec1), set(vec2)
-        intersection = len(set1.intersection(set2))
+    def _match_words(self, user_words: List[str], top_k: Optional[int] = None) -> Optional[Dict]:
+        """Find the best match for an already preprocessed question"""
+        with self._index_lock:
+            if self.semantic is not None:
+                best = next(iter(self._blended_candidates(user_words, 1, top_k)), None)
+            elif self.scorer is not None:
+                best = self._best_scored(self._lexical_scores(user_words, top_k))
+            elif self.engine is not None and top_k is None:
+                best = self._fresh_engine().best_matches([user_words])[0]
+            else:
+                best = self._score_candidates(user_words, top_k)
+            
+            return self._build_match(best)
+    
+    def _fresh_engine(self) -> SparseScoringEngine:
+        """The sparse engine, first rebuilt if FAQs changed since it was built (call with the index lock held)"""
+        if self._engine_stale:
+            self.engine = SparseScoringEngine(self)
+            self._engine_stale = False
+        return self.engine
+    
+    def find_best_matches(self, user_questions: List[str]) -> List[Optional[Dict]]:
+        """
+        Find the best matching FAQ for a batch of questions in one pass.
+        Questions that preprocess to the same tokens are scored once, and
+        with the sparse engine the whole batch is scored by one matrix product.
+        """
+        queries = [tuple(self._query_words(question)) for question in user_questions]
+        matches = self._match_batch([words for words in dict.fromkeys(queries) if words])
         
-        # Calculate cosine similarity
-        magnitude1 = math.sqrt(len(set1))
-        magnitude2 = math.sqrt(len(set2))
+        return [matches.get(words) for words in queries]
+    
+    def _match_batch(self, queries: List[Tuple[str, ...]]) -> Dict[Tuple[str, ...], Optional[Dict]]:
+        """Find the best match for distinct, non-empty preprocessed questions"""
+        with self._index_lock:
+            if self.semantic is not None:
+                bests = [next(iter(self._blended_candidates(list(words), 1)), None) for words in queries]
+            elif self.scorer is not None:
+                bests = [self._best_scored(self._lexical_scores(list(words))) for words in queries]
+            elif self.engine is not None:
+                bests = self._fresh_engine().best_matches([list(words) for words in queries])
+            else:
+                bests = [self._score_candidates(list(words)) for words in queries]
+            
+            return {words: self._build_match(best) for words, best in zip(queries, bests)}
+    
+    @staticmethod
+    def _blend(keyword_cosine: float, question_cosine: float, keyword_jaccard: float, word_overlap: float) -> float:
+        """Weighted combination of the four similarity signals"""
+        return (
+            keyword_cosine * 0.3 +
+            question_cosine * 0.25 + 
+            keyword_jaccard * 0.25 +
+            word_overlap * 0.2
+        )
+    
+    def _weighted_signals(self, candidate: Tuple[int, int, int, int], query_size: int,
+                          word_count: int) -> Tuple[float, float, float, float, float]:
+        """
+        Score one index candidate (faq_id and hit counts, as _find_candidates
+        returns them) from its precomputed record:
+        - Keyword matching (cosine similarity)
+        - Question similarity (cosine similarity)
+        - Jaccard similarity with keywords
+        - Direct word overlap, counted from the keyword substring index
+        and their weighted combination, as a tuple in WEIGHTED_SCORES order
+        """
+        faq_id, keyword_hits, question_hits, overlap_hits = candidate
+        record = self.records[faq_id]
+        keyword_count = len(record.keyword_ids)
+        query_norm = math.sqrt(query_size)
         
-        if magnitude1 == 0 or magnitude2 == 0:
-            return 0.0
+        keyword_cosine = keyword_hits / (query_norm * record.keyword_norm) if keyword_count else 0.0
+        question_cosine = question_hits / (query_norm * record.question_norm) if record.question_ids else 0.0
+        keyword_jaccard = keyword_hits / (query_size + keyword_count - keyword_hits) if keyword_count else 0.0
+        word_overlap = overlap_hits / word_count
         
-        return intersection / (magnitude1 * magnitude2)
+        return (keyword_cosine, question_cosine, keyword_jaccard, word_overlap,
+                self._blend(keyword_cosine, question_cosine, keyword_jaccard, word_overlap))
     
-    def _calculate_jaccard_similarity(self, vec1: List[str], vec2: List[str]) -> float:
-        """Calculate Jaccard similarity between two text vectors"""
-        if not vec1 or not vec2:
-            return 0.0
+    def _score_candidates(self, user_words: List[str], top_k: Optional[int] = None) -> Optional[Tuple[int, Dict[str, float]]]:
+        """Score index candidates one by one and return (faq_id, raw scores) of the best"""
+        query_size = len(set(user_words))
+        
+        best = None
+        highest_score = 0.0
         
-        set1, set2 = set(vec1), set(vec2)
-        intersection = len(set1.intersection(set2))
-        union = len(set1.union(set2))
+        for candidate in self._find_candidates(user_words, top_k):
+            signals = self._weighted_signals(candidate, query_size, len(user_words))
+            if signals[-1] > highest_score:
+                highest_score = signals[-1]
+                best = (candidate[0], signals)
         
-        return intersection / union if union > 0 else 0.0
+        return (best[0], dict(zip(WEIGHTED_SCORES, best[1]))) if best is not None else None
     
-    def _calculate_word_overlap(self, user_words: List[str], keywords: List[str]) -> float:
-        """Calculate direct word overlap score"""
-        if not user_words:
-            return 0.0
+    def find_top_matches(self, user_question: str, k: int = 3) -> List[Dict]:
+        """
+        Find up to k FAQs scoring above the match threshold, best first.
+        The first result is the match find_best_match returns; each result
+        has the same shape (FAQ fields, confidence and scores).
+        """
+        user_words = self._query_words(user_question)
         
-        overlap_count = 0
-        for word in user_words:
-            for keyword in keywords:
-                if word in keyword or keyword in word:
-                    overlap_count += 1
-                    break
+        if not user_words or k <= 0:
+            return []
         
-        return overlap_count / len(user_words)
+        with self._index_lock:
+            return [self._build_match(best) for best in self._top_candidates(user_words, k)]
     
-    def find_best_match(self, user_question: str) -> Optional[Dict]:
+    def _top_candidates(self, user_words: List[str], k: int) -> List[Tuple[int, Dict[str, float]]]:
         """
-        Find the best matching FAQ using multiple similarity techniques:
-        - Cosine similarity
-        - Jaccard similarity  
-        - Keyword overlap
-        - Question similarity
+        Score index candidates into a bounded min-heap of the k best and
+        return their (faq_id, raw scores), best first. Before a candidate's
+        record is read, an upper bound computed from its hit counts alone is
+        checked against the threshold and, once the heap is full, the k-th
+        best score, so candidates that cannot place are skipped. Ties go to
+        the earlier FAQ, as in find_best_match.
         """
-        user_words = self._preprocess_text(user_question)
+        if self.semantic is not None:
+            return self._blended_candidates(user_words, k)
+        if self.scorer is not None:
+            return nsmallest(k, (item for item in self._lexical_scores(user_words) if item[1]['final_score'] > 0.15),
+                             key=lambda item: (-item[1]['final_score'], item[0]))
         
-        if not user_words:
-            return None
-        
-        best_match = None
-        highest_score = 0.0
+        query_size = len(set(user_words))
+        query_norm = math.sqrt(query_size)
+        heap = []
+        floor = 0.15
         
-        for faq in self.faq_database:
-            # Method 1: Keyword matching (cosine similarity)
-            keyword_cosine = self._calculate_cosine_similarity(user_words, faq['processed_keywords'])
+        for candidate in self._find_candidates(user_words):
+            faq_id, keyword_hits, question_hits, overlap_hits = candidate
             
-            # Method 2: Question similarity (cosine similarity)
-            question_cosine = self._calculate_cosine_similarity(user_words, faq['processed_question'])
-            
-            # Method 3: Jaccard similarity with keywords
-            keyword_jaccard = self._calculate_jaccard_similarity(user_words, faq['processed_keywords'])
-            
-            # Method 4: Direct word overlap
-            word_overlap = self._calculate_word_overlap(user_words, faq['keywords'])
+            # A record has at least keyword_hits keyword tokens and question_hits question tokens,
+            # so its norms are at least the square roots of those counts and the Jaccard union at
+            # least the query size. The small margin keeps float rounding from skipping a tie.
+            bound = self._blend(math.sqrt(keyword_hits) / query_norm, math.sqrt(question_hits) / query_norm,
+                                keyword_hits / query_size, overlap_hits / len(user_words))
+            if bound * (1 + 1e-9) <= floor:
+                continue
             
-            # Weighted combination of all methods
-            final_score = (
-                keyword_cosine * 0.3 +
-                question_cosine * 0.25 + 
-                keyword_jaccard * 0.25 +
-                word_overlap * 0.2
-            )
+            signals = self._weighted_signals(candidate, query_size, len(user_words))
+            if signals[-1] <= floor:
+                continue
             
-            if final_score > highest_score:
-                highest_score = final_score
-                best_match = {
-                    **faq,
-                    'confidence': round(final_score * 100, 2),
-                    'scores': {
-                        'keyword_cosine': round(keyword_cosine, 3),
-                        'question_cosine': round(question_cosine, 3),
-                        'keyword_jaccard': round(keyword_jaccard, 3),
-                        'word_overlap': round(word_overlap, 3),
-                        'final_score': round(final_score, 3)
-                    }
+            entry = (signals[-1], -faq_id, signals)
+            if len(heap) < k:
+                heappush(heap, entry)
+            else:
+                heapreplace(heap, entry)
+            if len(heap) == k:
+                floor = max(0.15, heap[0][0])
+        
+        return [(-negative_id, dict(zip(WEIGHTED_SCORES, signals)))
+                for _, negative_id, signals in sorted(heap, reverse=True)]
+    
+    def _lexical_scores(self, user_words: List[str], top_k: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, float]]]:
+        """
+        Yield (faq_id, raw scores) for every index candidate, as
+        _score_candidates computes them or, with a term-weighted scorer, as
+            TERM_WEIGHT * scorer score + OVERLAP_WEIGHT * word overlap
+        """
+        if self.scorer is not None:
+            for faq_id, term_score, word_overlap in self._term_scores(user_words, self._find_candidates(user_words, top_k)):
+                yield faq_id, {
+                    self.scorer.name: term_score,
+                    'word_overlap': word_overlap,
+                    'final_score': term_score * TERM_WEIGHT + word_overlap * OVERLAP_WEIGHT
                 }
+            return
         
+        query_size = len(set(user_words))
+        
+        for candidate in self._find_candidates(user_words, top_k):
+            yield candidate[0], dict(zip(WEIGHTED_SCORES, self._weighted_signals(candidate, query_size, len(user_words))))
+    
+    @staticmethod
+    def _best_scored(scored: Iterable[Tuple[int, Dict[str, float]]]) -> Optional[Tuple[int, Dict[str, float]]]:
+        """The highest scoring (faq_id, raw scores), keeping the earliest FAQ on ties"""
+        return max(scored, key=lambda item: (item[1]['final_score'], -item[0]), default=None)
+    
+    def _blended_candidates(self, user_words: List[str], k: int, top_k: Optional[int] = None,
+                            neighbours: int = 20) -> List[Tuple[int, Dict[str, float]]]:
+        """
+        Score the lexical index candidates plus the question's nearest
+        SemanticIndex neighbours with
+            (1 - semantic_weight) * lexical score + semantic_weight * similarity
+        (never below the lexical score alone, so a close embedding can lift a
+        candidate but a distant one cannot sink a good lexical match) and
+        return the k best (faq_id, raw scores) above the match threshold,
+        best first. Neighbours that share no words with the question get zero
+        lexical signals, so they only match on a close embedding.
+        """
+        query = self.semantic.embed(user_words)
+        candidates = dict(self._lexical_scores(user_words, top_k))
+        for faq_id, _ in self.semantic.search(query, max(k, neighbours)):
+            candidates.setdefault(faq_id, None)
+        
+        faq_ids = sorted(candidates)
+        scored = []
+        for faq_id, similarity in zip(faq_ids, self.semantic.similarities(query, faq_ids)):
+            scores = candidates[faq_id] or dict.fromkeys(WEIGHTED_SCORES, 0.0)
+            scores['lexical_score'] = scores['final_score']
+            scores['semantic_similarity'] = max(similarity, 0.0)
+            scores['final_score'] = max(scores['lexical_score'],
+                                        scores['lexical_score'] * (1 - self.semantic_weight) +
+                                        scores['semantic_similarity'] * self.semantic_weight)
+            if scores['final_score'] > 0.15:
+                scored.append((faq_id, scores))
+        
+        return nsmallest(k, scored, key=lambda item: (-item[1]['final_score'], item[0]))
+    
+    def _build_match(self, best: Optional[Tuple[int, Dict[str, float]]]) -> Optional[Dict]:
+        """Build the match dict returned by find_best_match from (faq_id, raw scores)"""
         # Return match only if confidence is above threshold
-        return best_match if highest_score > 0.15 else None
+        if best is None or best[1]['final_score'] <= 0.15:
+            return None
+        
+        faq_id, scores = best
+        return {
+            **self.faq_database[faq_id],
+            'confidence': round(scores['final_score'] * 100, 2),
+            'scores': {name: round(value, 3) for name, value in scores.items()}
+        }
     
-    def get_response(self, user_question: str) -> Dict:
-        """Get chatbot response for user question"""
-        match = self.find_best_match(user_question)
+    def get_response(self, user_question: str, suggestions: int = 0) -> Dict:
+        """
+        Get chatbot response for user question, served from the response cache when possible.
+        With suggestions > 0 the response also lists up to that many runner-up questions.
+        """
+        user_words = tuple(self._query_words(user_question))
+        key = (user_words, suggestions) if suggestions else user_words
+        
+        response = self.response_cache.get(key)
+        if response is None:
+            # Computed and cached under the index lock, so an FAQ edit cannot
+            # land between scoring and caching and leave a stale response behind
+            with self._index_lock:
+                if suggestions:
+                    matches = [self._build_match(best) for best in self._top_candidates(list(user_words), suggestions + 1)] if user_words else []
+                    response = self._format_response(matches[0] if matches else None)
+                    response['suggestions'] = [match['question'] for match in matches
+                                               if match['question'] != response['matched_question']][:suggestions]
+                else:
+                    response = self._format_response(self._match_words(list(user_words)) if user_words else None)
+                self.response_cache.put(key, response)
+        
+        return dict(response)
+    
+    def get_responses(self, user_questions: List[str]) -> List[Dict]:
+        """Get chatbot responses for a batch of questions, in input order"""
+        queries = [tuple(self._query_words(question)) for question in user_questions]
         
+        responses = {}
+        for words in dict.fromkeys(queries):
+            response = self.response_cache.get(words)
+            if response is not None:
+                responses[words] = response
+        
+        misses = [words for words in dict.fromkeys(queries) if words not in responses]
+        with self._index_lock:
+            matches = self._match_batch([words for words in misses if words])
+            for words in misses:
+                responses[words] = self._format_response(matches.get(words))
+                self.response_cache.put(words, responses[words])
+        
+        return [dict(responses[words]) for words in queries]
+    
+    def _format_response(self, match: Optional[Dict]) -> Dict:
+        """Turn a match (or None) into the response returned to the user"""
         if match and match['confidence'] > 30:
             return {
                 'answer': match['answer'],
@@ -209,9 +693,166 @@ class FAQChatbot:
             
             print("-" * 50)
 
+def build_chatbot(faqs_path: Optional[str] = None, index_path: Optional[str] = None,
+                  engine: str = 'python', semantic_weight: float = 0.0, scorer: str = 'weighted') -> FAQChatbot:
+    """Build a chatbot from a compiled index, an FAQ file or the built-in FAQs"""
+    options = {'engine': engine, 'semantic_weight': semantic_weight, 'scorer': scorer}
+    if index_path:
+        return FAQChatbot(index_path=index_path, **options)
+    return FAQChatbot(load_faq_file(faqs_path) if faqs_path else None, **options)
+
+# Chatbot of the current batch worker process, built once by _init_batch_worker
+_batch_chatbot: Optional[FAQChatbot] = None
+
+def _init_batch_worker(faqs_path: Optional[str], index_path: Optional[str], engine: str,
+                       semantic_weight: float = 0.0, scorer: str = 'weighted'):
+    global _batch_chatbot
+    _batch_chatbot = build_chatbot(faqs_path, index_path, engine, semantic_weight, scorer)
+
+def _answer_chunk(chunk: List[Tuple[int, str]], jsonl: bool) -> Tuple[List[str], int, int]:
+    """
+    Answer one chunk of (line number, input line) with the worker's chatbot.
+    Returns the serialized JSONL output lines in input order, how many
+    questions got the fallback answer and how many lines were invalid.
+    """
+    outputs: List[Optional[Dict]] = []
+    questions, positions = [], []
+    for line_number, line in chunk:
+        record = {'line': line_number}
+        question = line
+        if jsonl:
+            try:
+                item = json.loads(line)
+                question = item['question'] if isinstance(item, dict) else item
+                if not isinstance(question, str):
+                    raise TypeError("question is not a string")
+                if isinstance(item, dict) and 'id' in item:
+                    record['id'] = item['id']
+            except (ValueError, KeyError, TypeError) as error:
+                record['error'] = f"invalid input: {error}"
+                outputs.append(record)
+                continue
+        record['question'] = question
+        positions.append(len(outputs))
+        questions.append(question)
+        outputs.append(record)
+    
+    fallbacks = 0
+    for position, response in zip(positions, _batch_chatbot.get_responses(questions)):
+        outputs[position].update(response)
+        fallbacks += response['matched_question'] is None
+    return [json.dumps(record) for record in outputs], fallbacks, len(outputs) - len(questions)
+
+def _read_chunks(stream: TextIO, chunk_size: int) -> Iterator[List[Tuple[int, str]]]:
+    """Lazily group the non-blank lines of stream into chunks of (line number, line)"""
+    chunk = []
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if line:
+            chunk.append((line_number, line))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def run_batch(source: TextIO, sink: TextIO, jsonl: bool = False, workers: int = 1, chunk_size: int = 1000,
+              faqs_path: Optional[str] = None, index_path: Optional[str] = None, engine: str = 'python',
+              semantic_weight: float = 0.0, scorer: str = 'weighted', progress: Optional[TextIO] = sys.stderr) -> Dict:
+    """
+    Stream questions from source (one per line, or JSONL objects with a
+    "question" and optional "id") and write one JSONL result per question
+    to sink, in input order. Chunks are answered across a process pool
+    with at most two chunks per worker in flight, so memory stays flat
+    however long the input is. Returns a summary of the run.
+    """
+    start = time.perf_counter()
+    last_report = start
+    answered = fallbacks = errors = 0
+    
+    def write(result: Tuple[List[str], int, int]):
+        nonlocal answered, fallbacks, errors, last_report
+        lines, chunk_fallbacks, chunk_errors = result
+        sink.write('\n'.join(lines) + '\n')
+        answered += len(lines) - chunk_errors
+        fallbacks += chunk_fallbacks
+        errors += chunk_errors
+        now = time.perf_counter()
+        if progress is not None and now - last_report >= 1.0:
+            last_report = now
+            progress.write(f"\r{answered} questions, {answered / (now - start):.0f}/s, {now - start:.0f}s elapsed")
+            progress.flush()
+    
+    chunks = _read_chunks(source, chunk_size)
+    if workers <= 1:
+        _init_batch_worker(faqs_path, index_path, engine, semantic_weight, scorer)
+        for chunk in chunks:
+            write(_answer_chunk(chunk, jsonl))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(faqs_path, index_path, engine, semantic_weight, scorer)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_answer_chunk, chunk, jsonl))
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    sink.flush()
+    
+    elapsed = time.perf_counter() - start
+    summary = {
+        'questions': answered,
+        'fallbacks': fallbacks,
+        'invalid_lines': errors,
+        'seconds': round(elapsed, 3),
+        'questions_per_second': round(answered / elapsed, 1) if elapsed > 0 else 0.0
+    }
+    if progress is not None:
+        progress.write(f"\rAnswered {answered} questions ({fallbacks} fallbacks, {errors} invalid lines) "
+                       f"in {elapsed:.1f}s, {summary['questions_per_second']:.0f} questions/s\n")
+    return summary
+
 def main():
     """Main function to run the chatbot"""
-    chatbot = FAQChatbot()
+    parser = argparse.ArgumentParser(description="FAQ Chatbot")
+    parser.add_argument('--faqs', help="load FAQs from a .json, .jsonl or .csv file instead of the built-in ones")
+    parser.add_argument('--index', help="memory-map an index compiled with --compile-index instead of preprocessing")
+    parser.add_argument('--compile-index', metavar='PATH', help="write the compiled index of the loaded FAQs to PATH and exit")
+    parser.add_argument('--engine', choices=['python', 'sparse'], default='python', help="scoring engine")
+    parser.add_argument('--scorer', choices=['weighted', *SCORERS], default='weighted',
+                        help="weighted similarity blend, or BM25/TF-IDF term weighting")
+    parser.add_argument('--semantic-weight', type=float, default=0.0,
+                        help="blend this share of hashed-embedding similarity into scores (0 turns it off; needs NumPy)")
+    parser.add_argument('--batch', nargs='?', const='-', metavar='FILE',
+                        help="answer the questions in FILE (or stdin) as JSONL instead of chatting")
+    parser.add_argument('--input-format', choices=['auto', 'text', 'jsonl'], default='auto',
+                        help="batch input: one question per line or JSONL objects (auto: by file extension)")
+    parser.add_argument('--output', help="batch output file (default: stdout)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="batch worker processes")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="questions per batch work unit")
+    args = parser.parse_args()
+    
+    if args.batch:
+        jsonl = args.input_format == 'jsonl' or (
+            args.input_format == 'auto' and args.batch.endswith(('.jsonl', '.ndjson')))
+        source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+        sink = sys.stdout if not args.output else open(args.output, 'w', encoding='utf-8')
+        try:
+            run_batch(source, sink, jsonl, args.workers, args.chunk_size, args.faqs, args.index, args.engine,
+                      args.semantic_weight, args.scorer)
+        finally:
+            for stream in (source, sink):
+                if stream not in (sys.stdin, sys.stdout):
+                    stream.close()
+        return
+    
+    chatbot = build_chatbot(args.faqs, args.index, args.engine, args.semantic_weight, args.scorer)
+    
+    if args.compile_index:
+        chatbot.write_index(args.compile_index)
+        print(f"Compiled {len(chatbot.faq_database)} FAQs into {args.compile_index}")
+        return
     
     # Example usage
     print("FAQ Chatbot Demo")
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for path in (ROOT, os.path.join(ROOT, 'python_version'), os.path.join(ROOT, 'flask_web_app')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def pytest_addoption(parser):
+    parser.addoption('--run-slow', action='store_true', help="also run the tests marked slow")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "slow: takes minutes; skipped unless --run-slow is given")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-slow'):
+        return
+    skip = pytest.mark.skip(reason="slow; run with --run-slow")
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,195 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import app
+from benchmark import generate_corpus, generate_queries, generate_workload, set_cosine, substring_overlap
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+
+def test_batch_responses_match_single_responses_in_order(client):
+    questions = ['reset my password', 'payment methods', 'reset my password', 'how are you', '']
+    expected = [app.FAQChatbot().get_response(question) for question in questions]
+    assert app.FAQChatbot().get_responses(questions) == expected
+    
+    response = client.post('/chat/batch', json=questions)
+    assert response.status_code == 200
+    assert [answer['matched_question'] for answer in response.json] == [answer['matched_question'] for answer in expected]
+    assert client.post('/chat/batch', json={'question': 'reset my password'}).status_code == 400
+    assert client.post('/chat/batch', json=['reset my password', 3]).status_code == 400
+
+def test_admin_routes_are_refused_without_admin_token(client, monkeypatch):
+    monkeypatch.delenv('ADMIN_TOKEN', raising=False)
+    assert client.post('/admin/reload').status_code == 403
+    assert client.delete('/admin/faqs/0', headers={'X-Admin-Token': ''}).status_code == 403
+
+
+def test_admin_routes_require_the_matching_token(client, monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', 'secret')
+    assert client.put('/admin/faqs/0', json={}).status_code == 403
+    assert client.put('/admin/faqs/0', json={}, headers={'X-Admin-Token': 'secreT'}).status_code == 403
+    assert client.put('/admin/faqs/0', json={}, headers={'X-Admin-Token': 'secret'}).status_code == 400
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def write_faqs(path, answer: str):
+    path.write_text(json.dumps([{'question': 'How do I reset my password?', 'answer': answer, 'keywords': ['password']}]))
+    # A distinct modification time even on filesystems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_watcher_starts_with_the_first_request_and_reloads(client, monkeypatch, tmp_path):
+    path = tmp_path / 'faqs.json'
+    write_faqs(path, 'Old answer.')
+    store = app.ChatbotStore(lambda: app.FAQChatbot(app.load_faq_file(str(path))))
+    monkeypatch.setattr(app, 'chatbot_store', store)
+    monkeypatch.setattr(app, 'WATCH_PATHS', [str(path)])
+    monkeypatch.setattr(app, 'WATCH_INTERVAL', 0.05)
+    assert store._watcher_pid is None
+    
+    assert client.post('/chat', json={'question': 'reset password'}).json['answer'] == 'Old answer.'
+    assert store._watcher_pid == os.getpid()
+    write_faqs(path, 'New answer.')
+    wait_for(lambda: store.current.version == 2)
+    assert client.post('/chat', json={'question': 'reset password'}).json['answer'] == 'New answer.'
+
+
+def test_admission_control_is_opt_in():
+    assert not app.admission.enabled
+    queue = app.AdmissionQueue(1, 0, 0.01, enabled=False)
+    assert queue.acquire() and queue.acquire()
+    queue = app.AdmissionQueue(1, 0, 0.01, enabled=True)
+    assert queue.acquire() and not queue.acquire()
+    assert queue.stats()['rejected'] == 1
+
+
+def test_malformed_chat_bodies_are_refused_before_admission(client, monkeypatch):
+    queue = app.AdmissionQueue(1, 0, 0.01, enabled=True)
+    monkeypatch.setattr(app, 'admission', queue)
+    assert queue.acquire()
+    for path, body in (('/chat', {'question': 5}), ('/chat', ['reset password']), ('/chat', {'question': ''}),
+                       ('/chat', {'question': 'reset', 'suggestions': 'many'}), ('/chat/batch', {'question': 'reset'})):
+        assert client.post(path, json=body).status_code == 400, body
+    assert client.post('/chat', data='reset password').status_code == 400
+    # A well-formed question still waits for (and here misses) a slot
+    assert client.post('/chat', json={'question': 'reset password'}).status_code == 503
+    assert queue.stats()['rejected'] == 1
+
+
+def test_query_log_keeps_only_the_most_frequent_totals(tmp_path):
+    log = app.QueryLog(str(tmp_path / 'queries.jsonl'), flush_interval=3600, max_tracked=2)
+    for question, times in (('A?', 3), ('B?', 2), ('C?', 1), (None, 1)):
+        for _ in range(times):
+            log.record(('words',), 0, {'matched_question': question, 'confidence': 0.5})
+    log.flush()
+    stats = log.stats()
+    assert stats['top_faqs'] == [('A?', 3), ('B?', 2)]
+    assert (stats['recorded'], stats['written'], stats['dropped']) == (7, 7, 0)
+    assert len((tmp_path / 'queries.jsonl').read_text().splitlines()) == 7
+
+
+def test_query_log_counts_restart_in_a_forked_worker(tmp_path, monkeypatch):
+    log = app.QueryLog(str(tmp_path / 'queries.jsonl'), flush_interval=3600)
+    for question in ('A?', 'A?', None):
+        log.record(('words',), 0, {'matched_question': question, 'confidence': 0.5})
+    log.flush()
+    parent = os.getpid()
+    monkeypatch.setattr(app.os, 'getpid', lambda: parent + 1)
+    log.record(('words',), 0, {'matched_question': 'B?', 'confidence': 0.5})
+    log.flush()
+    stats = log.stats()
+    assert (stats['recorded'], stats['written'], stats['dropped']) == (1, 1, 0)
+    assert stats['top_faqs'] == [('B?', 1)] and stats['top_fallbacks'] == []
+
+
+def test_client_index_exports_the_keyword_and_fuzzy_lookups():
+    index = json.loads(app.FAQChatbot().client_index())
+    password = index['keywords'].index('password')
+    assert password in index['fragments']['ssword']
+    # The first seven characters of "password" with one deleted
+    token_ids = index['deletes']['paswor']
+    assert index['vocabulary'].index('password') in token_ids
+
+
+def full_scan_best_match(chatbot, question):
+    # The Flask chatbot's weighted score for every FAQ, from its token lists without any index
+    words = chatbot._preprocess_text(question)
+    best, highest = None, 0.0
+    for faq in chatbot.faq_database:
+        score = (set_cosine(words, faq['processed_keywords']) * 0.4 + set_cosine(words, faq['processed_question']) * 0.3
+                 + substring_overlap(words, faq['keywords']) * 0.3)
+        if score > highest:
+            best, highest = faq, score
+    return (best['question'], round(highest * 100, 2)) if highest > 0.15 else None
+
+
+def test_index_matches_agree_with_a_full_scan():
+    corpus = generate_corpus(250, 400)
+    chatbot = app.FAQChatbot([dict(faq) for faq in corpus], fuzzy=False)
+    questions = generate_queries(corpus, 200) + generate_workload(corpus, 'long', 20) + generate_workload(corpus, 'misses', 20)
+    for question in questions + ['', 'how are you']:
+        expected = full_scan_best_match(chatbot, question)
+        match = chatbot.find_best_match(question)
+        assert (match and (match['question'], match['confidence'])) == expected, question
+        response = chatbot.get_response(question)
+        if expected and expected[1] > 30:
+            assert (response['matched_question'], response['confidence']) == expected, question
+        else:
+            assert response['matched_question'] is None, question
+
+
+def test_index_page_is_served_compressed_with_an_etag(client):
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == client.get('/').data
+    assert client.get('/', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_response_bodies_match_jsonify():
+    chatbot = app.FAQChatbot()
+    with app.app.app_context():
+        for question in ('reset my password', 'how are you', 'reset my password'):
+            assert chatbot.get_response_body(question) == app.jsonify(chatbot.get_response(question)).get_data()
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    flights = app.SingleFlight()
+    started, release, calls, results = threading.Event(), threading.Event(), [], []
+    
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'answer'
+    
+    leader = threading.Thread(target=lambda: results.append(flights.run('question', compute)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.run('question', compute))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    wait_for(lambda: flights.stats()['coalesced'] == 4)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    
+    assert calls == [1] and results == ['answer'] * 5
+    assert flights.stats() == {'in_flight': 0, 'leaders': 1, 'coalesced': 4}
+    # Once the first call is done, the next one computes again
+    assert flights.run('question', lambda: 'fresh') == 'fresh'
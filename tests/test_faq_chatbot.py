@@ -0,0 +1,116 @@
+import io
+import json
+
+import pytest
+
+import faq_core
+from benchmark import full_scan_best_match, generate_corpus, generate_queries, generate_workload, reference_score
+from faq_chatbot import FAQChatbot, np, run_batch
+from faq_core import ResponseCache
+
+CORPUS = generate_corpus(250, 400)
+QUESTIONS = (generate_queries(CORPUS, 200) + generate_workload(CORPUS, 'long', 20)
+             + generate_workload(CORPUS, 'misses', 20) + ['', 'how are you'])
+
+ENGINES = ['python', pytest.param('sparse', marks=pytest.mark.skipif(np is None, reason="needs NumPy and SciPy"))]
+
+
+def make_chatbot(**kwargs):
+    # Without fuzzy correction, so the index sees the same words as the full scan
+    return FAQChatbot([dict(faq) for faq in CORPUS], fuzzy=False, **kwargs)
+
+
+def matched(match):
+    return match and (match['question'], match['confidence'])
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_index_matches_agree_with_a_full_scan(engine):
+    chatbot = make_chatbot(engine=engine)
+    for question in QUESTIONS:
+        expected = full_scan_best_match(chatbot, question)
+        assert matched(chatbot.find_best_match(question)) == matched(expected), question
+        response = chatbot.get_response(question)
+        if expected and expected['confidence'] > 30:
+            assert (response['matched_question'], response['confidence']) == matched(expected), question
+        else:
+            assert response['matched_question'] is None, question
+
+
+@pytest.mark.skipif(np is None, reason="needs NumPy and SciPy")
+def test_sparse_batch_scores_like_the_python_loop():
+    python, sparse = make_chatbot(), make_chatbot(engine='sparse')
+    expected = [matched(python.find_best_match(question)) for question in QUESTIONS]
+    assert [matched(match) for match in sparse.find_best_matches(QUESTIONS)] == expected
+    assert [matched(match) for match in python.find_best_matches(QUESTIONS)] == expected
+
+
+def test_response_cache_evicts_the_least_recent_entry_and_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(faq_core.time, 'monotonic', lambda: now[0])
+    cache = ResponseCache(max_entries=2, ttl=10)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    assert cache.get('a') == {'n': 1}
+    cache.put('c', {'n': 3})
+    assert cache.get('b') is None and cache.get('c') == {'n': 3}
+    now[0] += 11
+    assert cache.get('a') is None
+    assert (cache.stats()['evictions'], cache.stats()['expirations']) == (1, 1)
+    
+    chatbot = make_chatbot()
+    question = QUESTIONS[0]
+    first = chatbot.get_response(question)
+    # Same tokens, different case and punctuation: served from the cache
+    assert chatbot.get_response(question.upper() + '?') == first
+    assert (chatbot.response_cache.stats()['hits'], chatbot.response_cache.stats()['misses']) == (1, 1)
+
+
+def test_top_matches_are_the_best_full_scan_scores_in_order():
+    chatbot = make_chatbot()
+    for question in QUESTIONS[:100]:
+        words = chatbot._preprocess_text(question)
+        scored = [(reference_score(words, faq), faq_id) for faq_id, faq in enumerate(chatbot.faq_database)] if words else []
+        expected = [chatbot.faq_database[faq_id]['question'] for score, faq_id in sorted(scored, key=lambda item: (-item[0], item[1]))
+                    if score > 0.15][:3]
+        assert [match['question'] for match in chatbot.find_top_matches(question, 3)] == expected, question
+    
+    # Equal scores keep database order, so the earlier FAQ wins
+    twins = FAQChatbot([{'question': 'Reset password?', 'answer': answer, 'keywords': ['password']} for answer in 'ab'])
+    assert [match['answer'] for match in twins.find_top_matches('reset password', 2)] == ['a', 'b']
+
+
+def test_batch_mode_writes_results_in_input_order(tmp_path):
+    faqs_path = tmp_path / 'faqs.json'
+    faqs_path.write_text(json.dumps(CORPUS))
+    questions = QUESTIONS[:30]
+    lines = [json.dumps({'question': question, 'id': number}) for number, question in enumerate(questions)]
+    lines.insert(5, '{"question": 7}')
+    sink = io.StringIO()
+    summary = run_batch(io.StringIO('\n'.join(lines) + '\n'), sink, jsonl=True, chunk_size=4,
+                        faqs_path=str(faqs_path), progress=None)
+    
+    records = [json.loads(line) for line in sink.getvalue().splitlines()]
+    assert [record['line'] for record in records] == list(range(1, len(lines) + 1))
+    assert 'error' in records[5] and 'answer' not in records[5]
+    del records[5]
+    chatbot = FAQChatbot([dict(faq) for faq in CORPUS])
+    assert [(record['id'], record['matched_question']) for record in records] == \
+        [(number, chatbot.get_response(question)['matched_question']) for number, question in enumerate(questions)]
+    assert (summary['questions'], summary['invalid_lines']) == (len(questions), 1)
+
+
+@pytest.mark.skipif(np is None, reason="needs NumPy and SciPy")
+def test_semantic_blend_lifts_matches_without_lowering_them():
+    lexical, blended = make_chatbot(), make_chatbot(semantic_weight=0.5)
+    for question in QUESTIONS:
+        match = lexical.find_best_match(question)
+        if match:
+            assert blended.find_best_match(question)['confidence'] >= match['confidence'], question
+    
+    faqs = [{'question': 'How do I reset my password?', 'answer': 'Use the reset link.', 'keywords': ['password', 'reset']},
+            {'question': 'How do I cancel my subscription?', 'answer': 'From account settings.', 'keywords': ['cancel', 'subscription']}]
+    # Misspelt, so only the word parts shared with the FAQ question's embedding carry it over the threshold
+    assert FAQChatbot(faqs, fuzzy=False).find_best_match('subscriptons cancellation') is None
+    match = FAQChatbot(faqs, fuzzy=False, semantic_weight=0.5).find_best_match('subscriptons cancellation')
+    assert match['answer'] == 'From account settings.' and match['scores']['semantic_similarity'] > 0.5
@@ -0,0 +1,177 @@
+import threading
+
+import pytest
+
+from faq_core import (OVERLAP_WEIGHT, TERM_WEIGHT, FAQIndex, FuzzyIndex, KeywordAutomaton, MappedIndex,
+                      TextPreprocessor)
+
+FAQS = [
+    {'question': 'How do I reset my password?', 'answer': 'Use the reset link.', 'keywords': ['password', 'reset', 'login']},
+    {'question': 'What payment methods do you accept?', 'answer': 'Cards and PayPal.', 'keywords': ['payment', 'card', 'paypal']},
+    {'question': 'How do I cancel my subscription?', 'answer': 'From account settings.', 'keywords': ['cancel', 'subscription']},
+]
+
+
+def make_index(**kwargs):
+    return FAQIndex([dict(faq) for faq in FAQS], **kwargs)
+
+
+def candidate_ids(index, text):
+    return [faq_id for faq_id, *_ in index._find_candidates(index._query_words(text))]
+
+
+def test_preprocessor_drops_stop_words_and_short_tokens():
+    assert TextPreprocessor()("How can I reset the password, ok?") == ['reset', 'password']
+
+
+def test_keyword_automaton_finds_contained_keywords():
+    automaton = KeywordAutomaton()
+    for keyword_id, keyword in enumerate(['pay', 'payment', 'men']):
+        automaton.add(keyword, keyword_id)
+    automaton.build()
+    assert sorted(automaton.search('payments')) == [0, 1, 2]
+    assert automaton.search('refund') == []
+
+
+def test_fuzzy_index_returns_closest_tokens():
+    fuzzy = FuzzyIndex(['password', 'payment', 'passport'])
+    assert fuzzy.lookup('pasword', 1) == [0]
+    fuzzy.add(3, 'refund')
+    assert fuzzy.lookup('refnd', 1) == [3]
+    assert fuzzy.lookup('zzzzzz', 2) == []
+
+
+def test_candidates_and_fuzzy_correction():
+    index = make_index()
+    assert candidate_ids(index, 'reset password') == [0]
+    assert candidate_ids(index, 'pasword') == [0]
+    assert candidate_ids(make_index(fuzzy=False), 'pasword') == []
+
+
+def test_keyword_overlap_matches_substrings_both_ways():
+    index = make_index()
+    # A word inside a keyword comes from the fragment table, a keyword inside a word from the automaton
+    assert index._keyword_matches('ssword') == {0}
+    assert index._keyword_matches('resetting') == {0}
+    assert index._keyword_matches('paypalpayments') == {1}
+    assert index._keyword_matches('refund') == set()
+    assert index._find_candidates(['ssword', 'resetting', 'refund']) == [(0, 0, 0, 2)]
+
+
+def test_term_scores_rank_the_matching_faq_first():
+    index = make_index(scorer='bm25')
+    words = index._query_words('cancel subscription')
+    scores = index._term_scores(words, index._find_candidates(words))
+    assert [faq_id for faq_id, _, _ in scores] == [2]
+    assert scores[0][1] > 0 and scores[0][2] == 1.0
+    assert TERM_WEIGHT + OVERLAP_WEIGHT == pytest.approx(1.0)
+    with pytest.raises(ValueError):
+        make_index(scorer='nope')
+
+
+def test_incremental_edits_reindex_only_the_entry():
+    index = make_index()
+    faq_id = index.add_faq({'question': 'Where is my refund?', 'answer': 'Five days.', 'keywords': ['refund']})
+    assert candidate_ids(index, 'refund') == [faq_id]
+    index.update_faq(faq_id, {'question': 'How long does shipping take?', 'answer': 'A week.', 'keywords': ['shipping']})
+    assert candidate_ids(index, 'refund') == []
+    assert candidate_ids(index, 'shipping') == [faq_id]
+    with pytest.raises(ValueError):
+        index.add_faq({'question': 'No answer'})
+
+
+def test_compiled_index_round_trip(tmp_path):
+    path = str(tmp_path / 'faqs.idx')
+    make_index().write_index(path)
+    mapped = FAQIndex([], index_path=path)
+    assert isinstance(mapped.vocabulary, type(MappedIndex(path).vocabulary))
+    assert mapped.faq_database[1]['answer'] == 'Cards and PayPal.'
+    assert candidate_ids(mapped, 'paypal payment') == [1]
+    assert candidate_ids(mapped, 'pasword') == [0]
+    # The fuzzy keys are served from the mapping, not rebuilt at load
+    assert mapped._fuzzy_index.keys is mapped.faq_database.index.fuzzy_keys
+    assert list(mapped._fuzzy_index.keys) == list(FuzzyIndex(mapped.vocabulary).keys)
+    # So are the term-weighted scorers' corpus statistics
+    mapped = FAQIndex([], index_path=path, scorer='bm25')
+    assert mapped.scorer.statistics is mapped.faq_database.index.statistics
+    words = mapped._query_words('cancel subscription account')
+    built = make_index(scorer='bm25')
+    assert mapped._term_scores(words, mapped._find_candidates(words)) == built._term_scores(words, built._find_candidates(words))
+    with pytest.raises(ValueError):
+        mapped.add_faq(FAQS[0])
+
+
+def test_both_entry_points_share_the_core():
+    import app
+    import faq_chatbot
+    assert issubclass(app.FAQChatbot, FAQIndex) and issubclass(faq_chatbot.FAQChatbot, FAQIndex)
+    question = 'How can I reset my password?'
+    cli = faq_chatbot.FAQChatbot([dict(faq) for faq in FAQS], scorer='bm25').find_best_match(question)
+    web = app.FAQChatbot([dict(faq) for faq in FAQS], scorer='bm25').find_best_match(question)
+    assert cli['question'] == web['question'] and cli['confidence'] == web['confidence']
+
+
+def test_fuzzy_index_is_built_with_the_index_and_follows_edits():
+    index = make_index()
+    assert index._fuzzy_index is not None and make_index(fuzzy=False)._fuzzy_index is None
+    threads = [threading.Thread(target=index.add_faq, args=({'question': f'Where is warehouse{n}?', 'answer': 'Here.',
+                                                                'keywords': []},)) for n in range(20)]
+    for thread in threads:
+        thread.start()
+    misspelled = [index._query_words('warehose7') for _ in range(50)]
+    for thread in threads:
+        thread.join()
+    assert index._query_words('warehuse15') == ['warehouse15']
+    assert all(words in (['warehose7'], ['warehouse7']) for words in misspelled)
+    
+    # Only a question with a word to correct waits for an edit holding the index lock
+    acquired, released = threading.Event(), threading.Event()
+    
+    def hold_lock():
+        with index._index_lock:
+            acquired.set()
+            released.wait(5)
+    
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    try:
+        acquired.wait(5)
+        assert index._query_words('reset warehouse15') == ['reset', 'warehouse15']
+        assert holder.is_alive()
+    finally:
+        released.set()
+        holder.join()
+
+
+def test_removing_an_entry_keeps_every_other_id(tmp_path):
+    index = make_index(scorer='bm25')
+    assert index.remove_faq(0)['question'] == FAQS[0]['question']
+    assert index.faq_count == 2 and index.faq_database[0] is None
+    assert candidate_ids(index, 'reset password') == []
+    assert candidate_ids(index, 'cancel subscription') == [2]
+    index.update_faq(2, {'question': 'How do I pause my subscription?', 'answer': 'Pause it.', 'keywords': ['pause']})
+    assert index.add_faq(FAQS[0]) == 3
+    assert candidate_ids(index, 'pause') == [2]
+    for faq_id in (0, 7):
+        with pytest.raises(IndexError):
+            index.remove_faq(faq_id)
+    with pytest.raises(IndexError):
+        index.update_faq(0, FAQS[0])
+    
+    # Compiling the index drops the tombstone and renumbers the live entries
+    path = str(tmp_path / 'faqs.idx')
+    index.write_index(path)
+    mapped = FAQIndex([], index_path=path)
+    assert [faq['question'] for faq in mapped.faq_database] == [FAQS[1]['question'], 'How do I pause my subscription?',
+                                                                FAQS[0]['question']]
+    assert candidate_ids(mapped, 'pause') == [1] and candidate_ids(mapped, 'reset password') == [2]
+
+
+def test_removed_entries_never_match_in_either_entry_point():
+    import app
+    import faq_chatbot
+    for chatbot in (app.FAQChatbot([dict(faq) for faq in FAQS]),
+                    faq_chatbot.FAQChatbot([dict(faq) for faq in FAQS], semantic_weight=0.5)):
+        chatbot.remove_faq(0)
+        assert chatbot.find_best_match('How do I reset my password?') is None
+        assert chatbot.find_best_match('How do I cancel my subscription?')['answer'] == FAQS[2]['answer']